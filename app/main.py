@@ -1,35 +1,121 @@
 import os
+import asyncio
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from datetime import datetime
 import json
 
-from app.routers import dashboard, webhook, viewer
+from app.routers import dashboard, webhook, viewer, admin, health, replay, metrics as metrics_router
+from app.services.broker import create_broker
+from app.services.connections import manager
+from app.services.db import connect_databases, close_databases
+from app.services.logs import configure_logging
+from app.services import metrics
+from app.services.timing import slow_log
+from app.services.loop_monitor import loop_monitor
+from app.services.admission import admission
+from app.services.versions import change_versions
+from app.services.compression import CompressionMiddleware, compression_settings
+from app.services.assets import StaticAssets, build_assets, STATIC_DIR, STATIC_BUILD_DIR
+from app.services.templates import create_templates, compile_templates
+from app.services.warmup import warm_up
+from app.services.usernames import username_index
+from app.services.replay import replay_manager
+from app.services.upstream import upstream_client
 
 # Load environment variables
 load_dotenv()
 
+# Queue-based logging, so request handlers never wait on stdout
+configure_logging()
+
 # Database setup
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Connect to the MongoDB client when the application starts
-    app.mongodb_client = AsyncIOMotorClient(os.getenv("MONGO_URI", "mongodb://mongodb:27017"))
-    app.mongodb = app.mongodb_client[os.getenv("MONGO_DB", "webhook_db")]
+    # Build the fingerprinted static assets and compile the templates once per
+    # worker start rather than on import (or on the first request of each page)
+    static_assets.set_manifest(build_assets())
+    compile_templates(templates)
+    
+    # Connect to the storage backend when the application starts
+    connect_databases(app)
+    
+    # Create indexes, unless the production server already did it once for all workers
+    if os.getenv("SKIP_INDEX_CREATION") != "1":
+        await app.storage.ensure_indexes()
+    
+    # Start the realtime broker so events published on any worker reach local websockets.
+    # VIEWER_POLL_INTERVAL enables polling for captures that bypass the broker
+    # (e.g. several workers sharing the in-process broker).
+    manager.configure(
+        app.storage,
+        poll_interval=float(os.getenv("VIEWER_POLL_INTERVAL", 0)),
+        max_queue=int(os.getenv("WS_QUEUE_SIZE", 100)),
+        overflow_policy=os.getenv("WS_OVERFLOW_POLICY", "coalesce"),
+        flush_interval=int(os.getenv("LIVE_FLUSH_INTERVAL_MS", 100)) / 1000,
+        batch_max=int(os.getenv("LIVE_BATCH_MAX", 500)),
+        replay_size=int(os.getenv("REPLAY_LOG_SIZE", 200)),
+        replay_users=int(os.getenv("REPLAY_LOG_USERS", 1000)),
+        inbox_size=int(os.getenv("LIVE_INBOX_SIZE", 1000))
+    )
+    app.state.broker = create_broker(app.mongodb)
+    
+    def handle_event(channel, message):
+        # Slow-request events also feed this worker's slow-request log,
+        # changes bump the user's version (viewer ETags) and new users
+        # go to the username index
+        slow_log.record_event(channel, message)
+        change_versions.record_event(channel, message)
+        username_index.record_event(channel, message)
+        manager.broadcast(channel, message)
+    
+    # ETags rely on every change reaching this worker through the broker;
+    # polling means some captures do not (ETAGS=0 disables them too)
+    change_versions.configure(
+        enabled=os.getenv("ETAGS", "1") != "0" and float(os.getenv("VIEWER_POLL_INTERVAL", 0)) <= 0,
+        dropped=lambda: app.state.broker.dropped
+    )
     
-    # Create indexes
-    await app.mongodb["users"].create_index("username", unique=True)
-    await app.mongodb["webhook_requests"].create_index("username")
-    await app.mongodb["webhook_requests"].create_index("request_time")
+    await app.state.broker.start(handle_event)
+    
+    # Shed webhook requests while the broker outbox is backed up
+    admission.set_backlog_function(app.state.broker.queue_depth)
+    
+    # Gauges are read when /metrics is scraped
+    metrics.ACTIVE_SOCKETS.set_function(manager.connection_counts)
+    metrics.QUEUE_DEPTH.set_function(
+        lambda: {**manager.queue_depths(), ("broker_outbox",): app.state.broker.queue_depth()}
+    )
+    metrics.BROKER_DROPPED.set_function(lambda: app.state.broker.dropped)
+    metrics.WEBHOOK_IN_FLIGHT.set_function(lambda: admission.in_flight)
+    metrics.INGEST_BACKLOG.set_function(admission.backlog)
+    
+    # Measure event loop lag and log the stack of callbacks blocking the loop
+    # (LOOP_MONITOR_INTERVAL_MS=0 disables, BLOCKING_THRESHOLD_MS=0 keeps only the lag metric)
+    monitor_interval = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100)) / 1000
+    if monitor_interval > 0:
+        loop_monitor.start(
+            interval=monitor_interval,
+            threshold=int(os.getenv("BLOCKING_THRESHOLD_MS", 250)) / 1000
+        )
+    
+    # Open database connections and load hot user configs in the background;
+    # /health/ready answers 503 until this is done
+    app.state.ready = False
+    warmup_task = asyncio.create_task(warm_up(app))
     
     yield
     
-    # Close MongoDB client when the application stops
-    app.mongodb_client.close()
+    warmup_task.cancel()
+    await replay_manager.stop()
+    await upstream_client.close()
+    await loop_monitor.stop()
+    # Stop the broker and close MongoDB client when the application stops
+    await app.state.broker.stop()
+    await manager.close()
+    await close_databases(app)
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -39,14 +125,19 @@ app = FastAPI(
     version="2.0.0"
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+# Compress viewer, API and export responses (never the webhook endpoints)
+app.add_middleware(CompressionMiddleware, **compression_settings())
+
+# Mount static files: fingerprinted, precompressed copies are built at startup (see lifespan)
+static_assets = StaticAssets(directory=STATIC_DIR, build_dir=STATIC_BUILD_DIR)
+app.mount("/static", static_assets, name="static")
 
 # Setup Jinja2 templates
-templates = Jinja2Templates(directory="app/templates")
+templates = create_templates("app/templates")
 
 # Add custom template globals and filters
 templates.env.globals["current_year"] = datetime.now().year
+templates.env.globals["static_url"] = static_assets.url
 
 # Add custom template filters
 def tojson_filter(value, indent=None):
@@ -70,13 +161,17 @@ app.add_middleware(
 app.include_router(dashboard.router)
 app.include_router(webhook.router)
 app.include_router(viewer.router)
+app.include_router(metrics_router.router)
+app.include_router(health.router)
+app.include_router(admin.router)
+app.include_router(replay.router)
 
 # Redirect root to dashboard
 @app.get("/")
 async def redirect_to_dashboard():
     return {"status": "ok", "message": "Webhook Mock API is running"}
 
-# Entry point to run with uvicorn
+# Development entry point with auto-reload; use `python -m app.server` in production
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -8,6 +8,12 @@ class User(BaseModel):
     default_response: Dict[str, Any] = Field(default_factory=lambda: {"status": "success", "message": "Default response"})
     response_time_min: int = 0  # milliseconds
     response_time_max: int = 1000  # milliseconds
+    rate_limit: float = 0  # requests per second per worker, 0 for no limit
+    rate_burst: int = 0  # requests allowed at once above the rate, 0 for one second worth
+    max_concurrency: int = 0  # requests in progress per worker, 0 for no limit
+    upstream_url: Optional[str] = None  # proxy mode: forward webhooks here instead of answering default_response
+    upstream_timeout: float = 10  # seconds allowed for the upstream's response
+    behaviors: List[Dict[str, Any]] = Field(default_factory=list)  # behaviour scripts, see services/behaviors.py
     
 class WebhookRequest(BaseModel):
     id: str
@@ -26,12 +32,38 @@ class UserCreate(BaseModel):
     default_response: Dict[str, Any] = {"status": "success", "message": "Default response"}
     response_time_min: int = 0
     response_time_max: int = 1000
+    rate_limit: float = 0
+    rate_burst: int = 0
+    max_concurrency: int = 0
+    upstream_url: Optional[str] = None
+    upstream_timeout: float = 10
+    behaviors: List[Dict[str, Any]] = []
     
 class UserUpdate(BaseModel):
     default_response: Optional[Dict[str, Any]] = None
     response_time_min: Optional[int] = None
     response_time_max: Optional[int] = None
+    rate_limit: Optional[float] = None
+    rate_burst: Optional[int] = None
+    max_concurrency: Optional[int] = None
+    upstream_url: Optional[str] = None  # "" turns proxy mode off
+    upstream_timeout: Optional[float] = None
+    behaviors: Optional[List[Dict[str, Any]]] = None  # [] removes every script
 
 class WebhookResponse(BaseModel):
     status_code: int = 200
-    content: Dict[str, Any] = Field(default_factory=lambda: {"status": "success", "message": "Default response"})
\ No newline at end of file
+    content: Dict[str, Any] = Field(default_factory=lambda: {"status": "success", "message": "Default response"})
+
+class ReplayCreate(BaseModel):
+    target_url: str
+    request_ids: Optional[List[str]] = None  # replay only these captures
+    search: Optional[str] = None  # pattern on method, path and id, as in the viewer search
+    filters: Optional[Dict[str, Any]] = None  # live-stream filter spec
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    limit: int = 10000
+    concurrency: int = 10
+    rate: float = 0  # requests per second, 0 for no limit
+    time_scale: float = 0  # original gaps divided by this factor, 0 to ignore them
+    timeout: float = 10  # seconds per request
+    record: bool = True  # append each response to its capture
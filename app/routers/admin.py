@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Dict, Any
+import logging
+
+from app.services.auth import get_current_username
+from app.services.profiler import profiler, MODE_SAMPLE
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Profiling applies to the worker serving the request. With several workers,
+# use /admin/profile/run (one request) or check that "pid" matches across calls.
+
+@router.post("/admin/profile/start", response_model=Dict[str, Any])
+async def start_profile(
+    request: Request,
+    duration: float = 30,
+    mode: str = MODE_SAMPLE,
+    interval_ms: float = 10,
+    admin: str = Depends(get_current_username)
+):
+    """
+    Start profiling this worker; it stops by itself after `duration` seconds
+    """
+    try:
+        profiler.start(duration, mode, interval_ms / 1000)
+    except RuntimeError as e:
+        return JSONResponse(content={"error": str(e), **profiler.status()}, status_code=409)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    logger.info(f"Profiling started by {admin}: mode={mode}, duration={duration}s")
+    return profiler.status()
+
+@router.post("/admin/profile/stop", response_model=Dict[str, Any])
+async def stop_profile(request: Request, admin: str = Depends(get_current_username)):
+    """
+    Stop the current profiling run early
+    """
+    profiler.stop()
+    return profiler.status()
+
+@router.get("/admin/profile", response_model=Dict[str, Any])
+async def get_profile(request: Request, limit: int = 30, admin: str = Depends(get_current_username)):
+    """
+    Status of the last run and its top functions by cumulative time
+    """
+    return {**profiler.status(), "top": profiler.top(max(1, min(limit, 500)))}
+
+@router.get("/admin/profile/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(request: Request, admin: str = Depends(get_current_username)):
+    """
+    Collapsed stacks of the last sampled run (flamegraph.pl, speedscope, inferno)
+    """
+    try:
+        collapsed = profiler.collapsed()
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=409)
+
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profiler.status()["pid"]}.collapsed"'}
+    )
+
+@router.post("/admin/profile/run")
+async def run_profile(
+    request: Request,
+    duration: float = 10,
+    mode: str = MODE_SAMPLE,
+    interval_ms: float = 10,
+    output: str = "top",
+    limit: int = 30,
+    admin: str = Depends(get_current_username)
+):
+    """
+    Profile for `duration` seconds and return the result in the same response
+    (output "top" for JSON, "collapsed" for collapsed stacks)
+    """
+    if output not in ("top", "collapsed"):
+        return JSONResponse(content={"error": "Output must be 'top' or 'collapsed'"}, status_code=400)
+    if output == "collapsed" and mode != MODE_SAMPLE:
+        return JSONResponse(content={"error": "Collapsed stacks are only available in sample mode"}, status_code=400)
+
+    try:
+        profiler.start(duration, mode, interval_ms / 1000)
+    except RuntimeError as e:
+        return JSONResponse(content={"error": str(e), **profiler.status()}, status_code=409)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    logger.info(f"Profiling run by {admin}: mode={mode}, duration={duration}s")
+    try:
+        await profiler.wait()
+    finally:
+        # The client went away: do not leave the profiler running
+        profiler.stop()
+
+    if output == "collapsed":
+        return await get_profile_collapsed(request, admin)
+    return await get_profile(request, limit, admin)
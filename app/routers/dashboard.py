@@ -1,21 +1,31 @@
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.storage import Storage
 from typing import Dict, Any, Optional
 import json
+import logging
 
 from app.models import UserCreate, UserUpdate
 from app.services.webhook import (
     create_user, update_user, check_username_available
 )
+from app.services.db import get_db
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def get_db(request: Request) -> AsyncIOMotorDatabase:
-    return request.app.mongodb
+def publish_user_created(request: Request, username: str) -> None:
+    """
+    Let every worker add the new username to its username index
+    """
+    try:
+        request.app.state.broker.publish(username, {"event": "user_created"})
+    except Exception as publish_error:
+        logger.error(f"Error publishing user creation: {publish_error}")
 
 @router.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+async def dashboard(request: Request, db: Storage = Depends(get_db)):
     """
     Dashboard page for creating and configuring webhooks
     """
@@ -32,7 +42,7 @@ async def dashboard(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)
 async def create_user_api(
     request: Request,
     user: UserCreate,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Create a new user via API
@@ -44,11 +54,15 @@ async def create_user_api(
             username=user.username,
             default_response=user.default_response,
             response_time_min=user.response_time_min,
-            response_time_max=user.response_time_max
+            response_time_max=user.response_time_max,
+            rate_limit=user.rate_limit,
+            rate_burst=user.rate_burst,
+            max_concurrency=user.max_concurrency,
+            upstream_url=user.upstream_url,
+            upstream_timeout=user.upstream_timeout,
+            behaviors=user.behaviors
         )
-        
-        # Convert ObjectId to string for JSON serialization
-        user_data["_id"] = str(user_data["_id"])
+        publish_user_created(request, user.username)
         
         return user_data
     
@@ -63,7 +77,7 @@ async def update_user_api(
     username: str,
     user: UserUpdate,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Update user configuration via API
@@ -75,11 +89,20 @@ async def update_user_api(
             username=username,
             default_response=user.default_response,
             response_time_min=user.response_time_min,
-            response_time_max=user.response_time_max
+            response_time_max=user.response_time_max,
+            rate_limit=user.rate_limit,
+            rate_burst=user.rate_burst,
+            max_concurrency=user.max_concurrency,
+            upstream_url=user.upstream_url,
+            upstream_timeout=user.upstream_timeout,
+            behaviors=user.behaviors
         )
         
-        # Convert ObjectId to string for JSON serialization
-        updated_user["_id"] = str(updated_user["_id"])
+        # Let every worker know the config changed (viewer ETags)
+        try:
+            request.app.state.broker.publish(username, {"event": "config_updated"})
+        except Exception as publish_error:
+            logger.error(f"Error publishing config update: {publish_error}")
         
         return updated_user
     
@@ -93,7 +116,7 @@ async def update_user_api(
 async def check_username(
     username: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Check if a username is available
@@ -114,7 +137,7 @@ async def create_webhook_form(
     default_response: str = Form("{}"),
     response_time_min: int = Form(0),
     response_time_max: int = Form(1000),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Create a new webhook from form submission
@@ -134,6 +157,7 @@ async def create_webhook_form(
             response_time_min=response_time_min,
             response_time_max=response_time_max
         )
+        publish_user_created(request, username)
         
         # Redirect to viewer
         return RedirectResponse(url=f"/view/@{username}", status_code=303)
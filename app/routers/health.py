@@ -0,0 +1,21 @@
+import os
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+@router.get("/health/live", include_in_schema=False)
+async def liveness(request: Request):
+    """
+    The worker's event loop is running
+    """
+    return {"status": "alive", "pid": os.getpid()}
+
+@router.get("/health/ready", include_in_schema=False)
+async def readiness(request: Request):
+    """
+    The worker finished warming up (database connections, hot user configs)
+    """
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(content={"status": "warming_up", "pid": os.getpid()}, status_code=503)
+    return {"status": "ready", "pid": os.getpid()}
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.services.metrics import REGISTRY, CONTENT_TYPE
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """
+    Prometheus metrics for this worker
+
+    Each worker keeps its own metrics; scrape every worker (or add up the
+    series) when running several.
+    """
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from typing import Dict, Any, List
+import logging
+
+from app.models import ReplayCreate
+from app.services.auth import get_current_username
+from app.services.db import get_db
+from app.services.replay import replay_manager
+from app.services.storage import Storage
+from app.services.webhook import get_user_config
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Replay jobs run in the worker that started them. With several workers,
+# check that "pid" matches when polling a job's status.
+
+@router.post("/admin/replay/@{username}", response_model=Dict[str, Any])
+async def start_replay(
+    request: Request,
+    username: str,
+    replay: ReplayCreate,
+    db: Storage = Depends(get_db),
+    admin: str = Depends(get_current_username)
+):
+    """
+    Replay a user's captured requests against target_url
+    """
+    try:
+        await get_user_config(db, username)
+        job = await replay_manager.start(
+            db, username, publish=request.app.state.broker.publish, **replay.model_dump()
+        )
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    logger.info(f"Replay {job.id} started by {admin}")
+    return JSONResponse(content=job.status(), status_code=202)
+
+@router.get("/admin/replay", response_model=List[Dict[str, Any]])
+async def list_replays(request: Request, admin: str = Depends(get_current_username)):
+    """
+    Replay jobs of this worker, newest first
+    """
+    return [job.status() for job in reversed(replay_manager.jobs())]
+
+@router.get("/admin/replay/{job_id}", response_model=Dict[str, Any])
+async def get_replay(request: Request, job_id: str, admin: str = Depends(get_current_username)):
+    """
+    Progress of one replay job
+    """
+    job = replay_manager.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Replay job not found on this worker"}, status_code=404)
+    return job.status()
+
+@router.post("/admin/replay/{job_id}/cancel", response_model=Dict[str, Any])
+async def cancel_replay(request: Request, job_id: str, admin: str = Depends(get_current_username)):
+    """
+    Stop a running replay job
+    """
+    job = await replay_manager.cancel(job_id)
+    if job is None:
+        return JSONResponse(content={"error": "Replay job not found on this worker"}, status_code=404)
+    return job.status()
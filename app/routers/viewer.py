@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Request, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Request, Response, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.storage import Storage
 from typing import Dict, Any, List, Optional
 from io import StringIO
 import csv
@@ -12,24 +12,78 @@ import asyncio
 
 from app.services.webhook import (
     get_webhook_requests, get_user_config, clear_webhook_requests,
-    export_webhook_requests_csv, delete_webhook_request, get_webhook_requests_count
+    export_webhook_requests_csv, delete_webhook_request, get_webhook_requests_count,
+    serialize_webhook_request, get_webhook_request_changes
 )
-from app.services.db import get_db, get_db_websocket
+from app.services.db import get_db, get_ingest_db, get_read_db, get_tagged_read_db, get_export_db, get_db_websocket
+from app.services.auth import get_current_username
+from app.services.imports import import_webhook_requests
+from app.services.connections import manager
+from app.services.filters import RequestFilter, compile_filter, filter_spec_from_query
+from app.services import metrics
+from app.services.timing import StageTimings, build_slow_request_event, is_slow, slow_log, SLOW_REQUEST_MS
+from app.services.versions import change_versions, etag_matches
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Dictionary to store active WebSocket connections
-active_connections: Dict[str, List[WebSocket]] = {}
+# Seconds without traffic before the viewer websocket or SSE stream sends a keepalive
+KEEPALIVE_INTERVAL = 30
+
+# Reconnect delay suggested to SSE clients
+SSE_RETRY_MS = 5000
+
+# Export bodies are streamed (and compressed) in chunks of this many characters
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def iter_chunks(content: str, size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield a large string in slices, so the response is sent and compressed as it goes
+    """
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+def finish_timing(request: Request, response: Response, username: str, timings: StageTimings) -> None:
+    """
+    Add the Server-Timing header and log the call if it was slow
+    """
+    total = timings.total()
+    response.headers["Server-Timing"] = timings.header(total)
+    
+    if is_slow(timings.overhead(total)):
+        try:
+            request.app.state.broker.publish(username, build_slow_request_event(
+                username, "api", request.method, request.url.path, timings, total
+            ))
+        except Exception as publish_error:
+            logger.error(f"Error publishing slow request event: {publish_error}")
+
+def check_not_modified(request: Request, username: str):
+    """
+    Get the user's current ETag and, if the client already has it, the 304 response to send
+    
+    Returns:
+        (etag, response): response is None when the request must be served
+    """
+    etag = change_versions.etag(username)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return etag, Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return etag, None
+
+def set_etag(response: Response, etag: Optional[str]) -> None:
+    """
+    Add the ETag to a response; no-cache makes browsers revalidate on every poll
+    """
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
 
 @router.get("/view/@{username}", response_class=HTMLResponse)
 async def view_requests(
     username: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_tagged_read_db)
 ):
     """
     View webhook requests for a specific username
@@ -51,18 +105,23 @@ async def view_requests(
                 status_code=400
             )
         
+        # Nothing changed since the client's copy: answer without a query
+        etag, not_modified = check_not_modified(request, username)
+        if not_modified:
+            return not_modified
+        
         # Get user information
         user = await get_user_config(db, username)
         
         # Get the count of requests for this user
-        request_count = await db.webhook_requests.count_documents({"username": username})
+        request_count = await get_webhook_requests_count(db, username)
         logger.info(f"Total requests for {username}: {request_count}")
         
         # Get template
         templates = request.app.state.templates
         
         # Render template with request count and user information
-        return templates.TemplateResponse(
+        page = templates.TemplateResponse(
             "viewer.html",
             {
                 "request": request,
@@ -72,6 +131,8 @@ async def view_requests(
                 "domain": request.headers.get("host", "webhook-api.autobot.site")
             }
         )
+        set_etag(page, etag)
+        return page
     
     except HTTPException as e:
         # Get template
@@ -113,9 +174,10 @@ async def view_requests(
 async def get_requests_api(
     username: str,
     request: Request,
+    response: Response,
     limit: int = 10,
     skip: int = 0,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_tagged_read_db)
 ):
     """
     Get webhook requests via API with enhanced error handling
@@ -128,45 +190,32 @@ async def get_requests_api(
         if skip < 0:
             skip = 0  # Default to 0 if negative
         
+        # Nothing changed since the client's copy: answer without a query
+        etag, not_modified = check_not_modified(request, username)
+        if not_modified:
+            return not_modified
+        
+        timings = StageTimings()
+        
         # Get user to ensure they exist
+        started = metrics.now()
         user = await get_user_config(db, username)
+        timings.record("get_user_config", started)
         logger.info(f"Fetching requests for user: {username}, limit: {limit}, skip: {skip}")
         
         # Get requests
+        started = metrics.now()
         requests = await get_webhook_requests(db, username, limit, skip)
+        timings.record("query", started)
         logger.info(f"Found {len(requests)} requests for {username}")
         
         # Convert to JSON-serializable format
-        serialized_requests = []
-        for req in requests:
-            # Create a copy to avoid modifying original
-            serialized_req = {}
-            
-            # Convert specific fields
-            serialized_req['id'] = req.get('id', '')
-            serialized_req['username'] = req.get('username', '')
-            serialized_req['method'] = req.get('method', '')
-            serialized_req['path'] = req.get('path', '')
-            
-            # Handle datetime conversion
-            if req.get('request_time'):
-                serialized_req['request_time'] = req['request_time'].isoformat()
-            else:
-                serialized_req['request_time'] = datetime.utcnow().isoformat()
-            
-            # Handle body and response
-            serialized_req['body'] = req.get('body', None)
-            serialized_req['response'] = req.get('response', None)
-            
-            # Add response time
-            serialized_req['response_time'] = req.get('response_time', 0)
-            
-            # Add headers and query params
-            serialized_req['headers'] = req.get('headers', {})
-            serialized_req['query_params'] = req.get('query_params', {})
-            
-            serialized_requests.append(serialized_req)
+        started = metrics.now()
+        serialized_requests = [serialize_webhook_request(req) for req in requests]
+        timings.record("serialize", started)
         
+        set_etag(response, etag)
+        finish_timing(request, response, username, timings)
         return serialized_requests
     
     except HTTPException as e:
@@ -189,18 +238,32 @@ async def get_requests_api(
 async def get_request_count_api(
     username: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    response: Response,
+    db: Storage = Depends(get_tagged_read_db)
 ):
     """
     Get the total number of webhook requests for a user
     """
     try:
+        # Nothing changed since the client's copy: answer without a query
+        etag, not_modified = check_not_modified(request, username)
+        if not_modified:
+            return not_modified
+        
+        timings = StageTimings()
+        
         # Get user to ensure they exist
+        started = metrics.now()
         await get_user_config(db, username)
+        timings.record("get_user_config", started)
         
         # Get count
+        started = metrics.now()
         count = await get_webhook_requests_count(db, username)
+        timings.record("query", started)
         
+        set_etag(response, etag)
+        finish_timing(request, response, username, timings)
         return {"count": count}
     
     except HTTPException as e:
@@ -211,11 +274,88 @@ async def get_request_count_api(
         logger.error(traceback.format_exc())
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@router.get("/api/requests/@{username}/changes", response_model=Dict[str, Any])
+async def get_request_changes_api(
+    username: str,
+    request: Request,
+    response: Response,
+    since: int = 0,
+    limit: int = 500,
+    db: Storage = Depends(get_read_db)
+):
+    """
+    Get requests and deletions after a sequence number (delta sync)
+    Clients call again with the returned cursor while has_more is true
+    """
+    try:
+        # Validate limit and since parameters
+        if limit < 1 or limit > 1000:
+            limit = 500
+        
+        if since < 0:
+            since = 0
+        
+        timings = StageTimings()
+        
+        # Get user to ensure they exist
+        started = metrics.now()
+        await get_user_config(db, username)
+        timings.record("get_user_config", started)
+        
+        started = metrics.now()
+        changes = await get_webhook_request_changes(db, username, since, limit)
+        timings.record("query", started)
+        
+        started = metrics.now()
+        changes["requests"] = [serialize_webhook_request(req) for req in changes["requests"]]
+        timings.record("serialize", started)
+        
+        finish_timing(request, response, username, timings)
+        return changes
+    
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    
+    except Exception as e:
+        logger.error(f"Error getting request changes: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@router.get("/api/requests/@{username}/slow", response_model=Dict[str, Any])
+async def get_slow_requests_api(
+    username: str,
+    request: Request,
+    limit: int = 100,
+    db: Storage = Depends(get_read_db)
+):
+    """
+    Get the user's recent slow requests (webhooks and viewer API calls), newest first
+    """
+    try:
+        if limit < 1 or limit > 500:
+            limit = 100
+        
+        # Get user to ensure they exist
+        await get_user_config(db, username)
+        
+        return {
+            "threshold_ms": SLOW_REQUEST_MS,
+            "requests": slow_log.for_user(username, limit)
+        }
+    
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    
+    except Exception as e:
+        logger.error(f"Error getting slow requests: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
 @router.delete("/api/requests/@{username}", response_model=Dict[str, int])
 async def clear_requests_api(
     username: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Clear all webhook requests for a user via API
@@ -228,6 +368,8 @@ async def clear_requests_api(
         deleted_count = await clear_webhook_requests(db, username)
         logger.info(f"Cleared {deleted_count} requests for user {username}")
         
+        publish_event(request, username, {"event": "cleared"})
+        
         return {"deleted_count": deleted_count}
     
     except HTTPException as e:
@@ -243,7 +385,7 @@ async def delete_request_api(
     username: str,
     request_id: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Delete a specific webhook request by ID
@@ -256,6 +398,7 @@ async def delete_request_api(
         result = await delete_webhook_request(db, username, request_id)
         
         if result:
+            publish_event(request, username, {"event": "deleted", "request_ids": [request_id]})
             return {"success": True, "message": "Request deleted successfully"}
         else:
             return JSONResponse(
@@ -276,7 +419,7 @@ async def export_requests_api(
     username: str,
     request: Request,
     format: str = "csv",
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_export_db)
 ):
     """
     Export webhook requests to CSV or JSON via API
@@ -294,12 +437,12 @@ async def export_requests_api(
                 if 'request_time' in req:
                     req['request_time'] = req['request_time'].isoformat()
             
-            # Create JSON content
-            json_content = json.dumps(requests, indent=2)
+            # Create JSON content (off the event loop, it can take a while)
+            json_content = await asyncio.to_thread(json.dumps, requests, indent=2)
             
             # Return streaming response
             return StreamingResponse(
-                iter([json_content]),
+                iter_chunks(json_content),
                 media_type="application/json",
                 headers={
                     "Content-Disposition": f"attachment; filename={username}_webhook_requests.json"
@@ -311,7 +454,7 @@ async def export_requests_api(
             
             # Return streaming response
             return StreamingResponse(
-                iter([csv_content]),
+                iter_chunks(csv_content),
                 media_type="text/csv",
                 headers={
                     "Content-Disposition": f"attachment; filename={username}_webhook_requests.csv"
@@ -326,17 +469,154 @@ async def export_requests_api(
         logger.error(traceback.format_exc())
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@router.post("/api/requests/@{username}/import", response_model=Dict[str, Any])
+async def import_requests_api(
+    username: str,
+    request: Request,
+    max_requests: Optional[int] = None,
+    db: Storage = Depends(get_ingest_db),
+    admin: str = Depends(get_current_username)
+):
+    """
+    Bulk import historical requests from an NDJSON body (optionally gzip)
+    """
+    try:
+        # Get user to confirm existence before reading the body
+        await get_user_config(db, username)
+        
+        gzipped = True if "gzip" in request.headers.get("content-encoding", "").lower() else None
+        report = await import_webhook_requests(db, username, request.stream(), gzipped, max_requests)
+        
+        if report["imported"]:
+            # One event for the whole import; viewers fetch the changes
+            publish_event(request, username, {"event": "new_requests", "count": report["imported"]})
+        
+        return JSONResponse(content=report, status_code=400 if "error" in report else 200)
+    
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    
+    except Exception as e:
+        logger.error(f"Error importing requests: {e}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@router.get("/sse/viewer/@{username}")
+async def viewer_event_stream(
+    username: str,
+    request: Request,
+    last_event_id: Optional[int] = None,
+    db: Storage = Depends(get_db)
+):
+    """
+    Server-Sent Events stream with the same events as the viewer websocket
+    Each event id is the user's sequence number, so reconnecting with
+    Last-Event-ID (header, or last_event_id query parameter) replays missed events.
+    Optional method, path, header and body query parameters filter the requests sent.
+    """
+    try:
+        # Check if user exists
+        await get_user_config(db, username)
+        
+        event_filter = parse_stream_filter(request.query_params)
+    except HTTPException as e:
+        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    
+    # Browsers send the header on automatic reconnects
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    
+    initial = None
+    if last_event_id is None:
+        initial = {
+            "event": "connected",
+            "username": username,
+            "request_count": await get_webhook_requests_count(db, username)
+        }
+    
+    subscriber = await manager.connect(
+        username, last_seq=last_event_id, event_filter=event_filter, endpoint="viewer_sse"
+    )
+    logger.info(f"Viewer SSE stream connected for username: {username}")
+    
+    async def event_stream():
+        try:
+            # Ask the browser to wait a few seconds before reconnecting
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            
+            if initial:
+                yield format_sse(initial, json.dumps(initial))
+            
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.next_frame(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Comment line keeps idle connections open through proxies
+                    yield ": keepalive\n\n"
+                    continue
+                
+                if frame is None:
+                    break
+                yield format_sse(*frame)
+        finally:
+            manager.disconnect(username, subscriber)
+            logger.info(f"Viewer SSE stream disconnected for {username}")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def publish_event(request: Request, username: str, message: Dict[str, Any]) -> None:
+    """
+    Notify the user's live viewers, ignoring broker errors
+    """
+    try:
+        request.app.state.broker.publish(username, message)
+    except Exception as e:
+        logger.error(f"Error publishing viewer event: {e}")
+
+def parse_stream_filter(query_params) -> Optional[RequestFilter]:
+    """
+    Compile the subscription filter given as query parameters
+    
+    Raises:
+        ValueError: If a filter parameter is malformed
+    """
+    return compile_filter(filter_spec_from_query(
+        query_params.get("method"),
+        query_params.get("path"),
+        query_params.getlist("header"),
+        query_params.getlist("body")
+    ))
+
+def format_sse(message: Dict[str, Any], text: str) -> str:
+    """
+    Format a live event as an SSE message, using its sequence number as the id
+    """
+    seq = message.get("seq")
+    if seq is not None:
+        return f"id: {seq}\ndata: {text}\n\n"
+    return f"data: {text}\n\n"
+
 @router.websocket("/ws/viewer/@{username}")
 async def viewer_websocket(
     websocket: WebSocket, 
     username: str, 
-    db: AsyncIOMotorDatabase = Depends(get_db_websocket)
+    last_event_id: Optional[int] = None,
+    db: Storage = Depends(get_db_websocket)
 ):
     """
     WebSocket endpoint for real-time updates of the viewer
-    Uses polling mechanism instead of change streams
+    New requests are pushed through the broker by the ingest path;
+    last_event_id resumes from a sequence number like the SSE stream, and
+    filters come from the query string or a {"type": "subscribe"} message
     """
-    last_request_id = None
+    subscriber = None
     
     try:
         await websocket.accept()
@@ -344,55 +624,65 @@ async def viewer_websocket(
         # Check if user exists
         user = await get_user_config(db, username)
         
-        # Register connection
-        if username not in active_connections:
-            active_connections[username] = []
-        active_connections[username].append(websocket)
-        
-        logger.info(f"Viewer WebSocket connected for username: {username}")
+        try:
+            event_filter = parse_stream_filter(websocket.query_params)
+        except ValueError as e:
+            await websocket.close(code=1008, reason=str(e))
+            return
         
         # Send initial count
-        request_count = await db.webhook_requests.count_documents({"username": username})
+        request_count = await get_webhook_requests_count(db, username)
         await websocket.send_text(json.dumps({
             "event": "connected",
             "username": username,
             "request_count": request_count
         }))
         
-        # Keep connection alive and check for new requests
+        # Register connection; from here on all sends go through the subscriber's queue
+        subscriber = await manager.connect(
+            username, websocket, last_seq=last_event_id, event_filter=event_filter, endpoint="viewer_ws"
+        )
+        
+        logger.info(f"Viewer WebSocket connected for username: {username}")
+        
+        # Keep connection alive; new requests arrive through the connection manager
         while True:
             try:
-                # Find the most recent request
-                latest_request = await db.webhook_requests.find_one(
-                    {"username": username},
-                    sort=[("request_time", -1)]
-                )
-                
-                # Check if there's a new request
-                if latest_request and (
-                    last_request_id is None or 
-                    str(latest_request['_id']) != last_request_id
-                ):
-                    # Update last request ID
-                    last_request_id = str(latest_request['_id'])
-                    
-                    # Send new request notification
-                    await websocket.send_text(json.dumps({
-                        "event": "new_request",
-                        "method": latest_request.get('method', 'UNKNOWN'),
-                        "request_id": last_request_id
-                    }))
-                
-                # Wait for a short time before next check
-                await asyncio.sleep(2)  # 2-second polling interval
-                
-                # Optional: Send a ping to keep connection alive
-                await websocket.send_text(json.dumps({"event": "ping"}))
-                
-            except WebSocketDisconnect:
-                logger.error(f"Error in WebSocket polling: {inner_error}")
-                await asyncio.sleep(2)  # Prevent tight error loop.info(f"Viewer WebSocket disconnected for {username}")
-                break
-            except Exception as inner_error:
-                logger.error(f"Error in WebSocket polling: {inner_error}")
-                await asyncio.sleep(2)
\ No newline at end of file
+                message = await asyncio.wait_for(websocket.receive_text(), timeout=KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                # Send a ping to keep idle connections open through proxies
+                subscriber.offer({"event": "ping"})
+                continue
+            
+            try:
+                data = json.loads(message)
+            except ValueError:
+                # Ignore invalid messages
+                continue
+            
+            if isinstance(data, dict) and data.get("type") == "subscribe":
+                subscriber.offer(subscriber.set_filter(data.get("filters")))
+    
+    except HTTPException as http_err:
+        # User not found
+        logger.error(f"Viewer WebSocket connection failed - User not found: {http_err}")
+        try:
+            await websocket.close(code=1008, reason="User not found")
+        except:
+            pass
+    
+    except WebSocketDisconnect:
+        logger.info(f"Viewer WebSocket disconnected for {username}")
+    
+    except Exception as e:
+        logger.error(f"Viewer WebSocket error for username {username}: {e}")
+        logger.error(traceback.format_exc())
+        
+        try:
+            await websocket.close(code=1011, reason=str(e))
+        except:
+            pass
+    
+    finally:
+        # Clean up connection
+        manager.disconnect(username, subscriber)
@@ -2,29 +2,30 @@ import os
 import json
 from fastapi import APIRouter, Request, Response, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse, HTMLResponse
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.storage import Storage
 from typing import Dict, Any, List
 import logging
 import traceback
 
 from app.services.webhook import get_user_config, save_webhook_request, simulate_processing_time
-from app.services.db import get_db, get_db_websocket
+from app.services.db import get_db, get_ingest_db, get_db_websocket
+from app.services.connections import manager, build_request_event
+from app.services import metrics
+from app.services.timing import StageTimings, build_slow_request_event, is_slow
+from app.services.admission import admission
+from app.services.upstream import upstream_client, decode_upstream_body
+from app.services.behaviors import behavior_engine, ScriptedResponse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Define the router explicitly
 router = APIRouter()
 
-# Keep track of active websocket connections for realtime updates
-active_connections: Dict[str, List[WebSocket]] = {}
-
 @router.get("/webhook/@{username}", response_class=HTMLResponse)
 async def webhook_tester(
     username: str,
     request: Request,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_db)
 ):
     """
     Webhook tester page for sending test requests
@@ -89,7 +90,7 @@ async def webhook_endpoint_with_path(
     username: str, 
     path: str, 
     request: Request, 
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_ingest_db)
 ):
     """
     Handle incoming webhook requests with path parameters
@@ -101,76 +102,181 @@ async def webhook_endpoint_with_path(
 async def webhook_endpoint(
     username: str, 
     request: Request, 
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: Storage = Depends(get_ingest_db)
 ):
     """
     Handle incoming webhook requests for a specific username
     """
     return await handle_webhook_request(username, request, db)
 
-async def handle_webhook_request(username: str, request: Request, db: AsyncIOMotorDatabase):
+async def handle_webhook_request(username: str, request: Request, db: Storage):
     """
     Common handler for webhook requests
+    
+    Over-limit requests are rejected here, before the body is read or the
+    storage is touched, with 429 (user rate limit or concurrency cap) or 503
+    (worker overloaded) and a Retry-After header.
     """
+    rejection = admission.admit(username)
+    if rejection is not None:
+        status_code, reason, retry_after = rejection
+        metrics.WEBHOOK_REQUESTS.labels(request.method, str(status_code)).inc()
+        return JSONResponse(
+            content={"error": "Too many requests" if status_code == 429 else "Service overloaded", "reason": reason},
+            status_code=status_code,
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    release = True
     try:
-        # Log incoming request
-        logger.info(f"Received {request.method} request for username: {username}")
+        response = await serve_webhook_request(username, request, db)
+        if isinstance(response, ScriptedResponse):
+            # A stalled or throttled body is still being sent after this returns:
+            # keep the slot until the delivery is over
+            response.on_finish = lambda: admission.release(username)
+            release = False
+        return response
+    finally:
+        if release:
+            admission.release(username)
+
+async def serve_webhook_request(username: str, request: Request, db: Storage):
+    """
+    Capture an admitted webhook request and build its response
+    """
+    timings = StageTimings()
+    status_code = 500
+    request_doc = None
+    mode = "mock"
+    try:
+        # Log incoming request (lazy %-formatting on this per-request line, as in
+        # services/webhook.py, so sampled-out records are never formatted)
+        logger.info("Received %s request for username: %s", request.method, username)
         
         # Get user configuration
+        started = metrics.now()
         user = await get_user_config(db, username)
+        timings.record("get_user_config", started, metrics.STAGE_USER_CONFIG)
         
-        # Simulate processing time
-        process_time = simulate_processing_time(
-            user.get("response_time_min", 0),
-            user.get("response_time_max", 1000)
-        )
+        # Keep this worker's copy of the user's limits current
+        admission.configure(username, user)
         
         # Get default response
         response_data = user.get("default_response", {"status": "success"})
+        upstream = None
+        plan = None
+        
+        if user.get("upstream_url"):
+            # Proxy mode: the upstream's answer replaces the default response and the simulated delay
+            mode = "proxy"
+            started = metrics.now()
+            upstream = await upstream_client.forward(username, user, request)
+            timings.record("upstream", started)
+            process_time = round(upstream["duration"] * 1000)
+            if "error" not in upstream:
+                response_data = decode_upstream_body(upstream["content"], dict(upstream["headers"]).get("content-type", ""))
+        else:
+            # Behaviour scripts can change the status and body, and how the body is sent
+            plan = behavior_engine.plan(username, user, request.method, request.url.path)
+            if plan is not None:
+                response_data = plan.response
+            
+            # Simulate processing time
+            started = metrics.now()
+            process_time = await simulate_processing_time(
+                user.get("response_time_min", 0),
+                user.get("response_time_max", 1000)
+            )
+            timings.record("simulated_delay", started, metrics.STAGE_DELAY)
         
         # Save request to database
-        request_id = await save_webhook_request(
-            db=db,
-            username=username,
-            request=request,
-            response=response_data,
-            response_time=process_time
-        )
+        admission.storing += 1
+        try:
+            request_doc = await save_webhook_request(
+                db=db,
+                username=username,
+                request=request,
+                response=response_data,
+                response_time=process_time,
+                timings=timings,
+                upstream=None if upstream is None else {
+                    "url": upstream["url"],
+                    "status_code": upstream.get("status_code"),
+                    "headers": dict(upstream.get("headers", ())),
+                    "duration_ms": round(upstream["duration"] * 1000, 3),
+                    "error": upstream.get("error")
+                },
+                behavior=plan.summary() if plan is not None else None
+            )
+        finally:
+            admission.storing -= 1
         
-        # Send notification to websocket clients
-        if username in active_connections:
-            for connection in active_connections[username]:
-                try:
-                    await connection.send_text(json.dumps({
-                        "event": "new_request",
-                        "request_id": request_id,
-                        "method": request.method
-                    }))
-                except Exception as ws_error:
-                    logger.error(f"Error sending websocket message: {ws_error}")
+        # Publish once; every worker delivers to its own websocket clients.
+        # This only enqueues, so slow subscribers never delay the webhook response.
+        started = metrics.now()
+        try:
+            request.app.state.broker.publish(username, build_request_event(request_doc))
+        except Exception as publish_error:
+            logger.error(f"Error publishing webhook event: {publish_error}")
+        timings.record("publish", started, metrics.STAGE_PUBLISH)
         
         # Return response
-        return JSONResponse(content=response_data)
+        if upstream is not None and "error" not in upstream:
+            status_code = upstream["status_code"]
+            response = Response(content=upstream["content"], status_code=status_code)
+            for name, value in upstream["headers"]:
+                response.raw_headers.append((name.encode("latin-1"), value.encode("latin-1")))
+        elif plan is not None and plan.shapes_delivery:
+            status_code = plan.status_code
+            response = ScriptedResponse(response_data, status_code, plan)
+        else:
+            status_code = plan.status_code if plan is not None else 200
+            response = JSONResponse(content=response_data, status_code=status_code)
+            if upstream is not None:
+                # Upstream unreachable: fall back to the mock response
+                response.headers["X-Upstream-Error"] = upstream["error"].splitlines()[0][:200]
     
     except HTTPException as e:
         logger.error(f"HTTP Exception: {e.detail}")
-        return JSONResponse(content={"error": e.detail}, status_code=e.status_code)
+        status_code = e.status_code
+        response = JSONResponse(content={"error": e.detail}, status_code=e.status_code)
     
     except Exception as e:
         logger.error(f"Unexpected error in webhook endpoint: {e}")
         logger.error(traceback.format_exc())
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        response = JSONResponse(content={"error": str(e)}, status_code=500)
+    
+    total = timings.total()
+    metrics.WEBHOOK_DURATION.observe(total)
+    # The mock's own cost, without the time spent waiting on purpose or on the upstream
+    overhead = timings.overhead(total)
+    metrics.WEBHOOK_OVERHEAD.labels(mode).observe(overhead)
+    metrics.WEBHOOK_REQUESTS.labels(request.method, str(status_code)).inc()
+    response.headers["Server-Timing"] = timings.header(total)
+    
+    if is_slow(overhead):
+        try:
+            request.app.state.broker.publish(username, build_slow_request_event(
+                username, "webhook", request.method, request.url.path, timings, total,
+                request_id=request_doc["id"] if request_doc else None
+            ))
+        except Exception as publish_error:
+            logger.error(f"Error publishing slow request event: {publish_error}")
+    
+    return response
 
 @router.websocket("/ws/@{username}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     username: str, 
-    db: AsyncIOMotorDatabase = Depends(get_db_websocket)
+    db: Storage = Depends(get_db_websocket)
 ):
     """
     Websocket endpoint for realtime updates of webhook requests
     Uses get_db_websocket dependency to fix the 'request' parameter issue
     """
+    subscriber = None
+    
     try:
         # Accept the websocket connection
         await websocket.accept()
@@ -178,13 +284,6 @@ async def websocket_endpoint(
         # Check if user exists
         user = await get_user_config(db, username)
         
-        # Add connection to active connections
-        if username not in active_connections:
-            active_connections[username] = []
-        active_connections[username].append(websocket)
-        
-        logger.info(f"Websocket connected for username: {username}")
-        
         # Send initial welcome message
         await websocket.send_text(json.dumps({
             "event": "connected",
@@ -192,6 +291,12 @@ async def websocket_endpoint(
             "message": "Connected to webhook updates"
         }))
         
+        # Add connection to active connections; from here on all sends go
+        # through the subscriber's queue so only one task writes to the socket
+        subscriber = await manager.connect(username, websocket, endpoint="webhook_ws")
+        
+        logger.info(f"Websocket connected for username: {username}")
+        
         # Keep the connection open and handle messages
         while True:
             try:
@@ -202,10 +307,13 @@ async def websocket_endpoint(
                 try:
                     data = json.loads(message)
                     if data.get("type") == "ping":
-                        await websocket.send_text(json.dumps({
+                        subscriber.offer({
                             "event": "pong",
                             "timestamp": data.get("timestamp", 0)
-                        }))
+                        })
+                    elif data.get("type") == "subscribe":
+                        # Only requests matching the filters are sent from now on
+                        subscriber.offer(subscriber.set_filter(data.get("filters")))
                 except:
                     # Ignore invalid messages
                     pass
@@ -238,7 +346,4 @@ async def websocket_endpoint(
         
     finally:
         # Clean up connection
-        if username in active_connections and websocket in active_connections[username]:
-            active_connections[username].remove(websocket)
-            if not active_connections[username]:
-                del active_connections[username]
\ No newline at end of file
+        manager.disconnect(username, subscriber)
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+Production entry point: pre-forks uvicorn workers sharing one listening socket
+
+    python -m app.server
+
+Configured through environment variables:
+    HOST / PORT              Address to listen on (default 0.0.0.0:8080)
+    WEB_CONCURRENCY          Number of workers (default: available CPUs)
+    MAX_REQUESTS             Requests served before a worker is recycled (0 disables;
+                             ignored with STORAGE_BACKEND=memory)
+    MAX_REQUESTS_JITTER      Random extra requests so workers do not recycle together
+    GRACEFUL_TIMEOUT         Seconds a stopping worker waits for open connections
+    KEEPALIVE_TIMEOUT        Seconds idle HTTP keep-alive connections are kept open
+    WS_PER_MESSAGE_DEFLATE   Compress websocket messages when the client supports it (default 1, as in uvicorn)
+
+Logging is configured by LOG_LEVEL, LOG_FORMAT and LOG_SAMPLING (see app/services/logs.py).
+HTTP response compression is configured by COMPRESSION_* (see app/services/compression.py).
+"""
+import os
+import sys
+import time
+import signal
+import random
+import socket
+import asyncio
+import logging
+import multiprocessing
+from typing import Dict, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.services.db import create_storage
+from app.services.logs import configure_logging, shutdown_logging
+from app.services.storage import MongoStorage
+
+logger = logging.getLogger(__name__)
+
+# Workers exiting sooner than this after starting are restarted with a delay
+MIN_WORKER_UPTIME = 5.0
+
+def default_workers() -> int:
+    """
+    Number of CPUs this process may run on (respects container CPU sets)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def run_worker(config: uvicorn.Config, sock: socket.socket, max_requests: int, jitter: int) -> None:
+    """
+    Run one uvicorn server on the inherited socket until it is stopped or recycled
+    """
+    # Drop the supervisor's handlers; uvicorn installs its own for SIGTERM/SIGINT
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+
+    if max_requests > 0:
+        config.limit_max_requests = max_requests + random.randint(0, jitter)
+
+    # uvicorn handles SIGTERM/SIGINT itself: stop accepting, then wait for open connections
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=[sock])
+    finally:
+        # Worker processes exit without running atexit handlers
+        shutdown_logging()
+
+class Supervisor:
+    """
+    Keeps a fixed number of worker processes running
+
+    Workers that exit (recycled after MAX_REQUESTS or crashed) are replaced.
+    SIGTERM/SIGINT stop every worker gracefully; SIGHUP restarts them one by one.
+    """
+
+    def __init__(self, config: uvicorn.Config, workers: int, max_requests: int, jitter: int, graceful_timeout: int):
+        self.config = config
+        self.workers = workers
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.started_at: Dict[int, float] = {}
+        self.should_exit = False
+        self.should_restart = False
+        self._context = multiprocessing.get_context("fork")
+        self._socket: Optional[socket.socket] = None
+
+    def run(self) -> None:
+        self._socket = self.config.bind_socket()
+
+        signal.signal(signal.SIGTERM, self._handle_exit)
+        signal.signal(signal.SIGINT, self._handle_exit)
+        signal.signal(signal.SIGHUP, self._handle_restart)
+
+        logger.info(f"Starting {self.workers} workers on {self.config.host}:{self.config.port} (pid {os.getpid()})")
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while not self.should_exit:
+            if self.should_restart:
+                self.should_restart = False
+                self._restart_all()
+            self._reap()
+            time.sleep(0.5)
+
+        self._stop_all()
+        self._socket.close()
+        logger.info("All workers stopped")
+
+    def _spawn(self, slot: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.config, self._socket, self.max_requests, self.jitter),
+            name=f"worker-{slot}"
+        )
+        process.start()
+        self.processes[slot] = process
+        self.started_at[slot] = time.monotonic()
+        logger.info(f"Started worker {slot} (pid {process.pid})")
+
+    def _reap(self) -> None:
+        for slot, process in list(self.processes.items()):
+            if process.is_alive() or self.should_exit:
+                continue
+
+            uptime = time.monotonic() - self.started_at[slot]
+            process.join()
+            logger.info(f"Worker {slot} (pid {process.pid}) exited with code {process.exitcode} after {uptime:.0f}s")
+
+            # Avoid a tight restart loop when workers fail on startup
+            if uptime < MIN_WORKER_UPTIME:
+                time.sleep(1)
+            self._spawn(slot)
+
+    def _restart_all(self) -> None:
+        # Replace one worker at a time so the others keep serving
+        for slot, process in list(self.processes.items()):
+            process.terminate()
+            process.join(self.graceful_timeout + 5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            self._spawn(slot)
+
+    def _stop_all(self) -> None:
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Killing worker pid {process.pid} after graceful timeout")
+                process.kill()
+                process.join()
+
+    def _handle_exit(self, signum, frame) -> None:
+        self.should_exit = True
+
+    def _handle_restart(self, signum, frame) -> None:
+        self.should_restart = True
+
+async def prepare_database() -> None:
+    """
+    Create indexes (or tables) once in the supervisor instead of racing in every worker
+    """
+    storage = create_storage()
+    if storage is not None:
+        try:
+            await storage.ensure_indexes()
+        finally:
+            await storage.close()
+        return
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI", "mongodb://mongodb:27017"), serverSelectionTimeoutMS=5000)
+    try:
+        await MongoStorage(client[os.getenv("MONGO_DB", "webhook_db")]).ensure_indexes()
+    finally:
+        client.close()
+
+def main() -> None:
+    load_dotenv()
+    configure_logging()
+
+    workers = int(os.getenv("WEB_CONCURRENCY", 0)) or default_workers()
+    max_requests = int(os.getenv("MAX_REQUESTS", 0))
+    jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+    graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+    # In-memory storage is per process; several workers would each see different data,
+    # and recycling the only worker would wipe everything stored
+    if os.getenv("STORAGE_BACKEND", "").lower() == "memory":
+        if workers > 1:
+            logger.warning("STORAGE_BACKEND=memory runs a single worker")
+            workers = 1
+        if max_requests > 0:
+            logger.warning("MAX_REQUESTS is ignored with STORAGE_BACKEND=memory (recycling would lose all data)")
+            max_requests = 0
+
+    try:
+        asyncio.run(prepare_database())
+        os.environ["SKIP_INDEX_CREATION"] = "1"
+    except Exception as e:
+        # Workers create the indexes themselves when the database is not reachable yet
+        logger.error(f"Error creating indexes before starting workers: {e}")
+
+    # Workers must share live events; the in-process broker only reaches its own worker
+    if workers > 1 and "BROKER_BACKEND" not in os.environ:
+        os.environ["BROKER_BACKEND"] = "ipc"
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8080)),
+        # uvloop and httptools are used when installed (uvicorn[standard])
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=int(os.getenv("KEEPALIVE_TIMEOUT", 5)),
+        timeout_graceful_shutdown=graceful_timeout,
+        proxy_headers=True,
+        # uvicorn already enables permessage-deflate by default; this only lets it be turned off
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "1") != "0",
+        # uvicorn's loggers propagate to the queue-based root handler (see services/logs.py),
+        # so access logs can be sampled with LOG_SAMPLING=uvicorn.access=<rate>
+        log_config=None
+    )
+
+    if workers == 1 and max_requests == 0:
+        # Nothing to supervise
+        uvicorn.Server(config).run()
+        return
+
+    Supervisor(config, workers, max_requests, jitter, graceful_timeout).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
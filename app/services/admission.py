@@ -0,0 +1,160 @@
+import os
+import math
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from app.services.metrics import WEBHOOK_SHED
+
+# Webhook requests in progress on one worker (including the simulated delay) beyond which new ones get a 503 (0 disables)
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 2000))
+
+# Captures waiting on storage or the broker on one worker beyond which new requests get a 503 (0 disables)
+MAX_INGEST_BACKLOG = int(os.getenv("MAX_INGEST_BACKLOG", 500))
+
+# Retry-After sent with 503 responses, in seconds
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", 1))
+
+# Rejection reasons (label of the shed counter)
+REASON_RATE_LIMIT = "rate_limit"
+REASON_CONCURRENCY = "concurrency"
+REASON_OVERLOAD = "overload"
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second, holding at most `burst`
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take one token
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class TenantState:
+    """
+    Limits and usage of one user on this worker
+    """
+
+    __slots__ = ("rate_limit", "rate_burst", "max_concurrency", "bucket")
+
+    def __init__(self):
+        self.rate_limit = 0.0
+        self.rate_burst = 0
+        self.max_concurrency = 0
+        self.bucket: Optional[TokenBucket] = None
+
+class AdmissionController:
+    """
+    Decides whether a webhook request is served or shed
+
+    Runs before any storage access, so limits come from the last user config
+    this worker read (every admitted request reads it, so a change applies
+    from the next request on). Rate limits and concurrency caps are enforced
+    per worker; with several workers a tenant gets up to WEB_CONCURRENCY
+    times its limits.
+
+    Everything runs on the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, max_in_flight: int = 0, max_backlog: int = 0, retry_after: int = 1):
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.storing = 0
+        self._tenants: Dict[str, TenantState] = {}
+        # Requests in progress per user (only users with at least one)
+        self._active: Dict[str, int] = {}
+        self._backlog = lambda: 0
+
+    def set_backlog_function(self, function) -> None:
+        """
+        Set the function returning extra queued ingest work (e.g. the broker outbox)
+        """
+        self._backlog = function
+
+    def backlog(self) -> int:
+        """
+        Captures waiting on storage plus queued ingest work
+        """
+        return self.storing + self._backlog()
+
+    def configure(self, username: str, user: Dict[str, Any]) -> None:
+        """
+        Apply the limits of a user config (called whenever one is read or updated)
+        """
+        rate_limit = float(user.get("rate_limit") or 0)
+        rate_burst = int(user.get("rate_burst") or 0)
+        max_concurrency = int(user.get("max_concurrency") or 0)
+
+        tenant = self._tenants.get(username)
+        if tenant is None:
+            if not rate_limit and not max_concurrency:
+                return
+            tenant = self._tenants[username] = TenantState()
+
+        if (rate_limit, rate_burst) != (tenant.rate_limit, tenant.rate_burst):
+            tenant.rate_limit, tenant.rate_burst = rate_limit, rate_burst
+            # A burst of 0 allows one second worth of requests
+            tenant.bucket = TokenBucket(rate_limit, rate_burst or rate_limit) if rate_limit > 0 else None
+        tenant.max_concurrency = max_concurrency
+
+    def admit(self, username: str) -> Optional[Tuple[int, str, int]]:
+        """
+        Admit a request, or tell why it is shed
+
+        An admitted request must be followed by release(username).
+
+        Returns:
+            None if admitted, otherwise (status code, reason, Retry-After seconds)
+        """
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return self._shed(503, REASON_OVERLOAD, self.retry_after)
+        if self.max_backlog and self.backlog() >= self.max_backlog:
+            return self._shed(503, REASON_OVERLOAD, self.retry_after)
+
+        tenant = self._tenants.get(username)
+        if tenant is not None:
+            if tenant.max_concurrency and self._active.get(username, 0) >= tenant.max_concurrency:
+                return self._shed(429, REASON_CONCURRENCY, 1)
+            if tenant.bucket is not None:
+                wait = tenant.bucket.take()
+                if wait:
+                    return self._shed(429, REASON_RATE_LIMIT, math.ceil(wait))
+
+        self._active[username] = self._active.get(username, 0) + 1
+        self.in_flight += 1
+        return None
+
+    def release(self, username: str) -> None:
+        """
+        Mark an admitted request as finished
+        """
+        self.in_flight -= 1
+        active = self._active.pop(username, 1) - 1
+        if active > 0:
+            self._active[username] = active
+
+    def _shed(self, status_code: int, reason: str, retry_after: int) -> Tuple[int, str, int]:
+        WEBHOOK_SHED.labels(reason).inc()
+        return status_code, reason, retry_after
+
+# One per worker process
+admission = AdmissionController(MAX_IN_FLIGHT, MAX_INGEST_BACKLOG, OVERLOAD_RETRY_AFTER)
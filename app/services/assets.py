@@ -0,0 +1,159 @@
+"""
+Static asset pipeline: content-hashed file names and precompressed copies
+
+At startup (the application lifespan) every file under app/static is copied to STATIC_BUILD_DIR
+(default /tmp/webhook-static) as name.<hash>.ext, next to name.<hash>.ext.gz
+and, when the Brotli package is installed, name.<hash>.ext.br. Templates link
+to the hashed names through the static_url() Jinja global; those URLs never
+change content, so they are served with a one-year immutable Cache-Control.
+The original names keep working, revalidated on every use.
+"""
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.staticfiles import StaticFiles
+
+from app.services.compression import negotiate
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only .gz copies are written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "app/static"
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "/tmp/webhook-static")
+
+# Characters of the SHA-256 digest kept in file names
+HASH_LENGTH = 12
+
+# Files smaller than this are not worth precompressing
+PRECOMPRESS_MIN_SIZE = 512
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# File suffix of each precompressed copy, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+def _write(path: str, make: Callable[[], bytes]) -> None:
+    # Built by another worker or an earlier start: skip the (costly) compression too
+    if os.path.exists(path):
+        return
+    # Workers may build at the same time: write a temporary file, then rename
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(make())
+    os.replace(temporary, path)
+
+def build_assets(source_dir: str = STATIC_DIR, build_dir: str = STATIC_BUILD_DIR) -> Dict[str, str]:
+    """
+    Write fingerprinted and precompressed copies of the static files
+
+    Outputs are named after their content, so files already built (by another
+    worker or an earlier start) are kept as they are.
+
+    Args:
+        source_dir: Directory with the original assets
+        build_dir: Directory receiving the built assets
+
+    Returns:
+        Dict: Manifest mapping original paths ("js/viewer.js") to fingerprinted ones
+    """
+    manifest = {}
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            path = os.path.relpath(source, source_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+            stem, ext = os.path.splitext(path)
+            fingerprinted = f"{stem}.{digest}{ext}"
+
+            target = os.path.join(build_dir, fingerprinted)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, lambda: data)
+            if len(data) >= PRECOMPRESS_MIN_SIZE:
+                # Built once, so use the strongest settings
+                _write(target + ".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(target + ".br", lambda: brotli.compress(data, quality=11))
+
+            manifest[path] = fingerprinted
+
+    logger.info(f"Built {len(manifest)} static assets in {build_dir}")
+    return manifest
+
+class StaticAssets(StaticFiles):
+    """
+    StaticFiles serving fingerprinted names from the build directory
+
+    A fingerprinted file is sent precompressed (br, then gzip) when the
+    client accepts it, with an immutable Cache-Control. Other paths are served
+    from the source directory with no-cache, so browsers revalidate them.
+    Until set_manifest() is called, every path is served that way.
+    """
+
+    def __init__(self, directory: str, build_dir: str, manifest: Optional[Dict[str, str]] = None):
+        super().__init__(directory=directory)
+        self.built = StaticFiles(directory=build_dir, check_dir=False)
+        self.build_dir = build_dir
+        self._variants: Dict[str, Tuple[str, ...]] = {}
+        self.set_manifest(manifest or {})
+
+    def set_manifest(self, manifest: Dict[str, str]) -> None:
+        """
+        Serve the fingerprinted names of a build_assets() manifest
+        """
+        self.manifest = manifest
+        self.fingerprinted = set(manifest.values())
+        self._variants.clear()
+
+    def url(self, path: str) -> str:
+        """
+        URL of an asset, fingerprinted when it was built (the static_url() Jinja global)
+        """
+        path = path.lstrip("/")
+        return f"/static/{self.manifest.get(path, path)}"
+
+    async def get_response(self, path: str, scope):
+        path = path.replace(os.sep, "/")
+        if path not in self.fingerprinted:
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("cache-control", "no-cache")
+            return response
+
+        encoding = self._negotiate(path, scope)
+        response = await self.built.get_response(path + dict(PRECOMPRESSED)[encoding] if encoding else path, scope)
+        if encoding:
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type == "application/javascript":
+                media_type += "; charset=utf-8"
+            response.headers["content-type"] = media_type
+            response.headers["content-encoding"] = encoding
+        response.headers["vary"] = "Accept-Encoding"
+        response.headers["cache-control"] = IMMUTABLE
+        return response
+
+    def _negotiate(self, path: str, scope) -> Optional[str]:
+        # Encodings with a precompressed copy of this file
+        variants = self._variants.get(path)
+        if variants is None:
+            target = os.path.join(self.build_dir, path)
+            variants = self._variants[path] = tuple(
+                encoding for encoding, suffix in PRECOMPRESSED if os.path.exists(target + suffix)
+            )
+        if not variants:
+            return None
+
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                return negotiate(value.decode("latin-1"), variants)
+        return None
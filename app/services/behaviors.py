@@ -0,0 +1,276 @@
+"""
+Behaviour scripts: scripted statuses and response delivery for mock users
+
+A user's "behaviors" list holds scripts; the first one whose route (glob on
+the path below /api/@username) and method match a webhook decides how it
+is answered. Without a matching script the user's default_response and
+response_time_* apply unchanged. A script can:
+
+    statuses: [200, 500, 503]     rotate through these status codes (200-599, not 204 or 304)
+    error_every: 5                every 5th matching call fails...
+    error_status: 500             ...with this status (default 500)...
+    error_response: {...}         ...and this body instead of default_response
+    bytes_per_second: 1024        send the body at this rate
+    stall_ms: 2000                wait after sending the headers
+    close_after_bytes: 100        drop the connection after this many body bytes
+
+Call counters live in memory, per worker and per user; they restart when
+the user's scripts change. With several workers, "every Nth call" and the
+status rotation apply to each worker's share of the traffic.
+
+Scripts apply to mock responses only; proxied webhooks (upstream_url)
+return the upstream's answer as it came.
+"""
+import os
+import time
+import asyncio
+from typing import Callable, Dict, Any, List, Optional, Tuple, Pattern
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.services.filters import compile_glob, relative_path
+
+# Scripts allowed per user
+MAX_BEHAVIORS = int(os.getenv("MAX_BEHAVIORS", 20))
+
+# Seconds between chunks of a throttled body
+THROTTLE_INTERVAL = 0.05
+
+DEFAULT_ERROR_RESPONSE = {"status": "error", "message": "Scripted failure"}
+
+# Statuses that cannot carry the JSON body every scripted response has
+BODYLESS_STATUSES = (204, 304)
+
+def _is_body_status(value: Any) -> bool:
+    return (
+        isinstance(value, int) and not isinstance(value, bool)
+        and 200 <= value <= 599 and value not in BODYLESS_STATUSES
+    )
+
+SCRIPT_KEYS = frozenset({
+    "route", "method", "statuses", "error_every", "error_status", "error_response",
+    "bytes_per_second", "stall_ms", "close_after_bytes"
+})
+
+class BehaviorScript:
+    """
+    One compiled script of a user
+    """
+
+    __slots__ = (
+        "route", "methods", "statuses", "error_every", "error_status", "error_response",
+        "bytes_per_second", "stall", "close_after_bytes"
+    )
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.route: Optional[Pattern] = compile_glob(spec["route"]) if spec.get("route") else None
+        methods = spec.get("method")
+        if isinstance(methods, str):
+            methods = [m.strip() for m in methods.split(",") if m.strip()]
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        self.statuses: Tuple[int, ...] = tuple(spec.get("statuses") or ())
+        self.error_every: int = spec.get("error_every") or 0
+        self.error_status: int = spec.get("error_status") or 500
+        self.error_response: Any = spec.get("error_response", DEFAULT_ERROR_RESPONSE)
+        self.bytes_per_second: float = spec.get("bytes_per_second") or 0
+        self.stall: float = (spec.get("stall_ms") or 0) / 1000
+        self.close_after_bytes: Optional[int] = spec.get("close_after_bytes")
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self.route is None or self.route.match(path) is not None
+
+class ResponsePlan:
+    """
+    How one webhook response is answered and delivered
+    """
+
+    __slots__ = ("script", "call", "status_code", "response", "bytes_per_second", "stall", "close_after_bytes")
+
+    def __init__(self, script: int, call: int, status_code: int, response: Any, source: BehaviorScript):
+        self.script = script
+        self.call = call
+        self.status_code = status_code
+        self.response = response
+        self.bytes_per_second = source.bytes_per_second
+        self.stall = source.stall
+        self.close_after_bytes = source.close_after_bytes
+
+    @property
+    def shapes_delivery(self) -> bool:
+        return bool(self.bytes_per_second or self.stall or self.close_after_bytes is not None)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        What the script did, as stored on the capture
+        """
+        return {"script": self.script, "call": self.call, "status_code": self.status_code}
+
+def _check_int(spec: Dict[str, Any], key: str, minimum: int, maximum: Optional[int] = None) -> None:
+    value = spec.get(key)
+    if value is None:
+        return
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum or (maximum is not None and value > maximum):
+        bound = f"between {minimum} and {maximum}" if maximum is not None else f"at least {minimum}"
+        raise ValueError(f"'{key}' must be an integer {bound}")
+
+def validate_behaviors(specs: Optional[List[Dict[str, Any]]]) -> None:
+    """
+    Check the behaviour scripts of a user config
+
+    Raises:
+        HTTPException: If a script is malformed
+    """
+    if not specs:
+        return
+    try:
+        if not isinstance(specs, list) or len(specs) > MAX_BEHAVIORS:
+            raise ValueError(f"Behaviors must be a list of at most {MAX_BEHAVIORS} scripts")
+        for spec in specs:
+            if not isinstance(spec, dict):
+                raise ValueError("Each behavior must be an object")
+            unknown = set(spec) - SCRIPT_KEYS
+            if unknown:
+                raise ValueError(f"Unknown behavior settings: {', '.join(sorted(unknown))}")
+            if spec.get("route") is not None and not isinstance(spec["route"], str):
+                raise ValueError("'route' must be a glob string")
+            if spec.get("method") is not None and not isinstance(spec["method"], (str, list)):
+                raise ValueError("'method' must be a string or a list of strings")
+            statuses = spec.get("statuses")
+            if statuses is not None and (
+                not isinstance(statuses, list)
+                or not all(_is_body_status(s) for s in statuses)
+            ):
+                raise ValueError("'statuses' must be a list of HTTP status codes from 200 to 599, except 204 and 304")
+            _check_int(spec, "error_every", 1)
+            if spec.get("error_status") is not None and not _is_body_status(spec["error_status"]):
+                raise ValueError("'error_status' must be an HTTP status code from 200 to 599, except 204 and 304")
+            _check_int(spec, "stall_ms", 0, 600000)
+            _check_int(spec, "close_after_bytes", 0)
+            rate = spec.get("bytes_per_second")
+            if rate is not None and (isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0):
+                raise ValueError("'bytes_per_second' must be a positive number")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class BehaviorEngine:
+    """
+    Compiled scripts and call counters of this worker's users
+
+    Scripts are compiled when a user's config is first seen with them and
+    again only when they change, so matching a webhook costs a list
+    comparison, a few glob matches and a counter increment.
+    """
+
+    def __init__(self):
+        self._scripts: Dict[str, Tuple[List[Dict[str, Any]], Tuple[BehaviorScript, ...]]] = {}
+        self._calls: Dict[Tuple[str, int], int] = {}
+
+    def _compiled(self, username: str, specs: List[Dict[str, Any]]) -> Tuple[BehaviorScript, ...]:
+        cached = self._scripts.get(username)
+        if cached is not None and cached[0] == specs:
+            return cached[1]
+        # New or changed scripts: counters start over
+        self.reset(username)
+        scripts = tuple(BehaviorScript(spec) for spec in specs)
+        self._scripts[username] = (specs, scripts)
+        return scripts
+
+    def reset(self, username: str) -> None:
+        """
+        Forget a user's compiled scripts and call counters
+        """
+        cached = self._scripts.pop(username, None)
+        if cached is not None:
+            for index in range(len(cached[1])):
+                self._calls.pop((username, index), None)
+
+    def plan(self, username: str, user: Dict[str, Any], method: str, path: str) -> Optional[ResponsePlan]:
+        """
+        Evaluate the user's scripts for one webhook
+
+        Args:
+            username: User the webhook belongs to
+            user: User config (behaviors, default_response)
+            method: Request method
+            path: Request path
+
+        Returns:
+            ResponsePlan: How to answer, or None when no script matches
+        """
+        specs = user.get("behaviors")
+        if not specs:
+            if username in self._scripts:
+                self.reset(username)
+            return None
+
+        relative = relative_path(path, username)
+        for index, script in enumerate(self._compiled(username, specs)):
+            if not script.matches(method, relative):
+                continue
+
+            key = (username, index)
+            call = self._calls.get(key, 0) + 1
+            self._calls[key] = call
+
+            if script.error_every and call % script.error_every == 0:
+                return ResponsePlan(index, call, script.error_status, script.error_response, script)
+            status_code = script.statuses[(call - 1) % len(script.statuses)] if script.statuses else 200
+            return ResponsePlan(index, call, status_code, user.get("default_response", {"status": "success"}), script)
+        return None
+
+class ScriptedResponse(JSONResponse):
+    """
+    JSON response delivered as a script says: after a stall, throttled, or cut short
+
+    Content-Length announces the whole body, so clients see a cut-short
+    response as truncated; the server closes the connection when the app
+    returns without finishing the body (uvicorn logs "ASGI callable returned
+    without completing response" each time). on_finish, when set, is called
+    once the delivery is over, however it ends.
+    """
+
+    def __init__(self, content: Any, status_code: int, plan: ResponsePlan):
+        super().__init__(content=content, status_code=status_code)
+        self.plan = plan
+        self.on_finish: Optional[Callable[[], None]] = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self._deliver(send)
+        finally:
+            if self.on_finish is not None:
+                self.on_finish()
+
+    async def _deliver(self, send) -> None:
+        plan = self.plan
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if plan.stall:
+            await asyncio.sleep(plan.stall)
+
+        body = self.body
+        end = len(body) if plan.close_after_bytes is None else min(len(body), plan.close_after_bytes)
+        rate = plan.bytes_per_second
+        chunk_size = max(1, int(rate * THROTTLE_INTERVAL)) if rate else max(end, 1)
+
+        started = time.perf_counter()
+        sent = 0
+        while sent < end:
+            chunk = body[sent:sent + min(chunk_size, end - sent)]
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            sent += len(chunk)
+            if rate and sent < end:
+                # Paced against the start, so the rate holds however long each send takes
+                delay = started + sent / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+        if end < len(body):
+            # Leave the response unfinished: the server drops the connection
+            return
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+# One per worker process
+behavior_engine = BehaviorEngine()
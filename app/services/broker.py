@@ -0,0 +1,312 @@
+import os
+import json
+import glob
+import struct
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+logger = logging.getLogger(__name__)
+
+# Callback invoked for every message a worker receives: (channel, message).
+# It must not block; the connection manager only enqueues.
+MessageHandler = Callable[[str, Dict[str, Any]], None]
+
+class Broker:
+    """
+    Pub/sub broker used to fan realtime events out to every worker
+
+    A message is published once (usually by the ingest path) and each worker
+    running a broker receives it exactly once through its handler, which then
+    delivers it to the websockets connected to that worker.
+
+    publish() never waits on I/O. Backends that talk to other processes put
+    messages on a bounded outbox drained by a background sender task; when the
+    outbox is full new messages are dropped rather than slowing the caller.
+    """
+
+    name = "base"
+
+    # Messages buffered for the sender task before publish() starts dropping
+    OUTBOX_SIZE = 10000
+
+    def __init__(self):
+        self._handler: Optional[MessageHandler] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    async def start(self, handler: MessageHandler) -> None:
+        """
+        Start receiving messages
+
+        Args:
+            handler: Callable invoked with (channel, message) for each message
+        """
+        self._handler = handler
+
+    async def stop(self) -> None:
+        """
+        Stop receiving messages and release resources
+        """
+        if self._sender:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+        self._handler = None
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        """
+        Publish a message to every worker without waiting
+
+        Args:
+            channel: Channel name (the username for webhook events)
+            message: JSON-serializable message
+        """
+        raise NotImplementedError
+
+    def queue_depth(self) -> int:
+        """
+        Messages waiting in the outbox (0 for backends without one)
+        """
+        return self._outbox.qsize() if self._outbox is not None else 0
+
+    def _deliver(self, channel: str, message: Dict[str, Any]) -> None:
+        if self._handler is None:
+            return
+        try:
+            self._handler(channel, message)
+        except Exception as e:
+            logger.error(f"Error delivering message on channel {channel}: {e}")
+
+    def _start_sender(self) -> None:
+        self._outbox = asyncio.Queue(maxsize=self.OUTBOX_SIZE)
+        self._sender = asyncio.create_task(self._drain_outbox())
+
+    def _enqueue(self, channel: str, message: Dict[str, Any]) -> None:
+        try:
+            self._outbox.put_nowait((channel, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Broker outbox full, dropping message on channel {channel}")
+
+    async def _drain_outbox(self) -> None:
+        while True:
+            channel, message = await self._outbox.get()
+            try:
+                await self._send(channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sending broker message on channel {channel}: {e}")
+
+    async def _send(self, channel: str, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+class InProcessBroker(Broker):
+    """
+    Broker that only delivers inside the current process (single worker)
+    """
+
+    name = "memory"
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self._deliver(channel, message)
+
+class MongoChangeStreamBroker(Broker):
+    """
+    Broker backed by a MongoDB change stream
+
+    Messages are inserted into a small TTL collection and every worker tails it
+    with a change stream. Requires MongoDB to run as a replica set.
+    """
+
+    name = "mongo"
+
+    def __init__(self, db: AsyncIOMotorDatabase, collection: str = "realtime_events", ttl_seconds: int = 60):
+        super().__init__()
+        self.collection = db[collection]
+        self.ttl_seconds = ttl_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: MessageHandler) -> None:
+        await super().start(handler)
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        self._task = asyncio.create_task(self._watch())
+        self._start_sender()
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await super().stop()
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self._enqueue(channel, message)
+
+    async def _send(self, channel: str, message: Dict[str, Any]) -> None:
+        await self.collection.insert_one({
+            "channel": channel,
+            "message": message,
+            "created_at": datetime.utcnow()
+        })
+
+    async def _watch(self) -> None:
+        resume_token = None
+        pipeline = [{"$match": {"operationType": "insert"}}]
+
+        while True:
+            try:
+                async with self.collection.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change.get("fullDocument") or {}
+                        self._deliver(document.get("channel", ""), document.get("message", {}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Change stream error, retrying: {e}")
+                await asyncio.sleep(1)
+
+class UnixSocketBroker(Broker):
+    """
+    Broker for several workers on one host, using Unix domain sockets
+
+    Each worker listens on <socket_dir>/<pid>.sock. Publishing delivers locally
+    and writes a length-prefixed JSON frame to every other socket in the directory.
+    """
+
+    name = "ipc"
+
+    # How long the list of peer sockets is reused before re-scanning the directory
+    PEER_REFRESH_SECONDS = 1.0
+
+    # Maximum bytes buffered for a single peer before frames are dropped
+    MAX_PEER_BUFFER = 4 * 1024 * 1024
+
+    def __init__(self, socket_dir: str):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self.socket_path = os.path.join(socket_dir, f"{os.getpid()}.sock")
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[str, asyncio.StreamWriter] = {}
+        self._peers_refreshed_at = 0.0
+
+    async def start(self, handler: MessageHandler) -> None:
+        await super().start(handler)
+        os.makedirs(self.socket_dir, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.socket_path)
+        self._start_sender()
+        logger.info(f"IPC broker listening on {self.socket_path}")
+
+    async def stop(self) -> None:
+        await super().stop()
+
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        for writer in self._peers.values():
+            writer.close()
+        self._peers.clear()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def publish(self, channel: str, message: Dict[str, Any]) -> None:
+        self._enqueue(channel, message)
+        self._deliver(channel, message)
+
+    async def _send(self, channel: str, message: Dict[str, Any]) -> None:
+        payload = json.dumps({"channel": channel, "message": message}, default=str).encode("utf-8")
+        frame = struct.pack("!I", len(payload)) + payload
+
+        for path, writer in list((await self._get_peers()).items()):
+            if writer.is_closing():
+                self._peers.pop(path, None)
+                continue
+            if writer.transport.get_write_buffer_size() > self.MAX_PEER_BUFFER:
+                self.dropped += 1
+                logger.warning(f"Dropping IPC message for slow peer {path}")
+                continue
+            writer.write(frame)
+
+    async def _get_peers(self) -> Dict[str, asyncio.StreamWriter]:
+        now = asyncio.get_running_loop().time()
+        if now - self._peers_refreshed_at < self.PEER_REFRESH_SECONDS:
+            return self._peers
+        self._peers_refreshed_at = now
+
+        paths = set(glob.glob(os.path.join(self.socket_dir, "*.sock"))) - {self.socket_path}
+
+        # Forget peers whose socket disappeared
+        for path in list(self._peers):
+            if path not in paths:
+                self._peers.pop(path).close()
+
+        for path in paths - set(self._peers):
+            try:
+                _, writer = await asyncio.open_unix_connection(path)
+                self._peers[path] = writer
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Socket left behind by a dead worker
+                logger.info(f"Removing stale IPC socket {path}")
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                logger.error(f"Error connecting to IPC peer {path}: {e}")
+
+        return self._peers
+
+    async def _handle_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                (length,) = struct.unpack("!I", header)
+                data = json.loads(await reader.readexactly(length))
+                self._deliver(data.get("channel", ""), data.get("message", {}))
+        except (asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Peer went away or this worker is shutting down
+            pass
+        except Exception as e:
+            logger.error(f"Error reading from IPC peer: {e}")
+        finally:
+            writer.close()
+
+def create_broker(db: Optional[AsyncIOMotorDatabase]) -> Broker:
+    """
+    Create the broker configured by the BROKER_BACKEND environment variable
+
+    Args:
+        db: MongoDB database connection (used by the mongo backend), None without MongoDB
+
+    Returns:
+        Broker: "memory" (default), "mongo" or "ipc" broker
+    """
+    backend = os.getenv("BROKER_BACKEND", "memory").lower()
+
+    if backend == "mongo" and db is None:
+        logger.warning("BROKER_BACKEND 'mongo' needs MongoDB storage, using in-process broker")
+        return InProcessBroker()
+    if backend == "mongo":
+        return MongoChangeStreamBroker(db)
+    if backend == "ipc":
+        return UnixSocketBroker(os.getenv("BROKER_SOCKET_DIR", "/tmp/webhook-broker"))
+    if backend != "memory":
+        logger.warning(f"Unknown BROKER_BACKEND '{backend}', using in-process broker")
+    return InProcessBroker()
@@ -0,0 +1,271 @@
+"""
+Response compression negotiated on Accept-Encoding (brotli when installed, gzip)
+
+Configured through environment variables:
+    COMPRESSION_ENCODINGS  Encodings offered, in order of preference (default
+                           "br,gzip"; empty disables compression)
+    COMPRESSION_MIN_SIZE   Complete responses smaller than this many bytes are
+                           sent as is (default 1024)
+    GZIP_LEVEL             zlib level (default 6)
+    BROTLI_QUALITY         Brotli quality, 0-11 (default 4; higher is much slower)
+"""
+import os
+import zlib
+import asyncio
+from typing import Optional, Tuple
+
+from app.services import metrics
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+# Only these responses are compressed; everything else, in particular the
+# webhook endpoints (/api/@...), goes straight to the application
+COMPRESSED_PATHS = ("/api/requests/", "/view/", "/metrics", "/admin/")
+
+COMPRESSIBLE_TYPES = ("application/json", "text/csv", "text/html", "text/plain")
+
+# Chunks at least this large are compressed in a worker thread (zlib and brotli release the GIL)
+THREAD_MIN_SIZE = 256 * 1024
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+def with_vary(headers):
+    """
+    Response headers with Accept-Encoding added to Vary (unless already listed)
+
+    Args:
+        headers: ASGI header list of a response start message
+
+    Returns:
+        list: New header list
+    """
+    headers = list(headers)
+    for i, (name, value) in enumerate(headers):
+        if name == b"vary":
+            listed = [item.strip().lower() for item in value.split(b",")]
+            if b"accept-encoding" not in listed and b"*" not in listed:
+                headers[i] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+def negotiate(accept_encoding: str, offered: Tuple[str, ...]) -> Optional[str]:
+    """
+    Pick the first offered encoding the client accepts (q > 0)
+
+    Args:
+        accept_encoding: Accept-Encoding header value
+        offered: Supported encodings, in order of preference
+
+    Returns:
+        str: Encoding name, or None to send the response uncompressed
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON, CSV, HTML and text responses
+
+    Complete responses below min_size are sent unchanged. Streaming responses
+    (exports) are compressed chunk by chunk as they are produced, so nothing
+    is buffered beyond the compressor's window. Responses that already have a
+    Content-Encoding are left alone. Every response under the compressed
+    paths carries "Vary: Accept-Encoding", compressed or not, so caches keep
+    the variants apart.
+    """
+
+    def __init__(
+        self,
+        app,
+        encodings: Tuple[str, ...] = ("br", "gzip"),
+        min_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        paths: Tuple[str, ...] = COMPRESSED_PATHS
+    ):
+        self.app = app
+        self.encodings = tuple(e for e in encodings if e == "gzip" or (e == "br" and brotli is not None))
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding, self.encodings) if accept_encoding else None
+        if encoding is None:
+            async def send_with_vary(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": with_vary(message.get("headers", []))}
+                await send(message)
+
+            await self.app(scope, receive, send_with_vary)
+            return
+
+        await CompressedResponse(self, encoding, send).run(scope, receive)
+
+    def encoder(self, encoding: str):
+        if encoding == "br":
+            return BrotliEncoder(self.brotli_quality)
+        return GzipEncoder(self.gzip_level)
+
+class CompressedResponse:
+    """
+    send() wrapper for one response: decides on the first body chunk whether to compress
+    """
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+        self.original_size = 0
+        self.compressed_size = 0
+
+    async def run(self, scope, receive) -> None:
+        await self.middleware.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not self._should_compress(body, more_body):
+                self.passthrough = True
+                await self.send({**self.start_message, "headers": with_vary(self.start_message.get("headers", []))})
+                await self.send(message)
+                return
+            await self._start(body, more_body)
+            if not more_body:
+                return
+
+        data = await self._compress(body)
+        if more_body:
+            if data:
+                await self.send({"type": "http.response.body", "body": data, "more_body": True})
+            return
+
+        tail = self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": data + tail, "more_body": False})
+        self._record(len(tail))
+
+    def _should_compress(self, body: bytes, more_body: bool) -> bool:
+        message = self.start_message
+        if message["status"] < 200 or message["status"] in (204, 304):
+            return False
+
+        content_type = b""
+        for name, value in message.get("headers", []):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+
+        if not content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES):
+            return False
+        # Small complete responses are cheaper to send as they are
+        return more_body or len(body) >= self.middleware.min_size
+
+    async def _start(self, body: bytes, more_body: bool) -> None:
+        self.encoder = self.middleware.encoder(self.encoding)
+        headers = with_vary(
+            (name, value) for name, value in self.start_message.get("headers", [])
+            if name != b"content-length"
+        )
+        headers.append((b"content-encoding", self.encoding.encode()))
+
+        if more_body:
+            # Streaming: chunked transfer, compressed as chunks arrive
+            await self.send({**self.start_message, "headers": headers})
+            return
+
+        data = await self._compress(body)
+        tail = self.encoder.finish()
+        headers.append((b"content-length", str(len(data) + len(tail)).encode()))
+        await self.send({**self.start_message, "headers": headers})
+        await self.send({"type": "http.response.body", "body": data + tail, "more_body": False})
+        self._record(len(tail))
+
+    async def _compress(self, body: bytes) -> bytes:
+        self.original_size += len(body)
+        if len(body) >= THREAD_MIN_SIZE:
+            data = await asyncio.to_thread(self.encoder.compress, body)
+        else:
+            data = self.encoder.compress(body)
+        self.compressed_size += len(data)
+        return data
+
+    def _record(self, tail: int) -> None:
+        # _compress() counted everything but the compressor's final flush
+        metrics.COMPRESSION_BYTES.labels(self.encoding, "original").inc(self.original_size)
+        metrics.COMPRESSION_BYTES.labels(self.encoding, "compressed").inc(self.compressed_size + tail)
+
+def compression_settings() -> dict:
+    """
+    Middleware arguments from the environment variables above
+    """
+    return {
+        "encodings": tuple(e.strip() for e in os.getenv("COMPRESSION_ENCODINGS", "br,gzip").split(",") if e.strip()),
+        "min_size": int(os.getenv("COMPRESSION_MIN_SIZE", 1024)),
+        "gzip_level": int(os.getenv("GZIP_LEVEL", 6)),
+        "brotli_quality": int(os.getenv("BROTLI_QUALITY", 4))
+    }
@@ -0,0 +1,574 @@
+import json
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+from app.services.webhook import serialize_webhook_request, get_webhook_requests_since
+from app.services.storage import Storage
+from app.services.filters import RequestFilter, compile_filter
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# What to do when a subscriber's outbound queue is full
+OVERFLOW_COALESCE = "coalesce"
+OVERFLOW_DISCONNECT = "disconnect"
+
+# Sequence numbers remembered per subscriber to drop events it was already sent
+SEEN_WINDOW = 1000
+
+def build_request_event(request_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the live event announcing a captured request
+
+    Args:
+        request_doc: Saved request document
+
+    Returns:
+        Dict: "new_request" event carrying the serialized row and its sequence number
+    """
+    return {
+        "event": "new_request",
+        "seq": request_doc.get("seq"),
+        "request_id": request_doc.get("id"),
+        "method": request_doc.get("method", "UNKNOWN"),
+        "request": serialize_webhook_request(request_doc)
+    }
+
+class Subscriber:
+    """
+    A live-stream client with a bounded outbound queue
+
+    Producers call offer(), which never blocks. For websockets a writer task
+    drains the queue; SSE responses read it with next_frame(). A slow client
+    only delays itself: when its queue is full the overflow policy either
+    coalesces the missed events into a single "new_requests" count or
+    disconnects the client.
+
+    Events are not always published in sequence order (two captures can
+    commit in either order), so duplicates are dropped by remembering the
+    sequence numbers already sent rather than by comparing with the newest.
+    """
+
+    def __init__(
+        self,
+        websocket: Optional[WebSocket] = None,
+        max_queue: int = 100,
+        overflow_policy: str = OVERFLOW_COALESCE,
+        endpoint: str = "websocket"
+    ):
+        self.websocket = websocket
+        self.endpoint = endpoint
+        self.overflow_policy = overflow_policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.coalesced = 0
+        self.closed = False
+        self.last_seq: Optional[int] = None
+        self.event_filter: Optional[RequestFilter] = None
+        self._replayed: deque = deque()
+        self._seen: set = set()
+        self._seen_order: deque = deque()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self, last_seq: Optional[int] = None, replayed: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Start delivering, sending replayed events before anything queued live
+
+        Args:
+            last_seq: Newest sequence number the client already has
+            replayed: Events to send first (missed while the client was away)
+        """
+        self.last_seq = last_seq
+        self._replayed.extend(replayed or [])
+        if self.websocket is not None:
+            self._writer = asyncio.create_task(self._write())
+
+    def set_filter(self, spec: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply a "subscribe" command sent by the client
+
+        Args:
+            spec: Filter specification (see compile_filter); empty clears the filter
+
+        Returns:
+            Dict: Reply to send, "subscribed" or "error"
+        """
+        try:
+            self.event_filter = compile_filter(spec)
+        except ValueError as e:
+            return {"event": "error", "message": str(e)}
+        return {"event": "subscribed", "filters": spec or {}}
+
+    def offer(self, message: Dict[str, Any], text: Optional[str] = None) -> bool:
+        """
+        Queue a message without waiting
+
+        Args:
+            message: Message to send
+            text: Pre-serialized message, to serialize once for many subscribers
+
+        Returns:
+            bool: True if queued, False if dropped or coalesced
+        """
+        if self.closed:
+            return False
+
+        try:
+            self.queue.put_nowait((message, text or json.dumps(message, default=str)))
+            return True
+        except asyncio.QueueFull:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                logger.warning("Disconnecting slow live-stream client: outbound queue full")
+                self.close(code=1013, reason="Client too slow")
+            elif message.get("event") == "new_request":
+                self.coalesced += 1
+            elif message.get("event") == "batch":
+                self.coalesced += message.get("count", 0)
+            return False
+
+    async def next_frame(self) -> Optional[Tuple[Dict[str, Any], str]]:
+        """
+        Wait for the next frame to send
+
+        Returns:
+            Tuple: (message, serialized text), or None once the subscriber is closed
+        """
+        while not self.closed:
+            if self._replayed:
+                message = self._replayed.popleft()
+                text = json.dumps(message, default=str)
+            elif self.coalesced and self.queue.empty():
+                # Once caught up, tell the client how many events it missed
+                count, self.coalesced = self.coalesced, 0
+                message = {"event": "new_requests", "count": count}
+                return message, json.dumps(message)
+            else:
+                message, text = await self.queue.get()
+                if message is None:
+                    return None
+
+            # Skip events the client already has (e.g. both replayed and queued live)
+            seq = message.get("seq")
+            if seq is not None:
+                if message.get("event") == "batch":
+                    events = [event for event in message["events"] if self._unseen(event.get("seq"))]
+                    if not events:
+                        continue
+                    if len(events) < len(message["events"]):
+                        message = dict(
+                            message,
+                            events=events,
+                            count=sum(1 for event in events if event.get("event") == "new_request")
+                        )
+                        text = json.dumps(message, default=str)
+                elif not self._unseen(seq):
+                    continue
+                self.last_seq = seq if self.last_seq is None else max(self.last_seq, seq)
+
+            return message, text
+
+        return None
+
+    def _unseen(self, seq: Optional[int]) -> bool:
+        # Remember the last SEEN_WINDOW sequence numbers sent
+        if seq is None:
+            return True
+        if seq in self._seen:
+            return False
+        self._seen.add(seq)
+        self._seen_order.append(seq)
+        if len(self._seen_order) > SEEN_WINDOW:
+            self._seen.discard(self._seen_order.popleft())
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop delivering, dropping anything still queued
+        """
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+
+        # Wake a pending next_frame() with the end-of-stream marker
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait((None, None))
+
+    def close(self, code: int = 1000, reason: str = "") -> None:
+        """
+        Stop delivering and close the client connection in the background
+        """
+        if self.closed:
+            return
+        self.stop()
+        if self.websocket is not None:
+            asyncio.create_task(self._close_websocket(code, reason))
+
+    async def _close_websocket(self, code: int, reason: str) -> None:
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                frame = await self.next_frame()
+                if frame is None:
+                    return
+                await self.websocket.send_text(frame[1])
+        except asyncio.CancelledError:
+            raise
+        except Exception as ws_error:
+            logger.error(f"Error sending websocket message: {ws_error}")
+            self.closed = True
+
+class ConnectionManager:
+    """
+    Registry of the websockets connected to this worker, grouped by username
+
+    Each username with at least one local connection gets a single watcher task.
+    The broker pushes events into the watcher's inbox and the watcher offers them
+    to every subscriber of that user, so publishing is O(1) and never blocks on
+    a client, and the cost of an idle user is one sleeping task. Under load the
+    watcher coalesces events into one "batch" frame per flush interval. The
+    inbox is bounded too: events arriving while it is full are counted and sent
+    on as one "new_requests" event, after which clients fetch the changes.
+    """
+
+    def __init__(self):
+        self.active_connections: Dict[str, List[Subscriber]] = {}
+        self._inboxes: Dict[str, asyncio.Queue] = {}
+        self._inbox_missed: Dict[str, int] = {}
+        self._watchers: Dict[str, asyncio.Task] = {}
+        self._db: Optional[Storage] = None
+        self._poll_interval = 0.0
+        self._max_queue = 100
+        self._inbox_size = 1000
+        self._overflow_policy = OVERFLOW_COALESCE
+        self._flush_interval = 0.1
+        self._batch_max = 500
+        self._replay_size = 200
+        self._replay_users = 1000
+        self._replay_logs: "OrderedDict[str, deque]" = OrderedDict()
+
+    def configure(
+        self,
+        db: Storage,
+        poll_interval: float = 0.0,
+        max_queue: int = 100,
+        overflow_policy: str = OVERFLOW_COALESCE,
+        flush_interval: float = 0.1,
+        batch_max: int = 500,
+        replay_size: int = 200,
+        replay_users: int = 1000,
+        inbox_size: int = 1000
+    ) -> None:
+        """
+        Configure the polling fallback, batching and per-connection backpressure
+
+        Args:
+            db: Storage backend
+            poll_interval: Seconds between checks for requests that were not
+                published through the broker; 0 disables polling (push only)
+            max_queue: Outbound frames buffered per connection
+            overflow_policy: "coalesce" or "disconnect" when a queue is full
+            flush_interval: Minimum seconds between frames sent to a user
+            batch_max: Maximum events carried by one batch frame
+            replay_size: Recent events kept per user for resuming streams
+            replay_users: Users with a replay log kept in memory (least recently
+                active are evicted first)
+            inbox_size: Events buffered per user while the watcher is busy
+        """
+        self._db = db
+        self._poll_interval = poll_interval
+        self._max_queue = max_queue
+        self._flush_interval = flush_interval
+        self._batch_max = batch_max
+        self._replay_size = replay_size
+        self._replay_users = replay_users
+        self._inbox_size = inbox_size
+        if overflow_policy not in (OVERFLOW_COALESCE, OVERFLOW_DISCONNECT):
+            logger.warning(f"Unknown overflow policy '{overflow_policy}', using {OVERFLOW_COALESCE}")
+            overflow_policy = OVERFLOW_COALESCE
+        self._overflow_policy = overflow_policy
+
+    async def connect(
+        self,
+        username: str,
+        websocket: Optional[WebSocket] = None,
+        last_seq: Optional[int] = None,
+        event_filter: Optional[RequestFilter] = None,
+        endpoint: str = "websocket"
+    ) -> Subscriber:
+        """
+        Register a live-stream client, starting the user's watcher if needed
+
+        Args:
+            username: Username to subscribe to
+            websocket: Accepted websocket, or None for a stream (SSE) consumer
+                that reads frames with Subscriber.next_frame()
+            last_seq: Sequence number of the last event the client received;
+                missed events are replayed first, or a "reset" event is sent
+                if they can no longer be replayed
+            event_filter: Compiled filter; only matching requests are queued
+            endpoint: Name of the endpoint serving the client, for metrics
+
+        Returns:
+            Subscriber: Handle used to queue messages and to disconnect
+        """
+        subscriber = Subscriber(websocket, self._max_queue, self._overflow_policy, endpoint)
+        subscriber.event_filter = event_filter
+        self.active_connections.setdefault(username, []).append(subscriber)
+
+        if username not in self._watchers:
+            self._inboxes[username] = asyncio.Queue(maxsize=self._inbox_size)
+            self._watchers[username] = asyncio.create_task(self._watch(username))
+
+        # Registered before replaying so nothing published meanwhile is lost;
+        # the subscriber drops the duplicates by sequence number
+        replayed = None
+        if last_seq is not None:
+            try:
+                replayed = await self.replay(username, last_seq)
+            except Exception as e:
+                logger.error(f"Error replaying events for username {username}: {e}")
+            if replayed is None:
+                replayed = [{"event": "reset"}]
+            elif event_filter is not None:
+                replayed = [event for event in replayed if event_filter.matches(event)]
+
+        subscriber.start(last_seq, replayed)
+        return subscriber
+
+    def disconnect(self, username: str, subscriber: Optional[Subscriber]) -> None:
+        """
+        Remove a subscriber, stopping the user's watcher once it has no connections left
+        """
+        connections = self.active_connections.get(username)
+        if subscriber is None or not connections or subscriber not in connections:
+            return
+
+        connections.remove(subscriber)
+        subscriber.stop()
+
+        if not connections:
+            del self.active_connections[username]
+            self._stop_watcher(username)
+
+    def broadcast(self, username: str, message: Dict[str, Any]) -> None:
+        """
+        Hand a message to the user's watcher without waiting
+
+        Used as the broker handler. Sequenced events are also appended to the
+        user's replay log. Users without local connections have no inbox, so
+        nothing else is done for them. When the inbox is full the event is
+        only counted (see _watch).
+        """
+        if message.get("seq") is not None:
+            self._record(username, message)
+        elif message.get("event") == "new_requests":
+            # Bulk imports are not in the replay log; reconnecting clients read storage instead
+            self._replay_logs.pop(username, None)
+
+        inbox = self._inboxes.get(username)
+        if inbox is None:
+            return
+        try:
+            inbox.put_nowait(message)
+        except asyncio.QueueFull:
+            missed = self._inbox_missed.get(username, 0)
+            if message.get("event") == "new_request":
+                missed += 1
+            elif message.get("event") in ("batch", "new_requests"):
+                missed += message.get("count", 0)
+            self._inbox_missed[username] = missed
+
+    def connection_counts(self) -> Dict[Tuple[str], int]:
+        """
+        Open connections by endpoint (for the live_connections gauge)
+        """
+        counts: Dict[Tuple[str], int] = {}
+        for connections in self.active_connections.values():
+            for subscriber in connections:
+                counts[(subscriber.endpoint,)] = counts.get((subscriber.endpoint,), 0) + 1
+        return counts
+
+    def queue_depths(self) -> Dict[Tuple[str], int]:
+        """
+        Events waiting in watcher inboxes and subscriber queues (for the live_queue_depth gauge)
+        """
+        return {
+            ("inbox",): sum(inbox.qsize() for inbox in self._inboxes.values()),
+            ("subscriber",): sum(
+                subscriber.queue.qsize()
+                for connections in self.active_connections.values()
+                for subscriber in connections
+            )
+        }
+
+    async def replay(self, username: str, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the events published after a sequence number, oldest first
+
+        Served from the in-memory replay log when it covers the gap, otherwise
+        from the stored requests. The log is in publishing order, so events
+        published after the client's newest one are replayed as well: a lower
+        sequence number that committed late would otherwise be missed.
+
+        Args:
+            username: Username to replay events for
+            last_seq: Last sequence number the client received
+
+        Returns:
+            List[Dict]: Missed events, or None if too many were missed to replay
+        """
+        log = self._replay_logs.get(username)
+        if log and log[0]["seq"] <= last_seq + 1:
+            position = None
+            for index, message in enumerate(log):
+                if message["seq"] == last_seq:
+                    position = index
+            return [
+                message for index, message in enumerate(log)
+                if message["seq"] > last_seq or (position is not None and index > position)
+            ]
+
+        if self._db is None:
+            return None
+
+        missed = await get_webhook_requests_since(self._db, username, last_seq, limit=self._replay_size + 1)
+        if len(missed) > self._replay_size:
+            return None
+        return [build_request_event(request_doc) for request_doc in missed]
+
+    async def close(self) -> None:
+        """
+        Cancel every watcher and writer (called on application shutdown)
+        """
+        for username, connections in list(self.active_connections.items()):
+            for subscriber in list(connections):
+                self.disconnect(username, subscriber)
+
+    def _record(self, username: str, message: Dict[str, Any]) -> None:
+        log = self._replay_logs.get(username)
+        if log is None:
+            log = self._replay_logs[username] = deque(maxlen=self._replay_size)
+            if len(self._replay_logs) > self._replay_users:
+                self._replay_logs.popitem(last=False)
+        else:
+            self._replay_logs.move_to_end(username)
+        log.append(message)
+
+    def _stop_watcher(self, username: str) -> None:
+        self._inboxes.pop(username, None)
+        self._inbox_missed.pop(username, None)
+        watcher = self._watchers.pop(username, None)
+        if watcher:
+            watcher.cancel()
+
+    async def _watch(self, username: str) -> None:
+        inbox = self._inboxes[username]
+        loop = asyncio.get_running_loop()
+        last_request_id = None
+        last_flush = 0.0
+        polling = self._poll_interval > 0 and self._db is not None
+
+        if polling:
+            # Start from the current latest request so it is not announced as new
+            try:
+                latest = await self._poll_latest(username, None)
+                if latest:
+                    last_request_id = latest["request_id"]
+            except Exception as e:
+                logger.error(f"Error seeding watcher for username {username}: {e}")
+
+        while True:
+            try:
+                if polling:
+                    try:
+                        message = await asyncio.wait_for(inbox.get(), timeout=self._poll_interval)
+                    except asyncio.TimeoutError:
+                        message = await self._poll_latest(username, last_request_id)
+                        if message is None:
+                            continue
+                else:
+                    message = await inbox.get()
+
+                # An idle user is flushed immediately; under load at most one
+                # frame per flush interval is sent and the rest accumulate
+                wait = last_flush + self._flush_interval - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                batch = [message]
+                while not inbox.empty():
+                    batch.append(inbox.get_nowait())
+                last_flush = loop.time()
+
+                # Events dropped while the inbox was full (any kind, deletions
+                # included) are announced as a count; clients then fetch the changes
+                missed = self._inbox_missed.pop(username, None)
+                if missed is not None:
+                    batch.append({"event": "new_requests", "count": missed})
+
+                for event in batch:
+                    if event.get("event") == "new_request":
+                        last_request_id = event.get("request_id")
+
+                started = metrics.now()
+                self._offer_batch(username, batch)
+                metrics.FANOUT_DURATION.observe(metrics.now() - started)
+                metrics.FANOUT_EVENTS.inc(len(batch))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in watcher for username {username}: {e}")
+
+    def _build_frame(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if len(batch) == 1:
+            return batch[0]
+
+        count = sum(1 for event in batch if event.get("event") == "new_request")
+        frame = {"event": "batch", "count": count, "events": batch[-self._batch_max:]}
+
+        # The batch resumes from its newest event
+        seqs = [event["seq"] for event in batch if event.get("seq") is not None]
+        if seqs:
+            frame["seq"] = max(seqs)
+        if len(batch) > self._batch_max:
+            # Oldest events were cut; the client reloads instead of showing gaps
+            frame["truncated"] = True
+        return frame
+
+    async def _poll_latest(self, username: str, last_request_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        latest_request = await self._db.latest_request(username)
+
+        if not latest_request or latest_request.get("id") == last_request_id:
+            return None
+
+        return build_request_event(latest_request)
+
+    def _offer_batch(self, username: str, batch: List[Dict[str, Any]]) -> None:
+        # Subscribers sharing a filter (compiled filters are interned) get the
+        # same frame, so each distinct filter is evaluated and serialized once
+        groups: Dict[Optional[RequestFilter], List[Subscriber]] = {}
+        for subscriber in self.active_connections.get(username, []):
+            groups.setdefault(subscriber.event_filter, []).append(subscriber)
+
+        for event_filter, subscribers in groups.items():
+            events = batch if event_filter is None else [event for event in batch if event_filter.matches(event)]
+            if not events:
+                continue
+
+            frame = self._build_frame(events)
+            text = json.dumps(frame, default=str)
+            for subscriber in subscribers:
+                subscriber.offer(frame, text)
+
+# Shared by the webhook and viewer routers
+manager = ConnectionManager()
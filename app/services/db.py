@@ -1,10 +1,175 @@
-from fastapi import Request, WebSocket
-from motor.motor_asyncio import AsyncIOMotorDatabase
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from fastapi import FastAPI, Request, WebSocket
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.write_concern import WriteConcern
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from pymongo import monitoring
 import logging
 
+from app.services.storage import Storage, MongoStorage, MemoryStorage, SQLiteStorage
+from app.services.metrics import MONGO_POOL_CONNECTIONS, MONGO_POOL_CHECKOUT_FAILURES
+from app.services.versions import change_versions
+
 logger = logging.getLogger(__name__)
 
-async def get_db(request: Request) -> AsyncIOMotorDatabase:
+# Upper bound for viewer and statistics queries, so a slow query fails instead of piling up
+READ_MAX_TIME_MS = int(os.getenv("MONGO_READ_MAX_TIME_MS", 5000))
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """
+    Track open and checked-out connections of one client's pools
+
+    Pool events arrive on PyMongo's threads, hence the lock.
+    """
+
+    def __init__(self, pool: str):
+        self.pool = pool
+        self.open = 0
+        self.checked_out = 0
+        self._lock = threading.Lock()
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def connection_checked_out(self, event) -> None:
+        with self._lock:
+            self.checked_out += 1
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event) -> None:
+        MONGO_POOL_CHECKOUT_FAILURES.labels(self.pool, event.reason).inc()
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+def pool_stats(listeners: Dict[str, MongoPoolListener]) -> Dict[Tuple[str, str], int]:
+    """
+    Connection counts for the mongodb_pool_connections gauge
+    """
+    stats = {}
+    for name, listener in listeners.items():
+        stats[(name, "open")] = listener.open
+        stats[(name, "checked_out")] = listener.checked_out
+        stats[(name, "idle")] = listener.open - listener.checked_out
+    return stats
+
+def create_storage() -> Optional[Storage]:
+    """
+    Create the storage engine selected by STORAGE_BACKEND, for backends other than Mongo
+    
+    Returns:
+        Storage: "memory" or "sqlite" storage, or None for "mongo" (the default)
+    """
+    backend = os.getenv("STORAGE_BACKEND", "mongo").lower()
+    
+    if backend == "memory":
+        return MemoryStorage(max_requests_per_user=int(os.getenv("MEMORY_MAX_REQUESTS_PER_USER", 10000)))
+    if backend == "sqlite":
+        return SQLiteStorage(os.getenv("SQLITE_PATH", "webhooks.db"))
+    if backend != "mongo":
+        logger.warning(f"Unknown STORAGE_BACKEND '{backend}', using MongoDB")
+    return None
+
+def connect_databases(app: FastAPI) -> None:
+    """
+    Create the storage used by each kind of operation
+    
+    - app.storage: default settings (user management, deletes)
+    - app.storage_ingest: webhook captures, relaxed write concern (MONGO_INGEST_WRITE_CONCERN,
+      default w=1 without waiting for the journal)
+    - app.storage_read: viewer and statistics reads (MONGO_READ_PREFERENCE, default
+      secondaryPreferred), bounded by MONGO_READ_MAX_TIME_MS
+    - app.storage_export: exports, on a separate client with its own small pool
+      (MONGO_EXPORT_POOL_SIZE) so long exports cannot take the connections webhooks need
+    
+    User lookups of the read and export storage stay on the primary: with a
+    lagging secondary, a user created a moment ago would otherwise be "not
+    found". Only the request scans go to secondaries.
+    
+    The memory and SQLite engines use one storage for all of them.
+    app.mongodb is the raw Motor database, or None when MongoDB is not used.
+    
+    Args:
+        app: FastAPI application to attach the storage to
+    """
+    storage = create_storage()
+    if storage is not None:
+        app.mongodb_client = app.mongodb_export_client = app.mongodb = None
+        app.storage = app.storage_ingest = app.storage_read = app.storage_export = storage
+        return
+    
+    uri = os.getenv("MONGO_URI", "mongodb://mongodb:27017")
+    name = os.getenv("MONGO_DB", "webhook_db")
+    
+    read_preference = make_read_preference(
+        read_pref_mode_from_name(os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred")), None
+    )
+    ingest_w = os.getenv("MONGO_INGEST_WRITE_CONCERN", "1")
+    
+    listeners = {"main": MongoPoolListener("main"), "export": MongoPoolListener("export")}
+    MONGO_POOL_CONNECTIONS.set_function(lambda: pool_stats(listeners))
+    
+    app.mongodb_client = AsyncIOMotorClient(
+        uri,
+        maxPoolSize=int(os.getenv("MONGO_POOL_SIZE", 100)),
+        event_listeners=[listeners["main"]]
+    )
+    app.mongodb = app.mongodb_client[name]
+    app.storage = MongoStorage(app.mongodb)
+    app.storage_ingest = MongoStorage(app.mongodb.with_options(
+        write_concern=WriteConcern(w=int(ingest_w) if ingest_w.isdigit() else ingest_w, j=False)
+    ))
+    app.storage_read = MongoStorage(
+        app.mongodb.with_options(read_preference=read_preference),
+        max_time_ms=READ_MAX_TIME_MS,
+        users_db=app.mongodb
+    )
+    
+    app.mongodb_export_client = AsyncIOMotorClient(
+        uri,
+        maxPoolSize=int(os.getenv("MONGO_EXPORT_POOL_SIZE", 4)),
+        event_listeners=[listeners["export"]]
+    )
+    app.storage_export = MongoStorage(
+        app.mongodb_export_client[name].with_options(read_preference=read_preference),
+        users_db=app.mongodb
+    )
+
+async def close_databases(app: FastAPI) -> None:
+    """
+    Close the storage and clients created by connect_databases
+    """
+    await app.storage.close()
+    if app.mongodb_client is not None:
+        app.mongodb_export_client.close()
+        app.mongodb_client.close()
+
+async def get_db(request: Request) -> Storage:
     """
     Get database connection from request app state
     
@@ -12,11 +177,67 @@ async def get_db(request: Request) -> AsyncIOMotorDatabase:
         request: FastAPI request object
         
     Returns:
-        AsyncIOMotorDatabase: MongoDB database connection
+        Storage: Storage backend
+    """
+    return request.app.storage
+
+async def get_ingest_db(request: Request) -> Storage:
+    """
+    Get the database handle for webhook captures (relaxed write concern)
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Storage: Storage backend
+    """
+    return request.app.storage_ingest
+
+async def get_read_db(request: Request) -> Storage:
+    """
+    Get the database handle for viewer and statistics reads (requests may be
+    read from secondaries, users always come from the primary)
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Storage: Storage backend
+    """
+    return request.app.storage_read
+
+async def get_tagged_read_db(request: Request) -> Storage:
+    """
+    Get the database handle for reads answered with an ETag
+    
+    A user's ETag changes as soon as the change event arrives, so what it
+    tags is read from the primary: a lagging secondary would return the old
+    data under the new version, and later polls would keep getting 304s for
+    it. Without ETags this is the same as get_read_db.
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Storage: Storage backend
+    """
+    if change_versions.enabled:
+        return request.app.storage
+    return request.app.storage_read
+
+async def get_export_db(request: Request) -> Storage:
+    """
+    Get the database handle for exports (dedicated connection pool)
+    
+    Args:
+        request: FastAPI request object
+        
+    Returns:
+        Storage: Storage backend
     """
-    return request.app.mongodb
+    return request.app.storage_export
 
-async def get_db_websocket(websocket: WebSocket) -> AsyncIOMotorDatabase:
+async def get_db_websocket(websocket: WebSocket) -> Storage:
     """
     Get database connection from websocket app state
     
@@ -24,6 +245,6 @@ async def get_db_websocket(websocket: WebSocket) -> AsyncIOMotorDatabase:
         websocket: FastAPI WebSocket connection
         
     Returns:
-        AsyncIOMotorDatabase: MongoDB database connection
+        Storage: Storage backend
     """
-    return websocket.app.mongodb
\ No newline at end of file
+    return websocket.app.storage
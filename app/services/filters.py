@@ -0,0 +1,199 @@
+import re
+import json
+import fnmatch
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple, Pattern
+
+class RequestFilter:
+    """
+    Compiled subscription filter for live request events
+
+    All conditions must match. Events other than "new_request" (pings, resets)
+    always pass so every subscriber keeps receiving control messages.
+    """
+
+    def __init__(
+        self,
+        methods: Optional[frozenset] = None,
+        path: Optional[Pattern] = None,
+        headers: Tuple[Tuple[str, Pattern], ...] = (),
+        body: Tuple[Tuple[Tuple[str, ...], Pattern], ...] = ()
+    ):
+        self.methods = methods
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        """
+        Check whether a live event should be delivered
+
+        Args:
+            event: Live event, as built by build_request_event
+
+        Returns:
+            bool: True if the event passes the filter
+        """
+        if event.get("event") != "new_request":
+            return True
+
+        request = event.get("request") or {}
+
+        if self.methods is not None and request.get("method", "").upper() not in self.methods:
+            return False
+
+        if self.path is not None:
+            path = request.get("path", "")
+            if not (self.path.match(path) or self.path.match(relative_path(path, request.get("username", "")))):
+                return False
+
+        if self.headers:
+            # Header names are case-insensitive
+            request_headers = {name.lower(): value for name, value in (request.get("headers") or {}).items()}
+            for name, pattern in self.headers:
+                value = request_headers.get(name)
+                if value is None or not pattern.match(str(value)):
+                    return False
+
+        for field_path, pattern in self.body:
+            value = _lookup(request.get("body"), field_path)
+            if value is _MISSING or not pattern.match(_to_text(value)):
+                return False
+
+        return True
+
+_MISSING = object()
+
+def relative_path(path: str, username: str) -> str:
+    """
+    Path below the user's webhook prefix: "/api/@bob/orders/1" -> "/orders/1"
+
+    Paths outside the prefix are returned unchanged.
+    """
+    prefix = f"/api/@{username}"
+    if username and path.startswith(prefix):
+        return path[len(prefix):] or "/"
+    return path
+
+def _lookup(body: Any, field_path: Tuple[str, ...]) -> Any:
+    value = body
+    for key in field_path:
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return _MISSING
+    return value
+
+def _to_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+def compile_glob(pattern: str) -> Pattern:
+    """
+    Compile a shell-style glob ("/orders/*") into a regular expression matching the whole value
+    """
+    return re.compile(fnmatch.translate(pattern))
+
+@lru_cache(maxsize=1024)
+def _compile(
+    methods: Optional[Tuple[str, ...]],
+    path: Optional[str],
+    headers: Tuple[Tuple[str, str], ...],
+    body: Tuple[Tuple[str, str], ...]
+) -> RequestFilter:
+    return RequestFilter(
+        methods=frozenset(methods) if methods else None,
+        path=compile_glob(path) if path else None,
+        headers=tuple((name, compile_glob(value)) for name, value in headers),
+        body=tuple((tuple(field.split(".")), compile_glob(value)) for field, value in body)
+    )
+
+def compile_filter(spec: Optional[Dict[str, Any]]) -> Optional[RequestFilter]:
+    """
+    Compile a filter specification
+
+    Identical specifications return the same RequestFilter object, so
+    subscribers sharing a filter can be served with one serialized frame.
+
+    Args:
+        spec: Dict with any of "method" (string or list), "path" (glob),
+            "headers" ({name: value glob}) and "body" ({dotted.field: value glob})
+
+    Returns:
+        RequestFilter: Compiled filter, or None if the spec has no conditions
+
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    if not spec:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError("Filters must be an object")
+
+    methods = spec.get("method")
+    if isinstance(methods, str):
+        methods = [m.strip() for m in methods.split(",") if m.strip()]
+    if methods is not None and not isinstance(methods, list):
+        raise ValueError("'method' must be a string or a list of strings")
+
+    path = spec.get("path")
+    if path is not None and not isinstance(path, str):
+        raise ValueError("'path' must be a glob string")
+
+    headers = spec.get("headers") or {}
+    body = spec.get("body") or {}
+    if not isinstance(headers, dict) or not isinstance(body, dict):
+        raise ValueError("'headers' and 'body' must be objects")
+
+    if not (methods or path or headers or body):
+        return None
+
+    return _compile(
+        tuple(sorted(str(m).upper() for m in methods)) if methods else None,
+        path or None,
+        tuple(sorted((str(k).lower(), str(v)) for k, v in headers.items())),
+        tuple(sorted((str(k), str(v)) for k, v in body.items()))
+    )
+
+def filter_spec_from_query(method: Optional[str], path: Optional[str], header: List[str], body: List[str]) -> Dict[str, Any]:
+    """
+    Build a filter specification from query parameters
+
+    Args:
+        method: Comma-separated methods, e.g. "POST,PUT"
+        path: Path glob, e.g. "/orders*"
+        header: "name:value-glob" entries
+        body: "dotted.field=value-glob" entries
+
+    Returns:
+        Dict: Specification accepted by compile_filter
+
+    Raises:
+        ValueError: If a header or body entry is malformed
+    """
+    spec: Dict[str, Any] = {}
+    if method:
+        spec["method"] = method
+    if path:
+        spec["path"] = path
+
+    if header:
+        spec["headers"] = {}
+        for entry in header:
+            name, sep, value = entry.partition(":")
+            if not sep or not name.strip():
+                raise ValueError(f"Invalid header filter '{entry}', expected name:value")
+            spec["headers"][name.strip()] = value.strip()
+
+    if body:
+        spec["body"] = {}
+        for entry in body:
+            field, sep, value = entry.partition("=")
+            if not sep or not field.strip():
+                raise ValueError(f"Invalid body filter '{entry}', expected field=value")
+            spec["body"][field.strip()] = value
+
+    return spec
@@ -0,0 +1,300 @@
+"""
+Bulk import of historical webhook requests from NDJSON
+
+Each line is a JSON object shaped like a captured request:
+
+    {"method": "POST", "path": "/orders/1", "headers": {...}, "query_params": {...},
+     "body": ..., "response": ..., "request_time": "2024-05-01T12:00:00Z",
+     "response_time": 12, "id": "..."}
+
+Only request_time is needed in practice (it defaults to the import time);
+path is relative to /api/@username, or a full /api/@<anyone>/... path that
+is moved under the importing user. request_time is an ISO 8601 string or
+Unix seconds; aware times are converted to UTC.
+
+The body is read as it arrives (gzip is detected and inflated on the fly)
+and parsed line by line. Documents are written in unordered batches, each
+with one sequence-number reservation; the next batch is parsed while the
+previous one is written. Per-item work of the webhook path (retention,
+logging, live events) is done once for the whole import instead.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.services import metrics
+from app.services.storage import Storage
+from app.services.webhook import max_requests_per_user
+
+logger = logging.getLogger(__name__)
+
+# Documents per insert batch
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+
+# Longer lines are rejected (and skipped) without being buffered whole
+MAX_IMPORT_LINE_BYTES = int(os.getenv("MAX_IMPORT_LINE_BYTES", 1048576))
+
+# Line errors listed in the import report (all of them are counted)
+MAX_IMPORT_ERRORS = 100
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+_USER_PATH = re.compile(r"^/api/@[^/]*(/.*)?$")
+
+class GzipStream:
+    """
+    Incremental gzip decoder accepting concatenated members
+    """
+
+    def __init__(self):
+        self._inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def feed(self, chunk: bytes) -> bytes:
+        """
+        Raises:
+            ValueError: If the data is not valid gzip
+        """
+        try:
+            out = self._inflater.decompress(chunk)
+            while self._inflater.eof and self._inflater.unused_data:
+                rest = self._inflater.unused_data
+                self._inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                out += self._inflater.decompress(rest)
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip data: {e}")
+        return out
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    gzipped: Optional[bool] = None,
+    max_line: int = MAX_IMPORT_LINE_BYTES
+) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Split a (possibly gzipped) byte stream into lines as it arrives
+
+    Args:
+        chunks: Body chunks
+        gzipped: Whether the stream is gzip; None to detect it from the first bytes
+        max_line: Longest line accepted, in bytes
+
+    Yields:
+        (line number, line) pairs; the line is None when it was too long
+    """
+    decoder = GzipStream() if gzipped else None
+    buffer = bytearray()
+    line_no = 0
+    overlong = False
+    first = gzipped is None
+
+    async for chunk in chunks:
+        if first and chunk:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decoder = GzipStream()
+        if decoder is not None:
+            chunk = decoder.feed(chunk)
+        buffer += chunk
+
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_no += 1
+            yield line_no, None if overlong or end - start > max_line else bytes(buffer[start:end])
+            overlong = False
+            start = end + 1
+        del buffer[:start]
+
+        if len(buffer) > max_line:
+            # Drop the rest of this line as it arrives
+            overlong = True
+            buffer.clear()
+
+    if buffer or overlong:
+        line_no += 1
+        yield line_no, None if overlong else bytes(buffer)
+
+def _parse_time(value: Any) -> datetime:
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, bool):
+        raise ValueError("'request_time' must be an ISO 8601 string or Unix seconds")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError("'request_time' must be an ISO 8601 string or Unix seconds")
+
+def build_import_doc(record: Any, username: str) -> Dict[str, Any]:
+    """
+    Build a request document from one NDJSON record
+
+    Raises:
+        ValueError: If the record is not an object or a field has the wrong type
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Line must be a JSON object")
+
+    path = record.get("path") or "/"
+    if not isinstance(path, str):
+        raise ValueError("'path' must be a string")
+    match = _USER_PATH.match(path)
+    relative = (match.group(1) or "") if match else ("/" + path.lstrip("/") if path != "/" else "")
+
+    headers = record.get("headers") or {}
+    query_params = record.get("query_params") or {}
+    if not isinstance(headers, dict) or not isinstance(query_params, dict):
+        raise ValueError("'headers' and 'query_params' must be objects")
+
+    response_time = record.get("response_time") or 0
+    if isinstance(response_time, bool) or not isinstance(response_time, (int, float)):
+        raise ValueError("'response_time' must be a number of milliseconds")
+
+    return {
+        "id": str(record.get("id") or uuid.uuid4()),
+        "seq": None,
+        "username": username,
+        "method": str(record.get("method") or "POST").upper(),
+        "headers": {str(name): str(value) for name, value in headers.items()},
+        "path": f"/api/@{username}{relative}",
+        "query_params": query_params,
+        "body": record.get("body"),
+        "response": record.get("response"),
+        "request_time": _parse_time(record.get("request_time")),
+        "response_time": response_time
+    }
+
+async def _stop_on_bad_stream(lines, report: Dict[str, Any]):
+    # A corrupt gzip stream ends the import; what was read so far is kept
+    try:
+        async for item in lines:
+            yield item
+    except ValueError as e:
+        report["error"] = str(e)
+
+async def import_webhook_requests(
+    db: Storage,
+    username: str,
+    chunks: AsyncIterator[bytes],
+    gzipped: Optional[bool] = None,
+    max_requests: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Import an NDJSON stream of requests into a user's history
+
+    Args:
+        db: Storage backend
+        username: User receiving the requests (must exist)
+        chunks: Body chunks
+        gzipped: Whether the body is gzip; None to detect it
+        max_requests: Requests kept for the user afterwards (the oldest are
+            deleted once, at the end; capped by the storage's own limit);
+            defaults to the usual retention limit
+
+    Returns:
+        Dict: lines read, imported and failed counts, trimmed (deleted by
+            retention), the first line errors ({line, error}), timing, and
+            error when the body was not valid gzip
+
+    Raises:
+        HTTPException: If max_requests is negative (before the body is read)
+            or the user does not exist
+    """
+    if max_requests is not None and max_requests < 0:
+        raise HTTPException(status_code=400, detail="max_requests cannot be negative")
+
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"lines": 0, "imported": 0, "failed": 0, "trimmed": 0, "errors": []}
+
+    def fail(line_no: int, error: str) -> None:
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_IMPORT_ERRORS:
+            report["errors"].append({"line": line_no, "error": error})
+
+    async def write(batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+        # One sequence reservation and one unordered insert per batch
+        last = await db.allocate_seq_block(username, len(batch))
+        if last is None:
+            raise HTTPException(status_code=404, detail=f"User '{username}' not found")
+        first = last - len(batch) + 1
+        docs = []
+        for offset, (_, doc) in enumerate(batch):
+            doc["seq"] = first + offset
+            docs.append(doc)
+
+        errors = await db.insert_requests(docs)
+        for index, error in errors:
+            fail(batch[index][0], error)
+        report["imported"] += len(docs) - len(errors)
+        metrics.IMPORT_LINES.labels("imported").inc(len(docs) - len(errors))
+        metrics.IMPORT_LINES.labels("failed").inc(len(errors))
+
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    writing: Optional[asyncio.Task] = None
+    parse_failures = 0
+    try:
+        lines = iter_ndjson_lines(chunks, gzipped)
+        async for line_no, line in _stop_on_bad_stream(lines, report):
+            report["lines"] = line_no
+            if line is None:
+                parse_failures += 1
+                fail(line_no, f"Line longer than {MAX_IMPORT_LINE_BYTES} bytes")
+                continue
+            if not line.strip():
+                continue
+            try:
+                batch.append((line_no, build_import_doc(json.loads(line), username)))
+            except (ValueError, TypeError, OverflowError) as e:
+                parse_failures += 1
+                fail(line_no, str(e))
+                continue
+
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                # Parse the next batch while this one is written
+                if writing is not None:
+                    await writing
+                writing = asyncio.create_task(write(batch))
+                batch = []
+
+        if writing is not None:
+            await writing
+            writing = None
+        if batch:
+            await write(batch)
+    finally:
+        if writing is not None:
+            # The body stopped early: let the batch in flight finish
+            await asyncio.gather(writing, return_exceptions=True)
+        metrics.IMPORT_LINES.labels("failed").inc(parse_failures)
+
+    if max_requests is None:
+        max_requests = max_requests_per_user(db)
+    elif db.max_requests_per_user is not None:
+        # The storage's own limit still applies
+        max_requests = min(max_requests, db.max_requests_per_user)
+    if report["imported"]:
+        report["trimmed"] = await db.trim_requests(username, max_requests)
+
+    # Insert failures are reported after the parse failures of later lines
+    report["errors"].sort(key=lambda error: error["line"])
+    elapsed = time.perf_counter() - started
+    report["duration_seconds"] = round(elapsed, 3)
+    report["rate"] = round(report["imported"] / elapsed, 1) if elapsed > 0 else None
+    logger.info(
+        f"Imported {report['imported']} requests for {username} in {elapsed:.2f}s "
+        f"({report['failed']} failed, {report['trimmed']} trimmed by retention)"
+    )
+    return report
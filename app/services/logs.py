@@ -0,0 +1,252 @@
+"""
+Logging setup: records are queued on the calling thread and formatted and
+written by a background thread, so the event loop never blocks on stdout
+
+Configured through environment variables:
+    LOG_LEVEL        Root level (default INFO)
+    LOG_FORMAT       "text" (default) or "json" (one object per line)
+    LOG_SAMPLING     Per-logger share of INFO/DEBUG records kept, e.g.
+                     "app.routers.webhook=0.01,uvicorn.access=0.1";
+                     warnings and errors are always kept
+    LOG_QUEUE_SIZE   Records buffered for the writer thread; beyond that new
+                     records are dropped (default 10000)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.services.metrics import LOG_RECORDS_DROPPED
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Process id for JSON output (records are formatted in the process that created them)
+_pid = os.getpid()
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": _pid
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SampledLogger(logging.Logger):
+    """
+    Logger keeping a random share of its INFO and DEBUG records
+
+    The decision is taken in isEnabledFor(), before a record is created, so a
+    dropped line costs about as much as a disabled level. Warnings and errors
+    always pass. Existing loggers are switched to this class by
+    configure_logging().
+    """
+
+    sample_rate = 1.0
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.WARNING and random.random() >= self.sample_rate:
+            return False
+        return super().isEnabledFor(level)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue records without formatting them and drop them when the queue is full
+
+    The stock QueueHandler formats the message on the calling thread; here
+    the record is queued as is and the writer thread formats it. Log
+    arguments must therefore not be mutated after the logging call.
+    """
+
+    def __init__(self, record_queue: queue.Queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogWriter:
+    """
+    Background thread writing queued records
+
+    Everything queued since the last wake-up is formatted and written with a
+    single write and flush, then the thread sleeps for FLUSH_INTERVAL. Under
+    load it therefore takes the GIL a few times per second instead of once
+    per record.
+    """
+
+    # Records formatted per write at most
+    BATCH_SIZE = 1000
+
+    # Seconds between writes while records keep arriving
+    FLUSH_INTERVAL = 0.05
+
+    _STOP = object()
+
+    def __init__(self, record_queue: queue.Queue, formatter: logging.Formatter, stream):
+        self.queue = record_queue
+        self.formatter = formatter
+        self.stream = stream
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Write what is queued, then stop the thread
+        """
+        if self._thread is None:
+            return
+        self.queue.put(self._STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(record is self._STOP for record in batch)
+            lines = [self._format(record) for record in batch if record is not self._STOP]
+            if lines:
+                try:
+                    self.stream.write("\n".join(lines) + "\n")
+                    self.stream.flush()
+                except Exception:
+                    pass
+            if stop:
+                return
+            time.sleep(self.FLUSH_INTERVAL)
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return f"Unable to format log record from {record.name}: {e}"
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """
+    Parse a LOG_SAMPLING value ("logger=rate,...") into {logger: rate}
+    """
+    rates = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Ignoring invalid LOG_SAMPLING entry '{item}'", file=sys.stderr)
+    return rates
+
+# Writer of the current process (its thread does not survive fork)
+_listener: Optional[LogWriter] = None
+_listener_pid: Optional[int] = None
+_sampled_loggers: Dict[str, logging.Logger] = {}
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sampling: Optional[str] = None,
+    stream=None,
+    force: bool = False
+) -> None:
+    """
+    Route all logging through a queue drained by a writer thread
+
+    Safe to call more than once; a process forked from a configured one gets
+    its own writer thread. Arguments default to the environment variables
+    above.
+
+    Args:
+        level: Root log level
+        fmt: "text" or "json"
+        sampling: Per-logger sampling rates ("logger=rate,...")
+        stream: Output stream (default stdout)
+        force: Reconfigure even if this process is already configured
+    """
+    global _listener, _listener_pid, _pid
+
+    if _listener is not None and _listener_pid == os.getpid():
+        if not force:
+            return
+        _listener.stop()
+    _listener = None
+    _pid = os.getpid()
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "text")).lower()
+    sampling = os.getenv("LOG_SAMPLING", "") if sampling is None else sampling
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    record_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    listener = LogWriter(record_queue, formatter, stream or sys.stdout)
+
+    queue_handler = NonBlockingQueueHandler(record_queue)
+    LOG_RECORDS_DROPPED.set_function(lambda: queue_handler.dropped)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    # Neither format uses the caller's location, thread or process name; skip
+    # collecting them for every record (see "Optimization" in the logging docs)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    # Replace the sampling of a previous configuration
+    for logger in _sampled_loggers.values():
+        logger.__class__ = logging.Logger
+    _sampled_loggers.clear()
+    for name, rate in parse_sampling(sampling).items():
+        if rate < 1.0:
+            logger = logging.getLogger(name)
+            logger.__class__ = SampledLogger
+            logger.sample_rate = rate
+            _sampled_loggers[name] = logger
+
+    listener.start()
+    _listener, _listener_pid = listener, os.getpid()
+
+def shutdown_logging() -> None:
+    """
+    Write out queued records and stop the writer thread
+    """
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+atexit.register(shutdown_logging)
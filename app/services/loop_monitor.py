@@ -0,0 +1,103 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+from app.services.metrics import LOOP_LAG, LOOP_BLOCKED
+
+logger = logging.getLogger(__name__)
+
+class LoopMonitor:
+    """
+    Measures event loop lag and reports callbacks that block the loop
+
+    A task sleeps for `interval` and records how late it wakes up (the
+    scheduling delay every other callback sees too). Each wake-up is a
+    heartbeat; a watchdog thread checks the heartbeat and, when it is older
+    than interval + threshold, logs the stack of the loop thread, i.e. the
+    code that is blocking it, once per stall.
+    """
+
+    def __init__(self):
+        self.interval = 0.1
+        self.threshold = 0.25
+        self.last_lag = 0.0
+        self._heartbeat = 0.0
+        self._reported_heartbeat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self, interval: float = 0.1, threshold: float = 0.25) -> None:
+        """
+        Start monitoring the running loop; must be called from the loop thread
+
+        Args:
+            interval: Seconds between lag measurements
+            threshold: Seconds a callback may hold the loop before its stack is logged
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+
+        if threshold > 0:
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        """
+        Stop the measurement task and the watchdog thread
+        """
+        if self._watchdog is not None:
+            self._stop_event.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+
+            self._heartbeat = time.monotonic()
+            self.last_lag = lag
+            LOOP_LAG.observe(lag)
+
+            if self.threshold > 0 and lag >= self.threshold:
+                LOOP_BLOCKED.inc()
+                logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+    def _watch(self) -> None:
+        # Check several times per threshold so stalls are caught while they last
+        check_interval = max(self.threshold / 4, 0.01)
+        while not self._stop_event.wait(check_interval):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == self._reported_heartbeat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_heartbeat = heartbeat
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(f"Event loop blocked for more than {stalled * 1000:.0f} ms, in:\n{stack}")
+
+# One per worker process
+loop_monitor = LoopMonitor()
@@ -0,0 +1,395 @@
+import math
+import time
+from bisect import bisect_left
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from 50µs (in-memory operations) up to 10s (simulated delays)
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Read by callers to time a stage: start = now(); ...; histogram.observe(now() - start)
+now = time.perf_counter
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """
+    Base class for a metric family with optional labels
+
+    Children for each label combination are created on first use and cached,
+    so recording after the first call is a dict lookup plus an addition. The
+    event loop is single-threaded, so no locking is done.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str) -> Any:
+        """
+        Get the child for one combination of label values
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+class Counter(Metric):
+    """
+    Monotonically increasing count
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        """
+        Increment the unlabelled counter
+        """
+        self._default.value += amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in self._children.items()
+        ]
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets
+
+    Counts are kept per bucket (not cumulative) and summed when rendered, so
+    an observation is one bisect and three additions.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """
+        Record a value in the unlabelled histogram
+        """
+        self._default.observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Gauge(Metric):
+    """
+    Value read when the metrics are collected
+
+    The callback returns either a number (no labels) or a dict mapping label
+    value tuples to numbers, so nothing is recorded on the hot path.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Any]] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set_function(self, callback: Callable[[], Any]) -> None:
+        """
+        Set the callback that computes the current value(s)
+        """
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        if self.callback is None:
+            return []
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}"
+            for labels, sample in value.items()
+        ]
+
+class Registry:
+    """
+    Collection of metrics rendered together by the /metrics endpoint
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        """
+        blocks = []
+        for metric in self._metrics.values():
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # A failing gauge callback must not take the whole endpoint down
+                blocks.append(f"# {metric.name} unavailable: {_escape(str(e))}")
+        return "\n".join(blocks) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def histogram(
+    name: str,
+    documentation: str,
+    labelnames: Iterable[str] = (),
+    buckets: Tuple[float, ...] = LATENCY_BUCKETS
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def gauge(name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+# Webhook ingest path
+
+WEBHOOK_REQUESTS = counter(
+    "webhook_requests_total",
+    "Webhook requests handled, by method and response status",
+    ("method", "status")
+)
+WEBHOOK_DURATION = histogram(
+    "webhook_request_duration_seconds",
+    "Time to handle a webhook request, including the simulated delay"
+)
+WEBHOOK_STAGE_DURATION = histogram(
+    "webhook_stage_duration_seconds",
+    "Time spent in each stage of the webhook path",
+    ("stage",)
+)
+
+# Stage children resolved once so recording skips the label lookup
+STAGE_BODY_READ = WEBHOOK_STAGE_DURATION.labels("body_read")
+STAGE_USER_CONFIG = WEBHOOK_STAGE_DURATION.labels("get_user_config")
+STAGE_DELAY = WEBHOOK_STAGE_DURATION.labels("simulated_delay")
+STAGE_SEQ = WEBHOOK_STAGE_DURATION.labels("allocate_seq")
+STAGE_RETENTION = WEBHOOK_STAGE_DURATION.labels("retention")
+STAGE_INSERT = WEBHOOK_STAGE_DURATION.labels("insert")
+STAGE_PUBLISH = WEBHOOK_STAGE_DURATION.labels("publish")
+
+# Proxy mode
+
+UPSTREAM_REQUESTS = counter(
+    "upstream_requests_total",
+    "Webhook requests forwarded to a user's upstream, by outcome (status class, timeout, error or blocked)",
+    ("outcome",)
+)
+UPSTREAM_DURATION = histogram(
+    "upstream_request_duration_seconds",
+    "Time from forwarding a webhook request to receiving the upstream's full response"
+)
+WEBHOOK_OVERHEAD = histogram(
+    "webhook_overhead_seconds",
+    "Time spent handling a webhook request outside the upstream or the simulated delay, by mode (mock, proxy)",
+    ("mode",)
+)
+
+# Bulk import
+
+IMPORT_LINES = counter(
+    "import_lines_total",
+    "NDJSON lines of bulk imports, by outcome (imported, failed)",
+    ("outcome",)
+)
+
+# Admission control
+
+WEBHOOK_SHED = counter(
+    "webhook_shed_total",
+    "Webhook requests rejected before any storage access, by reason (rate_limit, concurrency, overload)",
+    ("reason",)
+)
+WEBHOOK_IN_FLIGHT = gauge(
+    "webhook_in_flight_requests",
+    "Webhook requests in progress on this worker"
+)
+INGEST_BACKLOG = gauge(
+    "webhook_ingest_backlog",
+    "Captures waiting on storage plus events waiting in the broker outbox"
+)
+
+# Username availability
+
+USERNAME_CHECKS = counter(
+    "username_checks_total",
+    "Username availability checks, by where they were answered (index or database)",
+    ("source",)
+)
+
+# Response compression
+
+COMPRESSION_BYTES = counter(
+    "http_compression_bytes_total",
+    "Response bytes before and after compression, by encoding",
+    ("encoding", "stage")
+)
+
+# Replay
+
+REPLAY_REQUESTS = counter(
+    "replay_requests_total",
+    "Captured requests replayed against a target, by outcome (status class or error)",
+    ("outcome",)
+)
+REPLAY_DURATION = histogram(
+    "replay_request_duration_seconds",
+    "Time from sending a replayed request to the end of the target's response"
+)
+
+# Live streams
+
+FANOUT_DURATION = histogram(
+    "live_fanout_duration_seconds",
+    "Time to filter, serialize and queue one batch for a user's live-stream subscribers"
+)
+FANOUT_EVENTS = counter(
+    "live_fanout_events_total",
+    "Events fanned out to live-stream subscribers"
+)
+ACTIVE_SOCKETS = gauge(
+    "live_connections",
+    "Open live-stream connections on this worker, by endpoint",
+    ("endpoint",)
+)
+QUEUE_DEPTH = gauge(
+    "live_queue_depth",
+    "Events waiting in this worker's live-stream queues, by queue",
+    ("queue",)
+)
+BROKER_DROPPED = gauge(
+    "broker_dropped_messages",
+    "Messages dropped because the broker outbox was full"
+)
+
+# MongoDB connection pools (fed by MongoPoolListener)
+
+MONGO_POOL_CONNECTIONS = gauge(
+    "mongodb_pool_connections",
+    "Connections in the MongoDB pools of this worker, by pool and state",
+    ("pool", "state")
+)
+MONGO_POOL_CHECKOUT_FAILURES = counter(
+    "mongodb_pool_checkout_failures_total",
+    "Failed MongoDB connection checkouts, by pool and reason",
+    ("pool", "reason")
+)
+
+# Logging
+
+LOG_RECORDS_DROPPED = gauge(
+    "log_records_dropped",
+    "Log records dropped because the logging queue was full"
+)
+
+# Event loop
+
+LOOP_LAG = histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the loop monitor should have woken up and when it did"
+)
+LOOP_BLOCKED = counter(
+    "event_loop_blocked_total",
+    "Times a single callback held the event loop longer than BLOCKING_THRESHOLD_MS"
+)
@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+import asyncio
+import cProfile
+import pstats
+import threading
+from collections import Counter
+from datetime import datetime
+from types import CodeType
+from typing import Dict, Any, List, Optional
+
+# Profiling modes
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+
+# Longest run accepted, in seconds
+MAX_DURATION = 300
+
+def _label(code: CodeType) -> str:
+    # Semicolons separate frames in the collapsed format
+    name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return name.replace(";", ":")
+
+class Profiler:
+    """
+    On-demand profiler for the event loop thread of this worker
+
+    Two modes:
+    - "sample": a background thread records the loop thread's stack every
+      interval. Overhead is one stack walk per sample; the result gives both
+      collapsed stacks (for flame graphs) and the top functions.
+    - "cprofile": deterministic profiling with cProfile on the loop thread.
+      Exact call counts, but slows the worker noticeably while it runs, and
+      has no collapsed stacks.
+
+    One run at a time; results are kept until the next start.
+    """
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.running = False
+        self.started_at: Optional[datetime] = None
+        self.duration = 0.0
+        self.interval = 0.01
+        self.elapsed = 0.0
+        self._started: Optional[float] = None
+        self._samples: Counter = Counter()
+        self._sample_count = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._profile: Optional[cProfile.Profile] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._done: Optional[asyncio.Event] = None
+
+    def start(self, duration: float, mode: str = MODE_SAMPLE, interval: float = 0.01) -> None:
+        """
+        Start profiling; must be called from the event loop thread
+
+        Args:
+            duration: Seconds before profiling stops by itself
+            mode: "sample" or "cprofile"
+            interval: Seconds between samples ("sample" mode)
+
+        Raises:
+            RuntimeError: If a run is already in progress
+            ValueError: If an argument is out of range
+        """
+        if self.running:
+            raise RuntimeError("A profiling run is already in progress")
+        if mode not in (MODE_SAMPLE, MODE_CPROFILE):
+            raise ValueError(f"Unknown mode '{mode}', expected '{MODE_SAMPLE}' or '{MODE_CPROFILE}'")
+        if not 0 < duration <= MAX_DURATION:
+            raise ValueError(f"Duration must be between 0 and {MAX_DURATION} seconds")
+        if not 0.001 <= interval <= 1:
+            raise ValueError("Interval must be between 1 and 1000 milliseconds")
+
+        self.mode = mode
+        self.duration = duration
+        self.interval = interval
+        self.elapsed = 0.0
+        self.started_at = datetime.utcnow()
+        self._samples = Counter()
+        self._sample_count = 0
+        self._profile = None
+
+        if mode == MODE_SAMPLE:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(),),
+                name="profiler",
+                daemon=True
+            )
+            self._thread.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+        loop = asyncio.get_running_loop()
+        self._done = asyncio.Event()
+        self._timer = loop.call_later(duration, self.stop)
+        self._started = time.perf_counter()
+        self.running = True
+
+    def stop(self) -> None:
+        """
+        Stop the current run (no-op if none); must be called from the event loop thread
+        """
+        if not self.running:
+            return
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if self.mode == MODE_SAMPLE:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        else:
+            self._profile.disable()
+
+        self.elapsed = time.perf_counter() - self._started
+        self.running = False
+        self._done.set()
+
+    async def wait(self) -> None:
+        """
+        Wait until the current run stops
+        """
+        if self.running:
+            await self._done.wait()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "running": self.running,
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "duration": self.duration,
+            "elapsed": round(time.perf_counter() - self._started if self.running else self.elapsed, 3),
+            "interval_ms": self.interval * 1000 if self.mode == MODE_SAMPLE else None,
+            "samples": self._sample_count if self.mode == MODE_SAMPLE else None
+        }
+
+    def collapsed(self) -> str:
+        """
+        Sampled stacks in the collapsed format read by flamegraph.pl and speedscope
+
+        Raises:
+            ValueError: If the last run did not use "sample" mode
+        """
+        if self.mode != MODE_SAMPLE:
+            raise ValueError("Collapsed stacks are only available in sample mode")
+
+        lines = [
+            f"{';'.join(_label(code) for code in stack)} {count}"
+            for stack, count in self._snapshot().most_common()
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def top(self, limit: int = 30) -> List[Dict[str, Any]]:
+        """
+        Functions with the highest cumulative time (time on the stack)
+
+        In sample mode times are estimated from the share of samples.
+        """
+        if self.mode == MODE_CPROFILE and self._profile is not None:
+            return self._top_cprofile(limit)
+        if self.mode == MODE_SAMPLE:
+            return self._top_sampled(limit)
+        return []
+
+    def _top_sampled(self, limit: int) -> List[Dict[str, Any]]:
+        cumulative: Counter = Counter()
+        own: Counter = Counter()
+        for stack, count in self._snapshot().items():
+            # Recursive functions count once per sample
+            for code in set(stack):
+                cumulative[code] += count
+            own[stack[-1]] += count
+
+        total = self._sample_count or 1
+        seconds = self.elapsed / total if self.elapsed else self.interval
+        return [
+            {
+                "function": code.co_name,
+                "file": code.co_filename,
+                "line": code.co_firstlineno,
+                "cumulative_pct": round(100 * count / total, 2),
+                "self_pct": round(100 * own[code] / total, 2),
+                "cumulative_seconds": round(count * seconds, 4),
+                "samples": count
+            }
+            for code, count in cumulative.most_common(limit)
+        ]
+
+    def _top_cprofile(self, limit: int) -> List[Dict[str, Any]]:
+        if self.running:
+            # Stats can only be read once the profiler is disabled
+            return []
+        stats = pstats.Stats(self._profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        total = self.elapsed or 1
+        return [
+            {
+                "function": name,
+                "file": filename,
+                "line": line,
+                "cumulative_pct": round(100 * cumtime / total, 2),
+                "self_pct": round(100 * tottime / total, 2),
+                "cumulative_seconds": round(cumtime, 4),
+                "calls": calls
+            }
+            for (filename, line, name), (primitive, calls, tottime, cumtime, callers) in rows
+        ]
+
+    def _snapshot(self) -> Counter:
+        # The sampler thread may still be adding samples
+        with self._lock:
+            return Counter(self._samples)
+
+    def _sample(self, thread_id: int) -> None:
+        samples = self._samples
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack: List[CodeType] = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if stack:
+                # Root first, as in the collapsed format
+                with self._lock:
+                    samples[tuple(reversed(stack))] += 1
+                    self._sample_count += 1
+
+# One per worker process
+profiler = Profiler()
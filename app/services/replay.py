@@ -0,0 +1,457 @@
+"""
+Replay of captured requests against another URL
+
+A replay job selects captures of one user (by id, by search pattern and
+live-stream filter, by time range) and sends them, oldest first, to a target
+URL through one pooled HTTP client. The original path below /api/@username
+and the query string are appended to the target, so a job can point at a
+staging service or a local stand-in.
+
+Pacing:
+    time_scale: > 0 keeps the original gaps between captures, divided by
+        the factor (1 = real time, 60 = an hour of traffic in a minute);
+        0 sends as fast as the other limits allow
+    rate: at most this many requests per second (0 for no limit)
+    concurrency: requests in progress at once, also the connection pool size
+
+A job that falls behind schedule (slow target, concurrency reached) sends
+the late captures as soon as it can, without exceeding the rate.
+
+Each response (status, headers, the first REPLAY_BODY_LIMIT bytes, timing)
+is appended to the capture's "replays" list, next to the original response.
+When the job ends, one "replayed" event tells viewers (and their ETags)
+that these captures changed.
+
+Jobs run in the worker that started them; their status is kept in memory.
+"""
+import os
+import re
+import json
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.services import metrics
+from app.services.filters import compile_filter, relative_path
+from app.services.storage import Storage
+from app.services.upstream import SKIPPED_HEADERS
+from app.services.webhook import search_webhook_requests
+
+logger = logging.getLogger(__name__)
+
+# Most captures one job replays
+MAX_REPLAY_REQUESTS = int(os.getenv("MAX_REPLAY_REQUESTS", 10000))
+
+# Upper bound for a job's concurrency (and connection pool size)
+MAX_REPLAY_CONCURRENCY = int(os.getenv("MAX_REPLAY_CONCURRENCY", 200))
+
+# Replay results kept on each capture, oldest dropped first
+REPLAY_RESULTS_KEPT = int(os.getenv("REPLAY_RESULTS_KEPT", 10))
+
+# Response body bytes stored per replay result
+REPLAY_BODY_LIMIT = int(os.getenv("REPLAY_BODY_LIMIT", 4096))
+
+# Finished jobs kept for status queries
+REPLAY_JOBS_KEPT = 50
+
+# Captures read per storage query while selecting
+SELECT_PAGE_SIZE = 500
+
+def _outcome(status_code: Optional[int]) -> str:
+    return f"{status_code // 100}xx" if status_code else "error"
+
+def build_replay_request(capture: Dict[str, Any], target_url: str, job_id: str) -> Dict[str, Any]:
+    """
+    Rebuild the HTTP request of a capture, addressed to the target
+
+    Args:
+        capture: Request document
+        target_url: Base URL receiving the replay
+        job_id: Replay job, sent in the X-Replay-Job header
+
+    Returns:
+        Dict: method, url, headers and content for httpx
+    """
+    path = relative_path(capture.get("path", ""), capture.get("username", ""))
+    url = target_url.rstrip("/") + (path if path != "/" else "")
+
+    headers = {
+        name: value for name, value in (capture.get("headers") or {}).items()
+        if name.lower() not in SKIPPED_HEADERS
+    }
+    headers["x-replay-of"] = capture.get("id", "")
+    headers["x-replay-job"] = job_id
+
+    body = capture.get("body")
+    if body is None:
+        content = None
+    elif isinstance(body, str):
+        content = body.encode("utf-8")
+    else:
+        # Stored parsed; the bytes may differ from the original in whitespace
+        content = json.dumps(body).encode("utf-8")
+
+    return {
+        "method": capture.get("method", "GET"),
+        "url": url,
+        "params": capture.get("query_params") or None,
+        "headers": headers,
+        "content": content
+    }
+
+async def select_captures(
+    db: Storage,
+    username: str,
+    request_ids: Optional[List[str]] = None,
+    search: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = MAX_REPLAY_REQUESTS
+) -> List[Dict[str, Any]]:
+    """
+    Select the captures of a replay, oldest first
+
+    Args:
+        db: Storage backend
+        username: Owner of the captures
+        request_ids: Replay only these captures
+        search: Pattern matched against method, path and id (as in the viewer search)
+        filters: Live-stream filter spec (method, path, headers, body)
+        since: Only captures received at or after this time
+        until: Only captures received before this time
+        limit: Most captures selected (the newest ones when there are more)
+
+    Returns:
+        List[Dict]: Request documents in the order they were received
+
+    Raises:
+        ValueError: If the filter spec or the search pattern is invalid
+    """
+    request_filter = compile_filter(filters)
+    if search:
+        try:
+            re.compile(search)
+        except re.error as e:
+            raise ValueError(f"Invalid search pattern: {e}")
+
+    def keep(capture: Dict[str, Any]) -> bool:
+        request_time = capture.get("request_time")
+        if since is not None and request_time < since:
+            return False
+        if until is not None and request_time >= until:
+            return False
+        return request_filter is None or request_filter.matches({"event": "new_request", "request": capture})
+
+    if request_ids:
+        selected = [capture for capture in await db.get_requests(username, request_ids) if keep(capture)]
+    elif search:
+        # Search results are not paged; read up to the limit at once
+        selected = [capture for capture in await search_webhook_requests(db, username, search, limit) if keep(capture)]
+    else:
+        # Newest first from `until` back to `since`, each page starting where the last one ended
+        selected = []
+        before = (until, None) if until is not None else None
+        while len(selected) < limit:
+            page = await db.requests_before(username, before, since, SELECT_PAGE_SIZE)
+            selected.extend(capture for capture in page if keep(capture))
+            if len(page) < SELECT_PAGE_SIZE:
+                break
+            before = (page[-1]["request_time"], page[-1].get("seq"))
+
+    selected.sort(key=lambda capture: capture["request_time"])
+    return selected[-limit:]
+
+class ReplayJob:
+    """
+    One replay run: its settings, progress and result counters
+    """
+
+    def __init__(
+        self,
+        username: str,
+        target_url: str,
+        captures: List[Dict[str, Any]],
+        concurrency: int,
+        rate: float,
+        time_scale: float,
+        timeout: float,
+        record: bool,
+        publish: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.username = username
+        self.target_url = target_url
+        self.captures = captures
+        self.total = len(captures)
+        self.concurrency = concurrency
+        self.rate = rate
+        self.time_scale = time_scale
+        self.timeout = timeout
+        self.record = record
+        self.publish = publish
+
+        self.state = "running"
+        self.error: Optional[str] = None
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.sent = 0
+        self.completed = 0
+        self.recorded = 0
+        self.outcomes: Counter = Counter()
+        self.durations: List[float] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def status(self) -> Dict[str, Any]:
+        """
+        JSON-serializable progress of the job
+        """
+        durations = sorted(self.durations)
+
+        def percentile(q: float) -> Optional[float]:
+            if not durations:
+                return None
+            return round(durations[min(len(durations) - 1, int(q * len(durations)))] * 1000, 2)
+
+        finished = self.finished_at or datetime.utcnow()
+        elapsed = (finished - self.started_at).total_seconds()
+        return {
+            "id": self.id,
+            "pid": os.getpid(),
+            "username": self.username,
+            "target_url": self.target_url,
+            "state": self.state,
+            "error": self.error,
+            "total": self.total,
+            "sent": self.sent,
+            "completed": self.completed,
+            "outcomes": dict(self.outcomes),
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "time_scale": self.time_scale,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "elapsed_seconds": round(elapsed, 3),
+            "achieved_rate": round(self.completed / elapsed, 2) if elapsed > 0 else None,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+    def offset(self, index: int) -> float:
+        """
+        Seconds after the start at which capture `index` is due, from the original gaps
+        """
+        if self.time_scale <= 0:
+            return 0.0
+        first = self.captures[0]["request_time"]
+        return (self.captures[index]["request_time"] - first).total_seconds() / self.time_scale
+
+    async def run(self, db: Storage) -> None:
+        """
+        Send every capture, then mark the job completed
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        pending = set()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        try:
+            async with httpx.AsyncClient(limits=limits, timeout=self.timeout) as client:
+                try:
+                    start = next_allowed = loop.time()
+                    for index, capture in enumerate(self.captures):
+                        send_at = max(start + self.offset(index), next_allowed)
+                        delay = send_at - loop.time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        await slots.acquire()
+                        if self.rate > 0:
+                            # Spaced from the previous send, so catching up never exceeds the rate
+                            next_allowed = loop.time() + 1 / self.rate
+                        self.sent += 1
+                        task = asyncio.create_task(self._send(client, db, capture, slots))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                    if pending:
+                        await asyncio.gather(*pending)
+                except BaseException:
+                    # Stop the requests in progress before the client closes
+                    for task in list(pending):
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    raise
+            self.state = "completed"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+        except Exception as e:
+            logger.error(f"Replay {self.id} failed: {e}")
+            self.state = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = datetime.utcnow()
+            if self.recorded and self.publish is not None:
+                # Once per job: the recorded results change the user's captures
+                try:
+                    self.publish(self.username, {"event": "replayed", "job_id": self.id, "count": self.recorded})
+                except Exception as e:
+                    logger.error(f"Error publishing replay event: {e}")
+            # The documents are no longer needed once the job is over
+            self.captures = []
+            logger.info(f"Replay {self.id} {self.state}: {self.completed}/{self.total} requests to {self.target_url}")
+
+    async def _send(self, client: httpx.AsyncClient, db: Storage, capture: Dict[str, Any], slots: asyncio.Semaphore) -> None:
+        result = {"job_id": self.id, "target_url": self.target_url, "replayed_at": datetime.utcnow().isoformat()}
+        started = metrics.now()
+        try:
+            request = client.build_request(**build_replay_request(capture, self.target_url, self.id))
+            response = await client.send(request, stream=True)
+            try:
+                # Keep the start of the body, drain the rest so the connection is reused
+                body = bytearray()
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if len(body) < REPLAY_BODY_LIMIT:
+                        body += chunk[:REPLAY_BODY_LIMIT - len(body)]
+            finally:
+                await response.aclose()
+            result.update(
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                body=body.decode("utf-8", errors="replace"),
+                body_size=size,
+                truncated=size > len(body)
+            )
+        except Exception as e:
+            # Any failure (network, or a capture that cannot be sent as is, e.g.
+            # non-ASCII header values) is this request's outcome, not the job's
+            result.update(status_code=None, error=f"{type(e).__name__}: {e}")
+        finally:
+            slots.release()
+
+        duration = metrics.now() - started
+        result["response_time"] = round(duration * 1000, 2)
+        outcome = _outcome(result["status_code"])
+        self.completed += 1
+        self.outcomes[outcome] += 1
+        self.durations.append(duration)
+        metrics.REPLAY_REQUESTS.labels(outcome).inc()
+        metrics.REPLAY_DURATION.observe(duration)
+
+        if self.record:
+            try:
+                if await db.append_replay(self.username, capture["id"], result, REPLAY_RESULTS_KEPT):
+                    self.recorded += 1
+            except Exception as e:
+                logger.error(f"Error recording replay of {capture['id']}: {e}")
+
+class ReplayManager:
+    """
+    Replay jobs of this worker
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, ReplayJob] = {}
+
+    async def start(
+        self,
+        db: Storage,
+        username: str,
+        target_url: str,
+        request_ids: Optional[List[str]] = None,
+        search: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = MAX_REPLAY_REQUESTS,
+        concurrency: int = 10,
+        rate: float = 0,
+        time_scale: float = 0,
+        timeout: float = 10,
+        record: bool = True,
+        publish: Optional[Callable[[str, Dict[str, Any]], None]] = None
+    ) -> ReplayJob:
+        """
+        Select captures and start replaying them in the background
+
+        Args:
+            db: Storage backend (captures are read from it and results written to it)
+            username: Owner of the captures
+            target_url: http(s) base URL receiving the replay
+            request_ids, search, filters, since, until, limit: Selection (see select_captures)
+            concurrency: Requests in progress at once
+            rate: Requests per second, 0 for no limit
+            time_scale: Divisor of the original gaps, 0 to ignore them
+            timeout: Seconds allowed per request
+            record: Append each response to its capture
+            publish: Broker publish function, for the "replayed" event
+
+        Returns:
+            ReplayJob: The started job
+
+        Raises:
+            ValueError: If a setting is invalid or nothing matches the selection
+        """
+        parts = urlsplit(target_url)
+        if parts.scheme not in ("http", "https") or not parts.netloc:
+            raise ValueError("target_url must be an http(s) URL")
+        if not 1 <= concurrency <= MAX_REPLAY_CONCURRENCY:
+            raise ValueError(f"concurrency must be between 1 and {MAX_REPLAY_CONCURRENCY}")
+        if rate < 0 or time_scale < 0 or timeout <= 0:
+            raise ValueError("rate and time_scale cannot be negative, timeout must be positive")
+        if since is not None and until is not None and since >= until:
+            raise ValueError("since must be before until")
+
+        limit = max(1, min(limit, MAX_REPLAY_REQUESTS))
+        captures = await select_captures(db, username, request_ids, search, filters, since, until, limit)
+        if not captures:
+            raise ValueError("No captured requests match the selection")
+
+        job = ReplayJob(username, target_url, captures, concurrency, rate, time_scale, timeout, record, publish)
+        job.task = asyncio.create_task(job.run(db))
+        self._jobs[job.id] = job
+        self._prune()
+
+        logger.info(
+            f"Replay {job.id} started: {len(captures)} requests of {username} to {target_url} "
+            f"(concurrency={concurrency}, rate={rate}, time_scale={time_scale})"
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[ReplayJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[ReplayJob]:
+        return list(self._jobs.values())
+
+    async def cancel(self, job_id: str) -> Optional[ReplayJob]:
+        """
+        Stop a running job; requests in progress are abandoned
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+            await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    async def stop(self) -> None:
+        """
+        Cancel every running job (shutdown)
+        """
+        tasks = [job.task for job in self._jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - REPLAY_JOBS_KEPT)]:
+            del self._jobs[job_id]
+
+# One per worker process
+replay_manager = ReplayManager()
@@ -0,0 +1,6 @@
+from app.services.storage.base import Storage
+from app.services.storage.mongo import MongoStorage
+from app.services.storage.memory import MemoryStorage
+from app.services.storage.sqlite import SQLiteStorage
+
+__all__ = ["Storage", "MongoStorage", "MemoryStorage", "SQLiteStorage"]
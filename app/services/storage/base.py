@@ -0,0 +1,253 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+class Storage:
+    """
+    Storage backend for users, captured requests and deletion tombstones
+
+    Documents are plain dicts shaped like the ones built in services/webhook.py
+    (datetimes stay datetime objects). Backends return shallow copies, so
+    callers may set top-level fields on what they get back.
+
+    Every engine behaves the same way (tests/test_storage.py runs against all
+    of them): request ids are unique across users, "oldest" and "newest" go
+    by request_time and then seq, and requests are only removed when asked
+    to; retention is up to the callers.
+    """
+
+    name = "base"
+
+    # Requests an engine can hold per user, None without a limit of its own
+    # (callers keep each user under it, see webhook.max_requests_per_user)
+    max_requests_per_user: Optional[int] = None
+
+    async def ensure_indexes(self) -> None:
+        """
+        Create indexes or tables if missing (no-op for existing ones)
+        """
+
+    async def close(self) -> None:
+        """
+        Release connections and other resources
+        """
+
+    async def ping(self) -> None:
+        """
+        Round trip to the database (opens a connection when none is idle)
+        """
+
+    # Users
+
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a user document, or None if the user does not exist
+        """
+        raise NotImplementedError
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        """
+        Insert a user document (the username must not exist yet)
+        """
+        raise NotImplementedError
+
+    async def update_user(self, username: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Set fields on a user document
+
+        Returns:
+            Dict: Updated user document, or None if the user does not exist
+        """
+        raise NotImplementedError
+
+    async def list_usernames(self, after: Optional[str], limit: int) -> List[str]:
+        """
+        Get usernames in ascending order, starting after `after` (None for the first page)
+        """
+        raise NotImplementedError
+
+    async def busiest_users(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get the user documents with the most requests captured, most first
+        """
+        raise NotImplementedError
+
+    async def allocate_seq(self, username: str) -> Optional[int]:
+        """
+        Atomically increment and return the user's sequence counter
+
+        Returns:
+            int: New sequence number, or None if the user does not exist
+        """
+        raise NotImplementedError
+
+    async def allocate_seq_block(self, username: str, count: int) -> Optional[int]:
+        """
+        Reserve `count` consecutive sequence numbers for a user's requests in one update
+
+        Returns:
+            int: The last reserved number (the block ends there), or None if the user does not exist
+        """
+        raise NotImplementedError
+
+    # Requests
+
+    async def insert_request(self, request: Dict[str, Any]) -> None:
+        """
+        Store a captured request
+
+        Raises:
+            Exception: The engine's duplicate key error if the id is already stored
+        """
+        raise NotImplementedError
+
+    async def insert_requests(self, requests: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """
+        Insert many request documents; a failed document does not stop the others
+
+        Returns:
+            List: (index in `requests`, error message) of each document not
+                inserted; a duplicate id gives "Duplicate id '<id>'"
+        """
+        raise NotImplementedError
+
+    async def count_requests(self, username: str) -> int:
+        """
+        Number of stored requests for a user
+        """
+        raise NotImplementedError
+
+    async def delete_oldest_request(self, username: str) -> bool:
+        """
+        Delete the user's oldest request (by request_time, then seq)
+
+        Returns:
+            bool: True if a request was deleted
+        """
+        raise NotImplementedError
+
+    async def trim_requests(self, username: str, keep: int) -> int:
+        """
+        Delete a user's oldest requests (by request_time, then seq) until at
+        most `keep` are left
+
+        Returns:
+            int: Number of deleted requests
+        """
+        raise NotImplementedError
+
+    async def list_requests(self, username: str, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+        """
+        Get a user's requests, newest first (by request_time, then seq)
+        """
+        raise NotImplementedError
+
+    async def requests_before(
+        self,
+        username: str,
+        before: Optional[Tuple[datetime, Optional[int]]],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Get requests that sort before a (request_time, seq) position, newest first
+
+        Pages through a time range without skipping: the next page starts
+        before the request_time and seq of the last request of this one. A
+        None seq sorts first, so (t, None) starts before everything received
+        at t.
+
+        Args:
+            username: Owner of the requests
+            before: Position to start from, None for the newest request
+            since: Stop at requests received before this time, None for no bound
+            limit: Most requests returned
+        """
+        raise NotImplementedError
+
+    async def get_requests(self, username: str, request_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Get a user's requests by id, in no particular order; unknown ids are left out
+        """
+        raise NotImplementedError
+
+    async def requests_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get requests with a sequence number greater than seq, oldest first
+        """
+        raise NotImplementedError
+
+    async def latest_request(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the user's newest request (by request_time, then seq), or None
+        """
+        raise NotImplementedError
+
+    async def oldest_seq(self, username: str) -> Optional[int]:
+        """
+        Smallest sequence number still stored for the user, or None
+        """
+        raise NotImplementedError
+
+    async def delete_request(self, username: str, request_id: str) -> bool:
+        """
+        Delete one request by id
+
+        Returns:
+            bool: True if deleted, False if not found
+        """
+        raise NotImplementedError
+
+    async def clear_requests(self, username: str) -> int:
+        """
+        Delete all of a user's requests
+
+        Returns:
+            int: Number of deleted requests
+        """
+        raise NotImplementedError
+
+    async def search_requests(self, username: str, pattern: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get requests whose method, path or id matches a regular expression
+        (case-insensitive), newest first
+        """
+        raise NotImplementedError
+
+    async def append_replay(self, username: str, request_id: str, result: Dict[str, Any], keep: int) -> bool:
+        """
+        Append a replay result to a request's "replays" list, keeping the last `keep`
+
+        Returns:
+            bool: True if the request exists
+        """
+        raise NotImplementedError
+
+    async def request_stats(self, username: str) -> Dict[str, Any]:
+        """
+        Aggregate statistics for a user's requests
+
+        Returns:
+            Dict: count, method_counts ({method: count}), average_response_time
+                (None without requests) and latest_request_time (datetime or None)
+        """
+        raise NotImplementedError
+
+    # Deletion tombstones (see get_webhook_request_changes)
+
+    async def insert_deletion(self, username: str, request_id: str, seq: Optional[int], deleted_at: datetime) -> None:
+        """
+        Record that a request was deleted
+        """
+        raise NotImplementedError
+
+    async def deletions_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        """
+        Get tombstones with a sequence number greater than seq, oldest first
+        """
+        raise NotImplementedError
+
+    async def clear_deletions(self, username: str) -> None:
+        """
+        Delete all of a user's tombstones
+        """
+        raise NotImplementedError
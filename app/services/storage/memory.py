@@ -0,0 +1,234 @@
+import re
+import heapq
+from collections import OrderedDict, Counter
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.services.storage.base import Storage
+
+def _age(request: Dict[str, Any]) -> Tuple[datetime, int]:
+    # Order of the other engines: request_time, then seq (missing seqs first)
+    seq = request.get("seq")
+    return request["request_time"], seq if seq is not None else -1
+
+class MemoryStorage(Storage):
+    """
+    In-process storage, for tests, CI and load-test environments
+
+    Requests are kept per user from oldest to newest (request_time, then seq),
+    so listing the newest and deleting the oldest only touch the rows
+    involved. Captures arrive in that order and are appended; imported
+    history is sorted in once per batch. max_requests_per_user is applied by
+    the callers' retention (see webhook.max_requests_per_user), not here.
+    Data is lost on restart and is not shared between workers.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_requests_per_user: int = 10000):
+        self.max_requests_per_user = max_requests_per_user
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._requests: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._owners: Dict[str, str] = {}
+        self._deletions: Dict[str, List[Dict[str, Any]]] = {}
+
+    # Users
+
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        user = self._users.get(username)
+        return dict(user) if user else None
+
+    async def list_usernames(self, after: Optional[str], limit: int) -> List[str]:
+        usernames = sorted(username for username in self._users if after is None or username > after)
+        return usernames[:limit]
+
+    async def busiest_users(self, limit: int) -> List[Dict[str, Any]]:
+        users = sorted(self._users.values(), key=lambda user: user.get("request_seq", 0), reverse=True)
+        return [dict(user) for user in users[:limit]]
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        if user["username"] in self._users:
+            raise ValueError(f"User '{user['username']}' already exists")
+        self._users[user["username"]] = dict(user)
+
+    async def update_user(self, username: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        user = self._users.get(username)
+        if user is None:
+            return None
+        user.update(fields)
+        return dict(user)
+
+    async def allocate_seq(self, username: str) -> Optional[int]:
+        user = self._users.get(username)
+        if user is None:
+            return None
+        user["request_seq"] = user.get("request_seq", 0) + 1
+        return user["request_seq"]
+
+    async def allocate_seq_block(self, username: str, count: int) -> Optional[int]:
+        user = self._users.get(username)
+        if user is None:
+            return None
+        user["request_seq"] = user.get("request_seq", 0) + count
+        return user["request_seq"]
+
+    # Requests
+
+    def _add(self, request: Dict[str, Any]) -> bool:
+        # Returns False when the request sorts before the newest one stored
+        requests = self._requests.setdefault(request["username"], OrderedDict())
+        in_order = not requests or _age(request) >= _age(next(reversed(requests.values())))
+        requests[request["id"]] = dict(request)
+        self._owners[request["id"]] = request["username"]
+        return in_order
+
+    def _sort(self, username: str) -> None:
+        requests = self._requests[username]
+        self._requests[username] = OrderedDict(sorted(requests.items(), key=lambda item: _age(item[1])))
+
+    def _pop_oldest(self, requests: "OrderedDict[str, Dict[str, Any]]") -> None:
+        request_id, _ = requests.popitem(last=False)
+        self._owners.pop(request_id, None)
+
+    async def insert_request(self, request: Dict[str, Any]) -> None:
+        # Request ids are unique across users, like the other engines' indexes
+        if request["id"] in self._owners:
+            raise ValueError(f"Duplicate id '{request['id']}'")
+        if not self._add(request):
+            self._sort(request["username"])
+
+    async def insert_requests(self, requests: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        errors = []
+        unsorted = set()
+        for index, request in enumerate(requests):
+            if request["id"] in self._owners:
+                errors.append((index, f"Duplicate id '{request['id']}'"))
+            elif not self._add(request):
+                unsorted.add(request["username"])
+        for username in unsorted:
+            self._sort(username)
+        return errors
+
+    async def count_requests(self, username: str) -> int:
+        return len(self._requests.get(username, ()))
+
+    async def delete_oldest_request(self, username: str) -> bool:
+        requests = self._requests.get(username)
+        if not requests:
+            return False
+        self._pop_oldest(requests)
+        return True
+
+    async def trim_requests(self, username: str, keep: int) -> int:
+        requests = self._requests.get(username)
+        if not requests:
+            return 0
+        deleted = max(0, len(requests) - keep)
+        for _ in range(deleted):
+            self._pop_oldest(requests)
+        return deleted
+
+    async def list_requests(self, username: str, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+        requests = self._requests.get(username)
+        if not requests:
+            return []
+        return [dict(req) for req in islice(reversed(requests.values()), skip, skip + limit)]
+
+    async def requests_before(
+        self,
+        username: str,
+        before: Optional[Tuple[datetime, Optional[int]]],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        position = None if before is None else (before[0], before[1] if before[1] is not None else -1)
+        page = []
+        for req in reversed(self._requests.get(username, {}).values()):
+            if position is not None and _age(req) >= position:
+                continue
+            if len(page) >= limit or (since is not None and req["request_time"] < since):
+                break
+            page.append(dict(req))
+        return page
+
+    async def get_requests(self, username: str, request_ids: List[str]) -> List[Dict[str, Any]]:
+        requests = self._requests.get(username, {})
+        return [dict(requests[request_id]) for request_id in dict.fromkeys(request_ids) if request_id in requests]
+
+    async def requests_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        # Rows are not stored in sequence order when captures commit out of order
+        newer = (
+            req for req in self._requests.get(username, {}).values()
+            if req.get("seq") is not None and req["seq"] > seq
+        )
+        return [dict(req) for req in heapq.nsmallest(limit, newer, key=lambda req: req["seq"])]
+
+    async def latest_request(self, username: str) -> Optional[Dict[str, Any]]:
+        requests = self._requests.get(username)
+        if not requests:
+            return None
+        return dict(next(reversed(requests.values())))
+
+    async def oldest_seq(self, username: str) -> Optional[int]:
+        return min(
+            (req["seq"] for req in self._requests.get(username, {}).values() if req.get("seq") is not None),
+            default=None
+        )
+
+    async def delete_request(self, username: str, request_id: str) -> bool:
+        requests = self._requests.get(username)
+        if requests is None or requests.pop(request_id, None) is None:
+            return False
+        self._owners.pop(request_id, None)
+        return True
+
+    async def clear_requests(self, username: str) -> int:
+        requests = self._requests.pop(username, {})
+        for request_id in requests:
+            self._owners.pop(request_id, None)
+        return len(requests)
+
+    async def search_requests(self, username: str, pattern: str, limit: int) -> List[Dict[str, Any]]:
+        regex = re.compile(pattern, re.IGNORECASE)
+        matches = (
+            req for req in reversed(self._requests.get(username, {}).values())
+            if any(regex.search(str(req.get(field, ""))) for field in ("method", "path", "id"))
+        )
+        return [dict(req) for req in islice(matches, limit)]
+
+    async def append_replay(self, username: str, request_id: str, result: Dict[str, Any], keep: int) -> bool:
+        req = self._requests.get(username, {}).get(request_id)
+        if req is None:
+            return False
+        req["replays"] = ((req.get("replays") or []) + [result])[-keep:]
+        return True
+
+    async def request_stats(self, username: str) -> Dict[str, Any]:
+        requests = list(self._requests.get(username, {}).values())
+        method_counts = Counter(req.get("method") for req in requests)
+        return {
+            "count": len(requests),
+            "method_counts": dict(method_counts.most_common()),
+            "average_response_time": (
+                sum(req.get("response_time") or 0 for req in requests) / len(requests) if requests else None
+            ),
+            "latest_request_time": max((req["request_time"] for req in requests), default=None)
+        }
+
+    # Deletion tombstones
+
+    async def insert_deletion(self, username: str, request_id: str, seq: Optional[int], deleted_at: datetime) -> None:
+        self._deletions.setdefault(username, []).append({
+            "username": username,
+            "request_id": request_id,
+            "seq": seq,
+            "deleted_at": deleted_at
+        })
+
+    async def deletions_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        deletions = [d for d in self._deletions.get(username, []) if d["seq"] is not None and d["seq"] > seq]
+        return [dict(d) for d in deletions[:limit]]
+
+    async def clear_deletions(self, username: str) -> None:
+        self._deletions.pop(username, None)
@@ -0,0 +1,301 @@
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app.services.storage.base import Storage
+
+# Documents are returned without Mongo's ObjectId
+NO_ID = {"_id": 0}
+
+# Request order shared by all engines: request_time, then seq
+NEWEST_FIRST = [("request_time", -1), ("seq", -1)]
+OLDEST_FIRST = [("request_time", 1), ("seq", 1)]
+
+# Server error code of a unique index violation
+DUPLICATE_KEY = 11000
+
+class MongoStorage(Storage):
+    """
+    MongoDB storage through Motor
+
+    Each instance wraps one database handle, so the same data can be reached
+    with different settings (write concern, read preference); max_time_ms
+    bounds the read queries of that instance. User lookups can go through a
+    separate handle (users_db), so an instance reading requests from
+    secondaries still finds a user created a moment ago on the primary.
+    """
+
+    name = "mongo"
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        max_time_ms: Optional[int] = None,
+        users_db: Optional[AsyncIOMotorDatabase] = None
+    ):
+        self.db = db
+        self.max_time_ms = max_time_ms
+        self.users_db = users_db if users_db is not None else db
+
+    async def ensure_indexes(self) -> None:
+        await self.db["users"].create_index("username", unique=True)
+        await self.db["webhook_requests"].create_index("username")
+        await self.db["webhook_requests"].create_index("request_time")
+        await self.db["webhook_requests"].create_index("id", unique=True)
+        await self.db["webhook_requests"].create_index([("username", 1), ("request_time", 1), ("seq", 1)])
+        await self.db["webhook_requests"].create_index([("username", 1), ("seq", 1)])
+        await self.db["webhook_deletions"].create_index([("username", 1), ("seq", 1)])
+
+    async def ping(self) -> None:
+        await self.db.command("ping")
+
+    def _count_options(self) -> Dict[str, Any]:
+        return {"maxTimeMS": self.max_time_ms} if self.max_time_ms else {}
+
+    # Users
+
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self.users_db.users.find_one({"username": username}, NO_ID, max_time_ms=self.max_time_ms)
+
+    async def list_usernames(self, after: Optional[str], limit: int) -> List[str]:
+        query = {"username": {"$gt": after}} if after is not None else {}
+        cursor = self.db.users.find(query, {"_id": 0, "username": 1}).sort("username", 1).limit(limit)
+        return [user["username"] async for user in cursor]
+
+    async def busiest_users(self, limit: int) -> List[Dict[str, Any]]:
+        cursor = self.db.users.find({}, NO_ID, max_time_ms=self.max_time_ms).sort("request_seq", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        # Insert a copy so the caller's dict does not get an _id
+        await self.db.users.insert_one(dict(user))
+
+    async def update_user(self, username: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not fields:
+            return await self.get_user(username)
+        return await self.db.users.find_one_and_update(
+            {"username": username},
+            {"$set": fields},
+            projection=NO_ID,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def allocate_seq(self, username: str) -> Optional[int]:
+        user = await self.db.users.find_one_and_update(
+            {"username": username},
+            {"$inc": {"request_seq": 1}},
+            projection={"request_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return user["request_seq"] if user else None
+
+    async def allocate_seq_block(self, username: str, count: int) -> Optional[int]:
+        user = await self.db.users.find_one_and_update(
+            {"username": username},
+            {"$inc": {"request_seq": count}},
+            projection={"request_seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return user["request_seq"] if user else None
+
+    # Requests
+
+    async def insert_request(self, request: Dict[str, Any]) -> None:
+        await self.db.webhook_requests.insert_one(dict(request))
+
+    async def insert_requests(self, requests: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        try:
+            # Unordered: the server keeps inserting past a failed document
+            await self.db.webhook_requests.insert_many([dict(request) for request in requests], ordered=False)
+        except BulkWriteError as e:
+            return [
+                (
+                    error["index"],
+                    f"Duplicate id '{requests[error['index']]['id']}'" if error.get("code") == DUPLICATE_KEY
+                    else error.get("errmsg", "Write error")
+                )
+                for error in e.details.get("writeErrors", [])
+            ]
+        return []
+
+    async def count_requests(self, username: str) -> int:
+        return await self.db.webhook_requests.count_documents({"username": username}, **self._count_options())
+
+    async def delete_oldest_request(self, username: str) -> bool:
+        deleted = await self.db.webhook_requests.find_one_and_delete(
+            {"username": username},
+            sort=OLDEST_FIRST,
+            projection={"_id": 1}
+        )
+        return deleted is not None
+
+    async def trim_requests(self, username: str, keep: int) -> int:
+        # Delete everything up to the first request past the newest `keep`,
+        # comparing (request_time, seq) so equal timestamps are not over-deleted
+        cursor = self.db.webhook_requests.find(
+            {"username": username}, {"_id": 0, "request_time": 1, "seq": 1}, sort=NEWEST_FIRST
+        ).skip(keep).limit(1)
+        cutoff = await cursor.to_list(length=1)
+        if not cutoff:
+            return 0
+        request_time, seq = cutoff[0]["request_time"], cutoff[0].get("seq")
+        # Missing seqs sort first, as in the query above
+        older = [{"request_time": {"$lt": request_time}}, {"request_time": request_time, "seq": None}]
+        if seq is not None:
+            older.append({"request_time": request_time, "seq": {"$lte": seq}})
+        result = await self.db.webhook_requests.delete_many({"username": username, "$or": older})
+        return result.deleted_count
+
+    async def list_requests(self, username: str, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+        cursor = self.db.webhook_requests.find(
+            {"username": username},
+            NO_ID,
+            sort=NEWEST_FIRST,
+            max_time_ms=self.max_time_ms
+        ).skip(skip).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def requests_before(
+        self,
+        username: str,
+        before: Optional[Tuple[datetime, Optional[int]]],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"username": username}
+        if before is not None:
+            request_time, seq = before
+            # Missing seqs sort first, as in NEWEST_FIRST
+            older = [{"request_time": {"$lt": request_time}}]
+            if seq is not None:
+                older.append({"request_time": request_time, "seq": None})
+                older.append({"request_time": request_time, "seq": {"$lt": seq}})
+            query["$or"] = older
+        if since is not None:
+            query["request_time"] = {"$gte": since}
+        cursor = self.db.webhook_requests.find(
+            query,
+            NO_ID,
+            sort=NEWEST_FIRST,
+            max_time_ms=self.max_time_ms
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_requests(self, username: str, request_ids: List[str]) -> List[Dict[str, Any]]:
+        cursor = self.db.webhook_requests.find(
+            {"username": username, "id": {"$in": list(dict.fromkeys(request_ids))}},
+            NO_ID,
+            max_time_ms=self.max_time_ms
+        )
+        return await cursor.to_list(length=None)
+
+    async def requests_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        cursor = self.db.webhook_requests.find(
+            {"username": username, "seq": {"$gt": seq}},
+            NO_ID,
+            sort=[("seq", 1)],
+            max_time_ms=self.max_time_ms
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def latest_request(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self.db.webhook_requests.find_one(
+            {"username": username},
+            NO_ID,
+            sort=NEWEST_FIRST,
+            max_time_ms=self.max_time_ms
+        )
+
+    async def oldest_seq(self, username: str) -> Optional[int]:
+        oldest = await self.db.webhook_requests.find_one(
+            {"username": username, "seq": {"$ne": None}},
+            sort=[("seq", 1)],
+            projection={"seq": 1},
+            max_time_ms=self.max_time_ms
+        )
+        return oldest["seq"] if oldest else None
+
+    async def delete_request(self, username: str, request_id: str) -> bool:
+        result = await self.db.webhook_requests.delete_one({"username": username, "id": request_id})
+        return result.deleted_count > 0
+
+    async def clear_requests(self, username: str) -> int:
+        result = await self.db.webhook_requests.delete_many({"username": username})
+        return result.deleted_count
+
+    async def search_requests(self, username: str, pattern: str, limit: int) -> List[Dict[str, Any]]:
+        search_criteria = {
+            "$and": [
+                {"username": username},
+                {"$or": [
+                    {"method": {"$regex": pattern, "$options": "i"}},
+                    {"path": {"$regex": pattern, "$options": "i"}},
+                    {"id": {"$regex": pattern, "$options": "i"}}
+                ]}
+            ]
+        }
+        cursor = self.db.webhook_requests.find(
+            search_criteria,
+            NO_ID,
+            sort=NEWEST_FIRST,
+            max_time_ms=self.max_time_ms
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def append_replay(self, username: str, request_id: str, result: Dict[str, Any], keep: int) -> bool:
+        updated = await self.db.webhook_requests.update_one(
+            {"username": username, "id": request_id},
+            {"$push": {"replays": {"$each": [result], "$slice": -keep}}}
+        )
+        return updated.matched_count > 0
+
+    async def request_stats(self, username: str) -> Dict[str, Any]:
+        stats = {"count": 0, "method_counts": {}, "average_response_time": None, "latest_request_time": None}
+
+        cursor = self.db.webhook_requests.aggregate([
+            {"$match": {"username": username}},
+            {"$group": {
+                "_id": "$method",
+                "count": {"$sum": 1},
+                "total_time": {"$sum": "$response_time"},
+                "latest": {"$max": "$request_time"}
+            }},
+            {"$sort": {"count": -1}}
+        ], **self._count_options())
+
+        total_time = 0
+        for group in await cursor.to_list(length=None):
+            stats["count"] += group["count"]
+            stats["method_counts"][group["_id"]] = group["count"]
+            total_time += group["total_time"] or 0
+            if group["latest"] and (stats["latest_request_time"] is None or group["latest"] > stats["latest_request_time"]):
+                stats["latest_request_time"] = group["latest"]
+
+        if stats["count"]:
+            stats["average_response_time"] = total_time / stats["count"]
+        return stats
+
+    # Deletion tombstones
+
+    async def insert_deletion(self, username: str, request_id: str, seq: Optional[int], deleted_at: datetime) -> None:
+        await self.db.webhook_deletions.insert_one({
+            "username": username,
+            "request_id": request_id,
+            "seq": seq,
+            "deleted_at": deleted_at
+        })
+
+    async def deletions_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        cursor = self.db.webhook_deletions.find(
+            {"username": username, "seq": {"$gt": seq}},
+            NO_ID,
+            sort=[("seq", 1)],
+            max_time_ms=self.max_time_ms
+        ).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def clear_deletions(self, username: str) -> None:
+        await self.db.webhook_deletions.delete_many({"username": username})
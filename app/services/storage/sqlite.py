@@ -0,0 +1,390 @@
+import re
+import json
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Callable, TypeVar
+
+from app.services.storage.base import Storage
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    request_seq INTEGER NOT NULL DEFAULT 0,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS webhook_requests (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    seq INTEGER,
+    method TEXT,
+    path TEXT,
+    request_time TEXT NOT NULL,
+    response_time INTEGER,
+    doc TEXT NOT NULL
+);
+DROP INDEX IF EXISTS webhook_requests_username_time;
+CREATE INDEX IF NOT EXISTS webhook_requests_username_time_seq ON webhook_requests (username, request_time, seq);
+CREATE INDEX IF NOT EXISTS webhook_requests_username_seq ON webhook_requests (username, seq);
+CREATE TABLE IF NOT EXISTS webhook_deletions (
+    username TEXT NOT NULL,
+    seq INTEGER,
+    request_id TEXT NOT NULL,
+    deleted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS webhook_deletions_username_seq ON webhook_deletions (username, seq);
+"""
+
+# Marker used to keep datetimes typed inside the JSON documents
+DATETIME_KEY = "__datetime__"
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {DATETIME_KEY: value.isoformat()}
+    return str(value)
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[DATETIME_KEY])
+    return obj
+
+def _dumps(doc: Dict[str, Any]) -> str:
+    return json.dumps(doc, default=_encode)
+
+def _loads(text: str) -> Dict[str, Any]:
+    return json.loads(text, object_hook=_decode)
+
+def _duplicate(request: Dict[str, Any], error: sqlite3.IntegrityError) -> str:
+    # Same message as the other engines for the id primary key
+    if "webhook_requests.id" in str(error):
+        return f"Duplicate id '{request['id']}'"
+    return str(error)
+
+def _regexp(pattern: str, value: Optional[str]) -> bool:
+    return value is not None and re.search(pattern, value, re.IGNORECASE) is not None
+
+class SQLiteStorage(Storage):
+    """
+    SQLite storage for single-host deployments
+
+    The database runs in WAL mode so several workers can read while one
+    writes. Calls run on a single background thread per worker (sqlite3 is
+    blocking), keeping the event loop free. Whole documents are stored as JSON
+    next to the columns used for lookups and sorting.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Only ever called from the executor thread
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("REGEXP", 2, _regexp, deterministic=True)
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connection()))
+
+    async def ensure_indexes(self) -> None:
+        await self._run(lambda conn: conn.executescript(SCHEMA))
+
+    async def ping(self) -> None:
+        await self._run(lambda conn: conn.execute("SELECT 1").fetchone())
+
+    async def close(self) -> None:
+        def close(conn):
+            conn.close()
+            self._conn = None
+        await self._run(close)
+        self._executor.shutdown(wait=True)
+
+    # Users
+
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        def query(conn):
+            row = conn.execute("SELECT request_seq, doc FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return None
+            user = _loads(row["doc"])
+            user["request_seq"] = row["request_seq"]
+            return user
+        return await self._run(query)
+
+    async def list_usernames(self, after: Optional[str], limit: int) -> List[str]:
+        def query(conn):
+            rows = conn.execute(
+                "SELECT username FROM users WHERE username > ? ORDER BY username LIMIT ?",
+                (after if after is not None else "", limit)
+            )
+            return [row["username"] for row in rows]
+        return await self._run(query)
+
+    async def busiest_users(self, limit: int) -> List[Dict[str, Any]]:
+        def query(conn):
+            users = []
+            for row in conn.execute("SELECT request_seq, doc FROM users ORDER BY request_seq DESC LIMIT ?", (limit,)):
+                user = _loads(row["doc"])
+                user["request_seq"] = row["request_seq"]
+                users.append(user)
+            return users
+        return await self._run(query)
+
+    async def insert_user(self, user: Dict[str, Any]) -> None:
+        doc = _dumps(user)
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO users (username, request_seq, doc) VALUES (?, ?, ?)",
+            (user["username"], user.get("request_seq", 0), doc)
+        ))
+
+    async def update_user(self, username: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def update(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT request_seq, doc FROM users WHERE username = ?", (username,)).fetchone()
+                if row is None:
+                    return None
+                user = _loads(row["doc"])
+                user.update(fields)
+                conn.execute("UPDATE users SET doc = ? WHERE username = ?", (_dumps(user), username))
+                user["request_seq"] = row["request_seq"]
+                return user
+            finally:
+                conn.execute("COMMIT")
+        return await self._run(update)
+
+    async def allocate_seq(self, username: str) -> Optional[int]:
+        def allocate(conn):
+            row = conn.execute(
+                "UPDATE users SET request_seq = request_seq + 1 WHERE username = ? RETURNING request_seq",
+                (username,)
+            ).fetchone()
+            return row["request_seq"] if row else None
+        return await self._run(allocate)
+
+    async def allocate_seq_block(self, username: str, count: int) -> Optional[int]:
+        def allocate(conn):
+            row = conn.execute(
+                "UPDATE users SET request_seq = request_seq + ? WHERE username = ? RETURNING request_seq",
+                (count, username)
+            ).fetchone()
+            return row["request_seq"] if row else None
+        return await self._run(allocate)
+
+    # Requests
+
+    async def insert_request(self, request: Dict[str, Any]) -> None:
+        doc = _dumps(request)
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO webhook_requests (id, username, seq, method, path, request_time, response_time, doc) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                request["id"], request["username"], request.get("seq"), request.get("method"),
+                request.get("path"), request["request_time"].isoformat(), request.get("response_time"), doc
+            )
+        ))
+
+    async def insert_requests(self, requests: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        rows = [
+            (
+                request["id"], request["username"], request.get("seq"), request.get("method"),
+                request.get("path"), request["request_time"].isoformat(), request.get("response_time"), _dumps(request)
+            )
+            for request in requests
+        ]
+
+        def insert(conn):
+            # One transaction for the batch; rows are inserted one by one to report each failure
+            errors = []
+            conn.execute("BEGIN")
+            try:
+                for index, row in enumerate(rows):
+                    try:
+                        conn.execute(
+                            "INSERT INTO webhook_requests (id, username, seq, method, path, request_time, response_time, doc) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            row
+                        )
+                    except sqlite3.IntegrityError as e:
+                        errors.append((index, _duplicate(requests[index], e)))
+            finally:
+                conn.execute("COMMIT")
+            return errors
+        return await self._run(insert)
+
+    async def count_requests(self, username: str) -> int:
+        return await self._run(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM webhook_requests WHERE username = ?", (username,)
+        ).fetchone()[0])
+
+    async def delete_oldest_request(self, username: str) -> bool:
+        return await self._run(lambda conn: conn.execute(
+            "DELETE FROM webhook_requests WHERE id = ("
+            "SELECT id FROM webhook_requests WHERE username = ? ORDER BY request_time, seq LIMIT 1)",
+            (username,)
+        ).rowcount > 0)
+
+    async def trim_requests(self, username: str, keep: int) -> int:
+        return await self._run(lambda conn: conn.execute(
+            "DELETE FROM webhook_requests WHERE id IN ("
+            "SELECT id FROM webhook_requests WHERE username = ? ORDER BY request_time DESC, seq DESC LIMIT -1 OFFSET ?)",
+            (username, keep)
+        ).rowcount)
+
+    async def _select(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        return await self._run(lambda conn: [_loads(row["doc"]) for row in conn.execute(sql, params)])
+
+    async def list_requests(self, username: str, limit: int, skip: int = 0) -> List[Dict[str, Any]]:
+        return await self._select(
+            "SELECT doc FROM webhook_requests WHERE username = ? ORDER BY request_time DESC, seq DESC LIMIT ? OFFSET ?",
+            (username, limit, skip)
+        )
+
+    async def requests_before(
+        self,
+        username: str,
+        before: Optional[Tuple[datetime, Optional[int]]],
+        since: Optional[datetime],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        # NULL seqs sort first, like missing seqs in the other engines
+        conditions, params = ["username = ?"], [username]
+        if before is not None:
+            request_time, seq = before[0].isoformat(), before[1]
+            if seq is None:
+                conditions.append("request_time < ?")
+                params.append(request_time)
+            else:
+                conditions.append("(request_time < ? OR (request_time = ? AND (seq IS NULL OR seq < ?)))")
+                params.extend((request_time, request_time, seq))
+        if since is not None:
+            conditions.append("request_time >= ?")
+            params.append(since.isoformat())
+        return await self._select(
+            f"SELECT doc FROM webhook_requests WHERE {' AND '.join(conditions)} "
+            "ORDER BY request_time DESC, seq DESC LIMIT ?",
+            (*params, limit)
+        )
+
+    async def get_requests(self, username: str, request_ids: List[str]) -> List[Dict[str, Any]]:
+        request_ids = list(dict.fromkeys(request_ids))
+        requests = []
+        # Stay below SQLite's limit on query parameters
+        for start in range(0, len(request_ids), 500):
+            chunk = request_ids[start:start + 500]
+            requests.extend(await self._select(
+                f"SELECT doc FROM webhook_requests WHERE username = ? AND id IN ({', '.join('?' * len(chunk))})",
+                (username, *chunk)
+            ))
+        return requests
+
+    async def requests_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        return await self._select(
+            "SELECT doc FROM webhook_requests WHERE username = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (username, seq, limit)
+        )
+
+    async def latest_request(self, username: str) -> Optional[Dict[str, Any]]:
+        rows = await self._select(
+            "SELECT doc FROM webhook_requests WHERE username = ? ORDER BY request_time DESC, seq DESC LIMIT 1",
+            (username,)
+        )
+        return rows[0] if rows else None
+
+    async def oldest_seq(self, username: str) -> Optional[int]:
+        return await self._run(lambda conn: conn.execute(
+            "SELECT MIN(seq) FROM webhook_requests WHERE username = ?", (username,)
+        ).fetchone()[0])
+
+    async def delete_request(self, username: str, request_id: str) -> bool:
+        return await self._run(lambda conn: conn.execute(
+            "DELETE FROM webhook_requests WHERE username = ? AND id = ?", (username, request_id)
+        ).rowcount > 0)
+
+    async def clear_requests(self, username: str) -> int:
+        return await self._run(lambda conn: conn.execute(
+            "DELETE FROM webhook_requests WHERE username = ?", (username,)
+        ).rowcount)
+
+    async def search_requests(self, username: str, pattern: str, limit: int) -> List[Dict[str, Any]]:
+        return await self._select(
+            "SELECT doc FROM webhook_requests WHERE username = ? "
+            "AND (method REGEXP ? OR path REGEXP ? OR id REGEXP ?) "
+            "ORDER BY request_time DESC, seq DESC LIMIT ?",
+            (username, pattern, pattern, pattern, limit)
+        )
+
+    async def append_replay(self, username: str, request_id: str, result: Dict[str, Any], keep: int) -> bool:
+        def append(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT doc FROM webhook_requests WHERE username = ? AND id = ?", (username, request_id)
+                ).fetchone()
+                if row is None:
+                    return False
+                req = _loads(row["doc"])
+                req["replays"] = ((req.get("replays") or []) + [result])[-keep:]
+                conn.execute("UPDATE webhook_requests SET doc = ? WHERE id = ?", (_dumps(req), request_id))
+                return True
+            finally:
+                conn.execute("COMMIT")
+        return await self._run(append)
+
+    async def request_stats(self, username: str) -> Dict[str, Any]:
+        def query(conn):
+            rows = conn.execute(
+                "SELECT method, COUNT(*) AS count, SUM(response_time) AS total_time, MAX(request_time) AS latest "
+                "FROM webhook_requests WHERE username = ? GROUP BY method ORDER BY count DESC",
+                (username,)
+            ).fetchall()
+            count = sum(row["count"] for row in rows)
+            latest = max((row["latest"] for row in rows), default=None)
+            return {
+                "count": count,
+                "method_counts": {row["method"]: row["count"] for row in rows},
+                "average_response_time": sum(row["total_time"] or 0 for row in rows) / count if count else None,
+                "latest_request_time": datetime.fromisoformat(latest) if latest else None
+            }
+        return await self._run(query)
+
+    # Deletion tombstones
+
+    async def insert_deletion(self, username: str, request_id: str, seq: Optional[int], deleted_at: datetime) -> None:
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO webhook_deletions (username, seq, request_id, deleted_at) VALUES (?, ?, ?, ?)",
+            (username, seq, request_id, deleted_at.isoformat())
+        ))
+
+    async def deletions_since(self, username: str, seq: int, limit: int) -> List[Dict[str, Any]]:
+        def query(conn):
+            rows = conn.execute(
+                "SELECT seq, request_id, deleted_at FROM webhook_deletions "
+                "WHERE username = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (username, seq, limit)
+            )
+            return [
+                {
+                    "username": username,
+                    "request_id": row["request_id"],
+                    "seq": row["seq"],
+                    "deleted_at": datetime.fromisoformat(row["deleted_at"])
+                }
+                for row in rows
+            ]
+        return await self._run(query)
+
+    async def clear_deletions(self, username: str) -> None:
+        await self._run(lambda conn: conn.execute("DELETE FROM webhook_deletions WHERE username = ?", (username,)))
@@ -0,0 +1,79 @@
+import os
+import logging
+from collections import OrderedDict
+from typing import Any, Tuple
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from fastapi.templating import Jinja2Templates
+
+logger = logging.getLogger(__name__)
+
+# Fragments kept per worker; the least recently used are dropped beyond this
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 1000))
+
+class FragmentCacheExtension(Extension):
+    """
+    {% cache "name", key... %}...{% endcache %}: render a fragment once per key
+
+    The rendered fragment is reused for every later render with the same
+    name and key values, so a key must include everything the fragment
+    depends on. Meant for parts of a page that only depend on a few values
+    (the username, the asset manifest). Keep the Host header and other
+    values any client can vary out of cached fragments: every distinct value
+    adds an entry and pushes out one in use.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=OrderedDict())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key: list, caller) -> str:
+        cache: "OrderedDict[Tuple[Any, ...], str]" = self.environment.fragment_cache
+        key = tuple(key)
+        fragment = cache.get(key)
+        if fragment is not None:
+            cache.move_to_end(key)
+            return fragment
+
+        fragment = caller()
+        cache[key] = fragment
+        if len(cache) > FRAGMENT_CACHE_SIZE:
+            cache.popitem(last=False)
+        return fragment
+
+def create_templates(directory: str) -> Jinja2Templates:
+    """
+    Create the Jinja2 templates with fragment caching
+
+    Templates are not checked for changes on every render unless
+    TEMPLATE_AUTO_RELOAD=1 (development).
+    """
+    templates = Jinja2Templates(directory=directory, extensions=[FragmentCacheExtension])
+    templates.env.auto_reload = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+    return templates
+
+def compile_templates(templates: Jinja2Templates) -> None:
+    """
+    Compile every template up front, instead of on the first hit of each page
+
+    Call it once filters and globals are registered: the compiled code
+    depends on the filters' signatures.
+    """
+    env = templates.env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info(f"Compiled {len(names)} templates")
@@ -0,0 +1,153 @@
+import os
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from app.services.metrics import now, Histogram
+
+# Requests whose own handling takes longer than this (in milliseconds, not counting
+# the simulated delay or the upstream) are logged as slow
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 1000))
+
+# Slow requests kept per worker, across all users
+SLOW_LOG_SIZE = int(os.getenv("SLOW_LOG_SIZE", 500))
+
+# Stages spent waiting on purpose or on another server, not on the mock itself
+WAIT_STAGES = ("simulated_delay", "upstream")
+
+class StageTimings:
+    """
+    Stage durations of one request
+
+    Used to build the Server-Timing header, the breakdown stored on captured
+    requests and slow-request log entries. A stage recorded twice accumulates.
+    """
+
+    __slots__ = ("started", "stages")
+
+    def __init__(self):
+        self.started = now()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, started: float, histogram: Optional[Histogram] = None) -> float:
+        """
+        Record a stage that began at `started` (a metrics.now() value) and ends now
+
+        Args:
+            stage: Stage name (a Server-Timing token: letters, digits, "_" or "-")
+            started: Start time of the stage
+            histogram: Histogram (or labelled child) that also receives the duration
+
+        Returns:
+            float: Stage duration in seconds
+        """
+        elapsed = now() - started
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+        if histogram is not None:
+            histogram.observe(elapsed)
+        return elapsed
+
+    def total(self) -> float:
+        """
+        Seconds since the request started
+        """
+        return now() - self.started
+
+    def overhead(self, total: Optional[float] = None) -> float:
+        """
+        Seconds spent outside the WAIT_STAGES, out of `total` (default: so far)
+        """
+        total = self.total() if total is None else total
+        return total - sum(self.stages.get(stage, 0.0) for stage in WAIT_STAGES)
+
+    def as_ms(self) -> Dict[str, float]:
+        """
+        Stage durations in milliseconds
+        """
+        return {stage: round(elapsed * 1000, 3) for stage, elapsed in self.stages.items()}
+
+    def header(self, total: Optional[float] = None) -> str:
+        """
+        Value of the Server-Timing header, ending with the total
+        """
+        total = self.total() if total is None else total
+        metrics = [f"{stage};dur={elapsed * 1000:.3f}" for stage, elapsed in self.stages.items()]
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+def build_slow_request_event(
+    username: str,
+    kind: str,
+    method: str,
+    path: str,
+    timings: StageTimings,
+    total: float,
+    request_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Build the live event announcing a slow request
+
+    Args:
+        username: User the request belongs to
+        kind: "webhook" for captures, "api" for viewer API calls
+        method: HTTP method
+        path: Request path
+        timings: Stage durations of the request
+        total: Total duration in seconds
+        request_id: Id of the captured request, if any
+
+    Returns:
+        Dict: "slow_request" event
+    """
+    return {
+        "event": "slow_request",
+        "username": username,
+        "kind": kind,
+        "method": method,
+        "path": path,
+        "request_id": request_id,
+        "total_ms": round(total * 1000, 3),
+        "overhead_ms": round(timings.overhead(total) * 1000, 3),
+        "timings": timings.as_ms(),
+        "time": datetime.utcnow().isoformat()
+    }
+
+class SlowRequestLog:
+    """
+    Bounded log of recent slow requests
+
+    Entries arrive as "slow_request" broker events, so every worker holds the
+    slow requests of all workers; the oldest are dropped beyond max_size.
+    """
+
+    def __init__(self, max_size: int = 500):
+        self._entries: deque = deque(maxlen=max_size)
+
+    def record_event(self, channel: str, message: Dict[str, Any]) -> None:
+        """
+        Keep the message if it is a slow-request event (broker handler)
+        """
+        if message.get("event") == "slow_request":
+            self._entries.append(message)
+
+    def for_user(self, username: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Get a user's slow requests, newest first
+        """
+        entries = []
+        for entry in reversed(self._entries):
+            if entry.get("username") == username:
+                entries.append(entry)
+                if len(entries) >= limit:
+                    break
+        return entries
+
+# Shared by the webhook and viewer routers
+slow_log = SlowRequestLog(SLOW_LOG_SIZE)
+
+def is_slow(overhead: float) -> bool:
+    """
+    Check whether a request's own handling time (in seconds, see
+    StageTimings.overhead) goes over SLOW_REQUEST_MS
+    """
+    return SLOW_REQUEST_MS > 0 and overhead * 1000 >= SLOW_REQUEST_MS
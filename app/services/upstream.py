@@ -0,0 +1,281 @@
+"""
+Forwarding of webhook requests to a user's upstream (proxy mode)
+
+A user with an upstream_url gets the upstream's real response instead of
+default_response: the request is sent on with its method, headers, body and
+the path below /api/@username, through one pooled HTTP client per worker
+whose connections are kept alive between requests. When the upstream
+cannot be reached, times out or answers with a broken response, the webhook
+falls back to default_response and says so in the X-Upstream-Error header.
+
+Users are created without authentication, so upstreams are limited to
+public addresses: a host resolving to a loopback, private, link-local or
+otherwise internal address (the database, cloud metadata, other services on
+the host) is refused when the config is saved and again on every forward,
+where the request goes to the address that was checked. UPSTREAM_ALLOWED_HOSTS
+lists the exceptions (host names, addresses or networks, comma-separated).
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import ipaddress
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException, Request
+
+from app.services import metrics
+from app.services.filters import relative_path
+
+logger = logging.getLogger(__name__)
+
+# Connections to all upstreams per worker, and how many stay open while idle
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 200))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", 50))
+
+# Seconds an idle upstream connection is kept open
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30))
+
+# Seconds allowed to open a connection (the user's upstream_timeout bounds the whole exchange)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3))
+
+# Largest upstream response body stored on the capture (the client always gets all of it)
+UPSTREAM_CAPTURE_LIMIT = int(os.getenv("UPSTREAM_CAPTURE_LIMIT", 65536))
+
+# Upstream hosts allowed although they resolve to internal addresses: host names
+# ("mock-target"), addresses or networks ("10.0.5.0/24"), comma-separated
+UPSTREAM_ALLOWED_HOSTS = tuple(
+    host.strip().lower() for host in os.getenv("UPSTREAM_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+# Seconds a resolved upstream host is reused before it is looked up (and checked) again
+UPSTREAM_DNS_TTL = float(os.getenv("UPSTREAM_DNS_TTL", 30))
+
+# Headers that describe the original connection rather than the request
+SKIPPED_HEADERS = frozenset({
+    "host", "content-length", "connection", "keep-alive", "transfer-encoding",
+    "te", "trailer", "upgrade", "proxy-authorization", "proxy-connection"
+})
+
+# Upstream response headers not passed back: the body is re-sent decoded and re-framed
+SKIPPED_RESPONSE_HEADERS = SKIPPED_HEADERS | {"content-encoding", "server", "date"}
+
+class UpstreamBlocked(Exception):
+    """
+    The upstream host cannot be resolved or resolves to an address that is not allowed
+    """
+
+def _is_internal(address: ipaddress._BaseAddress) -> bool:
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    # Loopback, private, link-local, shared, reserved and unspecified ranges are not global
+    return not address.is_global or address.is_multicast
+
+def _allowed(host: str, address: ipaddress._BaseAddress) -> bool:
+    # An internal address is only allowed through UPSTREAM_ALLOWED_HOSTS
+    if not _is_internal(address):
+        return True
+    for entry in UPSTREAM_ALLOWED_HOSTS:
+        if entry == host:
+            return True
+        try:
+            if address in ipaddress.ip_network(entry, strict=False):
+                return True
+        except ValueError:
+            pass
+    return False
+
+async def resolve_upstream(host: str, port: int) -> List[str]:
+    """
+    Resolve an upstream host and check every address it resolves to
+
+    Args:
+        host: Host name or address of the upstream URL
+        port: Port of the upstream URL
+
+    Returns:
+        List[str]: Addresses the host resolves to, all allowed
+
+    Raises:
+        UpstreamBlocked: If the host does not resolve or an address is not allowed
+    """
+    host = host.lower()
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise UpstreamBlocked(f"Upstream host '{host}' cannot be resolved: {e}")
+
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    for address in addresses:
+        # Drop the scope of link-local IPv6 addresses ("fe80::1%eth0")
+        if not _allowed(host, ipaddress.ip_address(address.split("%")[0])):
+            raise UpstreamBlocked(
+                f"Upstream host '{host}' resolves to {address}, a private or internal address "
+                f"(see UPSTREAM_ALLOWED_HOSTS)"
+            )
+    return addresses
+
+async def validate_upstream(upstream_url: Optional[str], upstream_timeout: Optional[float]) -> None:
+    """
+    Check the proxy settings of a user config
+
+    Raises:
+        HTTPException: If the URL is not http(s), its host does not resolve to
+            an allowed address, or the timeout is not positive
+    """
+    if upstream_url:
+        parts = urlsplit(upstream_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise HTTPException(status_code=400, detail="Upstream URL must be an http(s) URL")
+        try:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            await resolve_upstream(parts.hostname, port)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Upstream URL has an invalid port")
+        except UpstreamBlocked as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if upstream_timeout is not None and upstream_timeout <= 0:
+        raise HTTPException(status_code=400, detail="Upstream timeout must be positive")
+
+def decode_upstream_body(content: bytes, content_type: str) -> Any:
+    """
+    Upstream response body as stored on the capture: parsed JSON, text, or a
+    truncated text with a marker when larger than UPSTREAM_CAPTURE_LIMIT
+    """
+    if len(content) > UPSTREAM_CAPTURE_LIMIT:
+        return content[:UPSTREAM_CAPTURE_LIMIT].decode("utf-8", errors="replace") + f"... [{len(content)} bytes]"
+    text = content.decode("utf-8", errors="replace")
+    if "json" in content_type:
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return text
+
+class UpstreamClient:
+    """
+    Pooled HTTP client shared by every proxied webhook of this worker
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        # (host, port) -> (expiry, checked address)
+        self._addresses: Dict[Tuple[str, int], Tuple[float, str]] = {}
+
+    async def _address(self, host: str, port: int) -> str:
+        # Checked address of an upstream host, looked up again after UPSTREAM_DNS_TTL
+        key = (host, port)
+        cached = self._addresses.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        address = (await resolve_upstream(host, port))[0]
+        if len(self._addresses) >= 10000:
+            self._addresses.clear()
+        self._addresses[key] = (time.monotonic() + UPSTREAM_DNS_TTL, address)
+        return address
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on first use, inside the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                    keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+                ),
+                follow_redirects=False
+            )
+        return self._client
+
+    async def forward(self, username: str, user: Dict[str, Any], request: Request) -> Dict[str, Any]:
+        """
+        Send a webhook request to the user's upstream
+
+        Args:
+            username: User the webhook belongs to
+            user: User config with upstream_url and upstream_timeout
+            request: Incoming webhook request
+
+        Returns:
+            Dict: url and duration, plus status_code, headers (name, value
+                pairs to send back) and content (bytes), or error on failure
+        """
+        upstream_url = user["upstream_url"]
+        timeout = float(user.get("upstream_timeout") or 10)
+
+        path = relative_path(request.url.path, username)
+        url = upstream_url.rstrip("/") + (path if path != "/" else "")
+        if request.url.query:
+            url += "?" + request.url.query
+        target = httpx.URL(url)
+
+        # httpx asks for the encodings it can decode itself
+        headers = {
+            name: value for name, value in request.headers.items()
+            if name not in SKIPPED_HEADERS and name != "accept-encoding"
+        }
+        client_host = request.client.host if request.client else None
+        if client_host:
+            forwarded_for = request.headers.get("x-forwarded-for")
+            headers["x-forwarded-for"] = f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+        headers["x-forwarded-host"] = request.headers.get("host", "")
+        headers["x-forwarded-proto"] = request.url.scheme
+
+        started = metrics.now()
+        try:
+            # Connect to the address that was checked, so a DNS change between
+            # the check and the connection cannot point the request elsewhere
+            address = await self._address(target.host, target.port or (443 if target.scheme == "https" else 80))
+        except UpstreamBlocked as e:
+            duration = metrics.now() - started
+            metrics.UPSTREAM_REQUESTS.labels("blocked").inc()
+            logger.warning(f"Upstream {url} blocked for {username}: {e}")
+            return {"url": url, "error": str(e), "duration": duration}
+        headers["host"] = target.netloc.decode("ascii")
+
+        try:
+            response = await self._get_client().request(
+                request.method,
+                target.copy_with(host=address),
+                headers=headers,
+                content=await request.body(),
+                timeout=httpx.Timeout(timeout, connect=min(timeout, UPSTREAM_CONNECT_TIMEOUT)),
+                extensions={"sni_hostname": target.host}
+            )
+        except httpx.HTTPError as e:
+            duration = metrics.now() - started
+            outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+            metrics.UPSTREAM_REQUESTS.labels(outcome).inc()
+            metrics.UPSTREAM_DURATION.observe(duration)
+            logger.warning(f"Upstream {url} failed for {username}: {type(e).__name__}: {e}")
+            return {"url": url, "error": f"{type(e).__name__}: {e}" if str(e) else type(e).__name__, "duration": duration}
+
+        duration = metrics.now() - started
+        metrics.UPSTREAM_REQUESTS.labels(f"{response.status_code // 100}xx").inc()
+        metrics.UPSTREAM_DURATION.observe(duration)
+        return {
+            "url": url,
+            "status_code": response.status_code,
+            # Pairs, so repeated headers (Set-Cookie) survive
+            "headers": [
+                (name, value) for name, value in response.headers.multi_items()
+                if name not in SKIPPED_RESPONSE_HEADERS
+            ],
+            "content": response.content,
+            "duration": duration
+        }
+
+    async def close(self) -> None:
+        """
+        Close pooled connections (shutdown)
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# One per worker process
+upstream_client = UpstreamClient()
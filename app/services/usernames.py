@@ -0,0 +1,125 @@
+import os
+import math
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Usernames the Bloom filter is sized for at least (more only raise its false-positive rate)
+USERNAME_INDEX_CAPACITY = int(os.getenv("USERNAME_INDEX_CAPACITY", 1000000))
+
+# Usernames kept in the exact set; beyond that, Bloom filter hits are checked in the database
+USERNAME_SET_SIZE = int(os.getenv("USERNAME_SET_SIZE", 200000))
+
+# Usernames read per storage query while loading
+LOAD_BATCH_SIZE = 5000
+
+class BloomFilter:
+    """
+    Bloom filter over strings: no false negatives, about `error_rate` false positives at capacity
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class UsernameIndex:
+    """
+    Taken usernames, for availability checks without a database query
+
+    A Bloom filter holds every username: a miss means the name is free. A
+    hit is confirmed by the exact set (up to USERNAME_SET_SIZE names) or,
+    when the set does not have it, by the database. The index is loaded
+    during warm-up and kept current by create_user and by "user_created"
+    broker events from other workers; until it is loaded every check goes
+    to the database.
+
+    A name created on another worker a moment ago may still be reported as
+    free; create_user checks the database itself, so it is never created twice.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._bloom = BloomFilter(USERNAME_INDEX_CAPACITY)
+        self._exact: Set[str] = set()
+
+    async def load(self, db) -> int:
+        """
+        Read every username from storage
+
+        Returns:
+            int: Number of usernames loaded
+        """
+        usernames = []
+        after = None
+        while True:
+            batch = await db.list_usernames(after, LOAD_BATCH_SIZE)
+            usernames.extend(batch)
+            if len(batch) < LOAD_BATCH_SIZE:
+                break
+            after = batch[-1]
+
+        # Names created while loading were already added; keep them
+        bloom = BloomFilter(max(USERNAME_INDEX_CAPACITY, 2 * len(usernames)))
+        exact = set(usernames[:USERNAME_SET_SIZE])
+        for username in usernames:
+            bloom.add(username)
+        for username in self._exact:
+            bloom.add(username)
+            if len(exact) < USERNAME_SET_SIZE:
+                exact.add(username)
+
+        self._bloom, self._exact = bloom, exact
+        self.loaded = True
+        return len(usernames)
+
+    def add(self, username: str) -> None:
+        """
+        Record a new username
+        """
+        self._bloom.add(username)
+        if len(self._exact) < USERNAME_SET_SIZE:
+            self._exact.add(username)
+
+    def record_event(self, channel: str, message: Dict[str, Any]) -> None:
+        """
+        Record usernames created on any worker (broker handler)
+        """
+        if message.get("event") == "user_created":
+            self.add(channel)
+
+    def lookup(self, username: str) -> Optional[bool]:
+        """
+        Check whether a username is taken without the database
+
+        Returns:
+            True if taken, False if free, None if only the database can tell
+        """
+        if not self.loaded:
+            return True if username in self._exact else None
+        if username not in self._bloom:
+            return False
+        if username in self._exact:
+            return True
+        return None
+
+# Shared by the users API and create_user
+username_index = UsernameIndex()
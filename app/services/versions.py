@@ -0,0 +1,77 @@
+import uuid
+from typing import Dict, Any, Optional
+
+class ChangeVersions:
+    """
+    Per-user change versions, used as ETags by the viewer and its API
+
+    Every insert, delete, clear, config update and recorded replay job is
+    published through the broker, which delivers it to every worker; each
+    worker counts these events per user. A version is therefore known without a database query,
+    and a matching If-None-Match can be answered with 304 straight away.
+
+    Versions start at 0 when a worker starts, so ETags carry a per-worker
+    epoch and only match on the worker that issued them (keep-alive
+    connections usually stay on one worker). Messages the broker dropped
+    also change the epoch, since the events they carried are lost.
+    """
+
+    # Events that change what the viewer shows
+    EVENTS = frozenset(("new_request", "new_requests", "deleted", "cleared", "config_updated", "replayed"))
+
+    def __init__(self):
+        self.enabled = True
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[str, int] = {}
+        self._dropped = lambda: 0
+
+    def configure(self, enabled: bool = True, dropped=None) -> None:
+        """
+        Enable or disable ETags and set the function returning the broker's dropped count
+
+        ETags must be disabled when requests can be captured without a broker
+        event reaching this worker (e.g. VIEWER_POLL_INTERVAL is set).
+        """
+        self.enabled = enabled
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions.clear()
+        if dropped is not None:
+            self._dropped = dropped
+
+    def record_event(self, channel: str, message: Dict[str, Any]) -> None:
+        """
+        Bump the user's version if the message changes their data (broker handler)
+        """
+        if message.get("event") in self.EVENTS:
+            self._versions[channel] = self._versions.get(channel, 0) + 1
+
+    def etag(self, username: str) -> Optional[str]:
+        """
+        Current ETag of the user's data, or None when ETags are disabled
+
+        Take it before querying, so a change racing with the query makes the
+        client fetch again rather than keep stale data.
+        """
+        if not self.enabled:
+            return None
+        return f'W/"{self.epoch}.{self._dropped()}.{self._versions.get(username, 0)}"'
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison)
+    
+    "*" is not honoured: the check runs before the user is known to exist.
+    """
+    if not if_none_match or not etag:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+# Fed by the broker handler in app.main
+change_versions = ChangeVersions()
@@ -0,0 +1,78 @@
+import os
+import time
+import asyncio
+import logging
+
+from fastapi import FastAPI
+
+from app.services.admission import admission
+from app.services.usernames import username_index
+
+logger = logging.getLogger(__name__)
+
+# Connections opened per database client before the worker reports ready
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", 10))
+
+# Users with the most captured requests whose configs are loaded before the worker reports ready
+WARMUP_USERS = int(os.getenv("WARMUP_USERS", 100))
+
+# Seconds between attempts while the database is unreachable
+WARMUP_RETRY_INTERVAL = 2.0
+
+async def open_pools(app: FastAPI, connections: int) -> None:
+    """
+    Open connections on every storage handle by pinging it concurrently
+
+    The ingest and read handles can use different servers (read preference),
+    and exports have their own client, so each distinct handle is pinged.
+    """
+    storages = {}
+    for storage in (app.storage, app.storage_ingest, app.storage_read, app.storage_export):
+        storages[id(storage)] = storage
+    await asyncio.gather(*[
+        storage.ping() for storage in storages.values() for _ in range(connections)
+    ])
+
+async def preload_users(app: FastAPI, limit: int) -> int:
+    """
+    Read the busiest users' configs, so the first webhooks find them in the
+    database cache and their rate limits are known from the first request
+
+    Returns:
+        int: Number of users loaded
+    """
+    if limit <= 0:
+        return 0
+    users = await app.storage_ingest.busiest_users(limit)
+    for user in users:
+        admission.configure(user["username"], user)
+    return len(users)
+
+async def warm_up(app: FastAPI) -> None:
+    """
+    Warm this worker up, then mark it ready (app.state.ready)
+
+    Opens database connections, loads the busiest users' configs and the
+    username index.
+
+    Runs in the background after startup: requests are served meanwhile,
+    but the readiness endpoint answers 503 until it completes. Retries
+    until the database answers.
+    """
+    started = time.perf_counter()
+    while True:
+        try:
+            await open_pools(app, WARMUP_CONNECTIONS)
+            users = await preload_users(app, WARMUP_USERS)
+            # From the primary: a name missing from the index would be reported free
+            usernames = await username_index.load(app.storage)
+            break
+        except Exception as e:
+            logger.warning(f"Warm-up failed, retrying in {WARMUP_RETRY_INTERVAL}s: {e}")
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+    app.state.ready = True
+    logger.info(
+        f"Worker ready after {(time.perf_counter() - started) * 1000:.0f} ms warm-up "
+        f"({users} user configs, {usernames} usernames loaded)"
+    )
@@ -1,23 +1,31 @@
 import os
 import json
 import random
-import time
 import uuid
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Union, Tuple
 import logging
 import traceback
 
 from fastapi import HTTPException, Request
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.storage import Storage
+from app.services import metrics
+from app.services.timing import StageTimings
+from app.services.admission import admission
+from app.services.usernames import username_index
+from app.services.upstream import validate_upstream
+from app.services.behaviors import validate_behaviors
 from io import StringIO
 import csv
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def simulate_processing_time(min_time: int, max_time: int) -> int:
+# Seconds a reserved sequence number may take to be stored; the changes
+# cursor does not move past a gap younger than this (it may still fill)
+SEQ_SETTLE_SECONDS = float(os.getenv("SEQ_SETTLE_SECONDS", 5))
+
+async def simulate_processing_time(min_time: int, max_time: int) -> int:
     """
     Simulate processing time between min_time and max_time in milliseconds
     
@@ -37,39 +45,85 @@ def simulate_processing_time(min_time: int, max_time: int) -> int:
     # Generate random time in range
     process_time = random.randint(min_time, max_time)
     
-    # Sleep for that duration (convert to seconds)
-    time.sleep(process_time / 1000)
+    # Wait for that duration (convert to seconds) without blocking other requests
+    if process_time > 0:
+        await asyncio.sleep(process_time / 1000)
     
     return process_time
 
+def serialize_webhook_request(req: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a stored request document to the JSON row used by the API and live streams
+    
+    Args:
+        req: Request document
+        
+    Returns:
+        Dict: JSON-serializable request summary
+    """
+    request_time = req.get('request_time')
+    
+    return {
+        'id': req.get('id', ''),
+        'seq': req.get('seq'),
+        'username': req.get('username', ''),
+        'method': req.get('method', ''),
+        'path': req.get('path', ''),
+        'request_time': (request_time or datetime.utcnow()).isoformat(),
+        'body': req.get('body', None),
+        'response': req.get('response', None),
+        'response_time': req.get('response_time', 0),
+        'timings': req.get('timings'),
+        'headers': req.get('headers', {}),
+        'query_params': req.get('query_params', {}),
+        'upstream': req.get('upstream'),
+        'behavior': req.get('behavior'),
+        'replays': req.get('replays', [])
+    }
+
 async def save_webhook_request(
-    db: AsyncIOMotorDatabase,
+    db: Storage,
     username: str,
     request: Request,
     response: Any,
-    response_time: int
-) -> str:
+    response_time: int,
+    timings: Optional[StageTimings] = None,
+    upstream: Optional[Dict[str, Any]] = None,
+    behavior: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
     Save a webhook request to the database with enhanced logging
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to save request for
         request: FastAPI request object
         response: Response data returned to client
         response_time: Processing time in milliseconds
+        timings: Stage timings of the request; stages up to the insert are
+            stored on the document
+        upstream: Upstream exchange of a proxied request (url, status_code,
+            headers, duration_ms or error)
+        behavior: Behaviour script that answered the request (script, call, status_code)
         
     Returns:
-        str: Request ID
+        Dict: Saved request document
     """
     # Log request information
-    logger.info(f"Saving {request.method} request for username: {username}")
+    # Per-request lines use lazy %-formatting, unlike the f-strings elsewhere: with
+    # LOG_SAMPLING the message is only built if the record is kept (see services/logs.py)
+    logger.info("Saving %s request for username: %s", request.method, username)
+    
+    if timings is None:
+        timings = StageTimings()
     
     # Get request body
     body = None
     try:
         # Read the body
+        started = metrics.now()
         raw_body = await request.body()
+        timings.record("body_read", started, metrics.STAGE_BODY_READ)
         
         if raw_body:
             # Try to decode and parse as JSON
@@ -89,10 +143,29 @@ async def save_webhook_request(
         logger.error(f"Error reading request body: {e}")
         body = None
 
+    # Check if user has reached the maximum number of requests
+    started = metrics.now()
+    count = await db.count_requests(username)
+    max_requests = max_requests_per_user(db)
+    
+    if count >= max_requests:
+        # Delete the oldest requests to stay under the limit
+        logger.warning(f"User {username} has reached the maximum of {max_requests} requests. Deleting oldest.")
+        await db.delete_oldest_request(username)
+    timings.record("retention", started, metrics.STAGE_RETENTION)
+    
+    # Reserve the per-user sequence number just before the insert: captures
+    # committing out of sequence order are handled by readers, but the window
+    # for it stays one round trip
+    started = metrics.now()
+    seq = await allocate_request_seq(db, username)
+    timings.record("allocate_seq", started, metrics.STAGE_SEQ)
+    
     # Create request document with unique id
     request_id = str(uuid.uuid4())
     request_doc = {
         "id": request_id,
+        "seq": seq,
         "username": username,
         "method": request.method,
         "headers": dict(request.headers),
@@ -101,41 +174,64 @@ async def save_webhook_request(
         "body": body,
         "response": response,
         "request_time": datetime.utcnow(),
-        "response_time": response_time  # in milliseconds
+        "response_time": response_time,  # in milliseconds
+        "timings": timings.as_ms()  # stage durations in milliseconds
     }
-    
-    # Check if user has reached the maximum number of requests
-    count = await db.webhook_requests.count_documents({"username": username})
-    max_requests = int(os.getenv("MAX_REQUESTS_PER_USER", 100000))
-    
-    if count >= max_requests:
-        # Delete the oldest requests to stay under the limit
-        logger.warning(f"User {username} has reached the maximum of {max_requests} requests. Deleting oldest.")
-        oldest_requests = await db.webhook_requests.find(
-            {"username": username},
-            sort=[("request_time", 1)]
-        ).limit(1).to_list(length=1)
-        
-        if oldest_requests:
-            await db.webhook_requests.delete_one({"_id": oldest_requests[0]["_id"]})
+    if upstream is not None:
+        request_doc["upstream"] = upstream
+    if behavior is not None:
+        request_doc["behavior"] = behavior
     
     try:
         # Insert request document
-        result = await db.webhook_requests.insert_one(request_doc)
-        logger.info(f"Request saved with ID: {request_id}")
+        started = metrics.now()
+        await db.insert_request(request_doc)
+        timings.record("insert", started, metrics.STAGE_INSERT)
+        logger.info("Request saved with ID: %s", request_id)
         
-        return request_id
+        return request_doc
     except Exception as insert_error:
         logger.error(f"Error inserting request document: {insert_error}")
         logger.error(traceback.format_exc())
         raise
 
-async def get_user_config(db: AsyncIOMotorDatabase, username: str) -> Dict[str, Any]:
+def max_requests_per_user(db: Storage) -> int:
+    """
+    Requests kept per user: MAX_REQUESTS_PER_USER, or the storage's own limit when lower
+    
+    Args:
+        db: Storage backend
+        
+    Returns:
+        int: Retention limit applied when saving and importing requests
+    """
+    max_requests = int(os.getenv("MAX_REQUESTS_PER_USER", 100000))
+    if db.max_requests_per_user is not None:
+        max_requests = min(max_requests, db.max_requests_per_user)
+    return max_requests
+
+async def allocate_request_seq(db: Storage, username: str) -> Optional[int]:
+    """
+    Reserve the next sequence number for a user's requests
+    
+    Sequence numbers are monotonic per user across all workers and let live
+    streams resume from the last event a client received.
+    
+    Args:
+        db: Storage backend
+        username: Username to allocate for
+        
+    Returns:
+        int: Allocated sequence number, or None if the user does not exist
+    """
+    return await db.allocate_seq(username)
+
+async def get_user_config(db: Storage, username: str) -> Dict[str, Any]:
     """
     Get user configuration by username
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to look up
         
     Returns:
@@ -144,18 +240,22 @@ async def get_user_config(db: AsyncIOMotorDatabase, username: str) -> Dict[str,
     Raises:
         HTTPException: If user not found
     """
-    user = await db.users.find_one({"username": username})
+    user = await db.get_user(username)
     if not user:
         logger.warning(f"User not found: {username}")
         raise HTTPException(status_code=404, detail=f"User '{username}' not found")
     return user
 
-async def check_username_available(db: AsyncIOMotorDatabase, username: str) -> bool:
+async def check_username_available(db: Storage, username: str) -> bool:
     """
     Check if a username is available
     
+    Answered from the in-memory username index when it can tell, otherwise
+    from the database. A name created on another worker a moment ago may
+    still be reported as available.
+    
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to check
         
     Returns:
@@ -163,39 +263,65 @@ async def check_username_available(db: AsyncIOMotorDatabase, username: str) -> b
     """
     if not username or not username.isalnum():
         return False
-        
-    existing = await db.users.find_one({"username": username})
+    
+    taken = username_index.lookup(username)
+    if taken is not None:
+        metrics.USERNAME_CHECKS.labels("index").inc()
+        return not taken
+    
+    metrics.USERNAME_CHECKS.labels("database").inc()
+    existing = await db.get_user(username)
+    if existing is not None:
+        username_index.add(username)
     return existing is None
 
 async def create_user(
-    db: AsyncIOMotorDatabase, 
+    db: Storage, 
     username: str, 
     default_response: Dict[str, Any],
     response_time_min: int, 
-    response_time_max: int
+    response_time_max: int,
+    rate_limit: float = 0,
+    rate_burst: int = 0,
+    max_concurrency: int = 0,
+    upstream_url: Optional[str] = None,
+    upstream_timeout: float = 10,
+    behaviors: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
     """
     Create a new user
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to create
         default_response: Default response to return
         response_time_min: Minimum response time in milliseconds
         response_time_max: Maximum response time in milliseconds
+        rate_limit: Requests per second accepted per worker (0 for no limit)
+        rate_burst: Requests accepted at once above the rate (0 for one second worth)
+        max_concurrency: Requests in progress per worker (0 for no limit)
+        upstream_url: Forward webhooks to this URL (proxy mode), None to answer default_response
+        upstream_timeout: Seconds allowed for the upstream's response
+        behaviors: Behaviour scripts (see services/behaviors.py)
         
     Returns:
         Dict: Created user document
         
     Raises:
-        HTTPException: If username invalid or already exists
+        HTTPException: If username invalid or already exists, a limit is
+            negative, or the upstream settings or scripts are invalid
     """
     # Validate username
     if not username or not username.isalnum():
         raise HTTPException(status_code=400, detail="Username must be alphanumeric")
+    
+    validate_limits(rate_limit, rate_burst, max_concurrency)
+    await validate_upstream(upstream_url, upstream_timeout)
+    validate_behaviors(behaviors)
         
-    # Check if username already exists
-    if not await check_username_available(db, username):
+    # Check if username already exists (in the database: the index may lag behind other workers)
+    if await db.get_user(username) is not None:
+        username_index.add(username)
         raise HTTPException(status_code=400, detail=f"Username '{username}' already exists")
     
     # Create user document
@@ -204,42 +330,62 @@ async def create_user(
         "created_at": datetime.utcnow(),
         "default_response": default_response,
         "response_time_min": response_time_min,
-        "response_time_max": response_time_max
+        "response_time_max": response_time_max,
+        "rate_limit": rate_limit,
+        "rate_burst": rate_burst,
+        "max_concurrency": max_concurrency,
+        "upstream_url": upstream_url or None,
+        "upstream_timeout": upstream_timeout,
+        "behaviors": behaviors or []
     }
     
     logger.info(f"Creating new user: {username}")
     
     # Insert user document
-    await db.users.insert_one(user_doc)
+    await db.insert_user(user_doc)
+    username_index.add(username)
+    admission.configure(username, user_doc)
     return user_doc
 
 async def update_user(
-    db: AsyncIOMotorDatabase, 
+    db: Storage, 
     username: str, 
     default_response: Optional[Dict[str, Any]] = None,
     response_time_min: Optional[int] = None, 
-    response_time_max: Optional[int] = None
+    response_time_max: Optional[int] = None,
+    rate_limit: Optional[float] = None,
+    rate_burst: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    upstream_url: Optional[str] = None,
+    upstream_timeout: Optional[float] = None,
+    behaviors: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
     """
     Update user configuration
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to update
         default_response: New default response
         response_time_min: New minimum response time
         response_time_max: New maximum response time
+        rate_limit: New rate limit (requests per second per worker)
+        rate_burst: New burst size
+        max_concurrency: New concurrency cap (per worker)
+        upstream_url: New upstream URL, "" to turn proxy mode off
+        upstream_timeout: New upstream timeout in seconds
+        behaviors: New behaviour scripts, [] to remove them
         
     Returns:
         Dict: Updated user document
         
     Raises:
-        HTTPException: If user not found
+        HTTPException: If user not found, a limit is negative, or the upstream
+            settings or scripts are invalid
     """
-    # Get user
-    user = await db.users.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail=f"User '{username}' not found")
+    validate_limits(rate_limit or 0, rate_burst or 0, max_concurrency or 0)
+    await validate_upstream(upstream_url, upstream_timeout)
+    validate_behaviors(behaviors)
     
     # Create update document
     update_doc = {}
@@ -249,35 +395,56 @@ async def update_user(
         update_doc["response_time_min"] = response_time_min
     if response_time_max is not None:
         update_doc["response_time_max"] = response_time_max
+    if rate_limit is not None:
+        update_doc["rate_limit"] = rate_limit
+    if rate_burst is not None:
+        update_doc["rate_burst"] = rate_burst
+    if max_concurrency is not None:
+        update_doc["max_concurrency"] = max_concurrency
+    if upstream_url is not None:
+        update_doc["upstream_url"] = upstream_url or None
+    if upstream_timeout is not None:
+        update_doc["upstream_timeout"] = upstream_timeout
+    if behaviors is not None:
+        update_doc["behaviors"] = behaviors
     
     if update_doc:
         logger.info(f"Updating user: {username}")
-        # Update user document
-        await db.users.update_one(
-            {"username": username},
-            {"$set": update_doc}
-        )
     
-    # Get updated user
-    updated_user = await db.users.find_one({"username": username})
+    # Update user document and get the updated user
+    updated_user = await db.update_user(username, update_doc)
+    if not updated_user:
+        raise HTTPException(status_code=404, detail=f"User '{username}' not found")
+    
+    # Other workers pick the new limits up with the user's next request
+    admission.configure(username, updated_user)
     return updated_user
 
-async def get_webhook_requests_count(db: AsyncIOMotorDatabase, username: str) -> int:
+def validate_limits(rate_limit: float, rate_burst: int, max_concurrency: int) -> None:
+    """
+    Check admission limits of a user config
+    
+    Raises:
+        HTTPException: If a limit is negative
+    """
+    if rate_limit < 0 or rate_burst < 0 or max_concurrency < 0:
+        raise HTTPException(status_code=400, detail="Rate limit, burst and concurrency limit cannot be negative")
+
+async def get_webhook_requests_count(db: Storage, username: str) -> int:
     """
     Get the total count of webhook requests for a user
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to get count for
         
     Returns:
         int: Total number of requests
     """
-    count = await db.webhook_requests.count_documents({"username": username})
-    return count
+    return await db.count_requests(username)
 
 async def get_webhook_requests(
-    db: AsyncIOMotorDatabase, 
+    db: Storage, 
     username: str, 
     limit: int = 10, 
     skip: int = 0
@@ -286,7 +453,7 @@ async def get_webhook_requests(
     Get webhook requests for a user with pagination
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to get requests for
         limit: Maximum number of requests to return
         skip: Number of requests to skip (for pagination)
@@ -294,15 +461,89 @@ async def get_webhook_requests(
     Returns:
         List[Dict]: List of request documents
     """
-    cursor = db.webhook_requests.find(
-        {"username": username},
-        sort=[("request_time", -1)]  # Sort by newest first
-    ).skip(skip).limit(limit)
+    return await db.list_requests(username, limit, skip)
+
+async def get_webhook_requests_since(
+    db: Storage,
+    username: str,
+    seq: int,
+    limit: int = 100
+) -> List[Dict[str, Any]]:
+    """
+    Get webhook requests with a sequence number greater than seq, oldest first
+    
+    Args:
+        db: Storage backend
+        username: Username to get requests for
+        seq: Last sequence number already seen
+        limit: Maximum number of requests to return
+        
+    Returns:
+        List[Dict]: List of request documents
+    """
+    return await db.requests_since(username, seq, limit)
+
+async def get_webhook_request_changes(
+    db: Storage,
+    username: str,
+    since: int,
+    limit: int = 500
+) -> Dict[str, Any]:
+    """
+    Get the changes to a user's requests after a sequence number
+    
+    New requests and deletions share the user's sequence, so a client holding
+    everything up to `since` can apply the result and continue from `cursor`.
+    Requests removed by clearing or by the per-user retention limit are not
+    listed one by one; clients drop every row older than `oldest_seq` instead.
+    
+    Sequence numbers are reserved before the insert, so a lower one can be
+    stored after a higher one. The cursor stops before a gap that may still
+    fill (see _settled_cursor) and changes past it are returned again by the
+    next call; clients apply them by request id.
+    
+    Args:
+        db: Storage backend
+        username: Username to get changes for
+        since: Last sequence number the client has applied
+        limit: Maximum number of changes to return
+        
+    Returns:
+        Dict: requests (oldest first), deleted request ids, oldest_seq still
+            stored (None if there are no requests), current count, cursor and has_more
+    """
+    requests = await db.requests_since(username, since, limit + 1)
+    deletions = await db.deletions_since(username, since, limit + 1)
     
-    return await cursor.to_list(length=limit)
+    # Merge both streams in sequence order and keep the first `limit` changes
+    changes = sorted(requests + deletions, key=lambda doc: doc["seq"])[:limit]
+    
+    return {
+        "requests": [doc for doc in changes if "request_id" not in doc],
+        "deleted": [doc["request_id"] for doc in changes if "request_id" in doc],
+        "oldest_seq": await db.oldest_seq(username),
+        "count": await db.count_requests(username),
+        "cursor": _settled_cursor(changes, since),
+        "has_more": len(requests) + len(deletions) > len(changes)
+    }
+
+def _settled_cursor(changes: List[Dict[str, Any]], since: int) -> int:
+    # Follow the changes while their sequence numbers are contiguous; a gap
+    # counts as settled once the change after it is SEQ_SETTLE_SECONDS old
+    # (the missing number was reserved before that change was stored).
+    # Gaps from deleted or trimmed requests settle like any other.
+    settled_before = datetime.utcnow() - timedelta(seconds=SEQ_SETTLE_SECONDS)
+    cursor = since
+    for change in changes:
+        if change["seq"] > cursor + 1:
+            stored_at = change.get("request_time") or change.get("deleted_at")
+            if stored_at is not None and stored_at > settled_before:
+                break
+        cursor = change["seq"]
+    return cursor
 
 async def delete_webhook_request(
-    db: AsyncIOMotorDatabase, 
+    db: Storage, 
     username: str, 
     request_id: str
 ) -> bool:
@@ -310,7 +551,7 @@ async def delete_webhook_request(
     Delete a specific webhook request by ID
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username the request belongs to
         request_id: ID of the request to delete
         
@@ -318,49 +559,65 @@ async def delete_webhook_request(
         bool: True if deleted, False if not found
     """
     # Delete the request
-    result = await db.webhook_requests.delete_one(
-        {"username": username, "id": request_id}
-    )
+    deleted = await db.delete_request(username, request_id)
+    
+    if deleted:
+        # Leave a tombstone so delta sync clients learn about the deletion
+        await db.insert_deletion(
+            username, request_id, await allocate_request_seq(db, username), datetime.utcnow()
+        )
     
     # Return success indicator
-    return result.deleted_count > 0
+    return deleted
 
-async def clear_webhook_requests(db: AsyncIOMotorDatabase, username: str) -> int:
+async def clear_webhook_requests(db: Storage, username: str) -> int:
     """
     Clear all webhook requests for a user
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to clear requests for
         
     Returns:
         int: Number of deleted requests
     """
-    result = await db.webhook_requests.delete_many({"username": username})
-    return result.deleted_count
+    deleted_count = await db.clear_requests(username)
+    
+    # Clients see the clear through oldest_seq, older tombstones are no longer needed
+    await db.clear_deletions(username)
+    
+    return deleted_count
 
-async def export_webhook_requests_csv(db: AsyncIOMotorDatabase, username: str) -> str:
+async def export_webhook_requests_csv(db: Storage, username: str) -> str:
     """
     Export webhook requests to CSV
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to export requests for
         
     Returns:
         str: CSV content
     """
     # Get all webhook requests for the user (limit to most recent 10,000)
-    cursor = db.webhook_requests.find(
-        {"username": username},
-        sort=[("request_time", -1)]
-    ).limit(10000)
-    
-    requests = await cursor.to_list(length=10000)
+    requests = await db.list_requests(username, 10000)
     
     if not requests:
         return "No requests found"
     
+    # Building thousands of rows takes a while; keep it off the event loop
+    return await asyncio.to_thread(build_requests_csv, requests)
+
+def build_requests_csv(requests: List[Dict[str, Any]]) -> str:
+    """
+    Build the CSV export of request documents
+    
+    Args:
+        requests: Request documents
+        
+    Returns:
+        str: CSV content
+    """
     # Create CSV content
     output = StringIO()
     csv_writer = csv.writer(output)
@@ -403,7 +660,7 @@ async def export_webhook_requests_csv(db: AsyncIOMotorDatabase, username: str) -
     return output.getvalue()
 
 async def search_webhook_requests(
-    db: AsyncIOMotorDatabase,
+    db: Storage,
     username: str,
     query: str,
     limit: int = 10
@@ -412,7 +669,7 @@ async def search_webhook_requests(
     Search webhook requests by method, path, or content
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to search requests for
         query: Search query string
         limit: Maximum number of results to return
@@ -420,79 +677,28 @@ async def search_webhook_requests(
     Returns:
         List[Dict]: List of matching request documents
     """
-    # Create search criteria
-    search_criteria = {
-        "$and": [
-            {"username": username},
-            {"$or": [
-                {"method": {"$regex": query, "$options": "i"}},
-                {"path": {"$regex": query, "$options": "i"}},
-                # Use $toString to convert ObjectId to string for regex search
-                {"id": {"$regex": query, "$options": "i"}}
-            ]}
-        ]
-    }
-    
-    # Execute search
-    cursor = db.webhook_requests.find(
-        search_criteria,
-        sort=[("request_time", -1)]
-    ).limit(limit)
-    
-    return await cursor.to_list(length=limit)
+    return await db.search_requests(username, query, limit)
 
 async def get_request_statistics(
-    db: AsyncIOMotorDatabase,
+    db: Storage,
     username: str
 ) -> Dict[str, Any]:
     """
     Get statistics about webhook requests
     
     Args:
-        db: MongoDB database connection
+        db: Storage backend
         username: Username to get statistics for
         
     Returns:
         Dict: Statistics about webhook requests
     """
-    # Get total request count
-    total_count = await db.webhook_requests.count_documents({"username": username})
-    
-    # Get method counts using aggregation
-    method_counts = []
-    if total_count > 0:
-        method_counts_cursor = db.webhook_requests.aggregate([
-            {"$match": {"username": username}},
-            {"$group": {"_id": "$method", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
-        ])
-        method_counts = await method_counts_cursor.to_list(length=10)
-    
-    # Get average response time
-    avg_response_time = 0
-    if total_count > 0:
-        avg_time_cursor = db.webhook_requests.aggregate([
-            {"$match": {"username": username}},
-            {"$group": {"_id": None, "avg_time": {"$avg": "$response_time"}}}
-        ])
-        avg_time_results = await avg_time_cursor.to_list(length=1)
-        if avg_time_results:
-            avg_response_time = round(avg_time_results[0]["avg_time"], 2)
-    
-    # Get latest request time
-    latest_request = None
-    if total_count > 0:
-        latest = await db.webhook_requests.find_one(
-            {"username": username},
-            sort=[("request_time", -1)]
-        )
-        if latest:
-            latest_request = latest.get("request_time")
+    stats = await db.request_stats(username)
     
     # Return statistics
     return {
-        "total_requests": total_count,
-        "method_counts": {item["_id"]: item["count"] for item in method_counts},
-        "average_response_time": avg_response_time,
-        "latest_request_time": latest_request.isoformat() if latest_request else None
-    }
\ No newline at end of file
+        "total_requests": stats["count"],
+        "method_counts": stats["method_counts"],
+        "average_response_time": round(stats["average_response_time"], 2) if stats["average_response_time"] else 0,
+        "latest_request_time": stats["latest_request_time"].isoformat() if stats["latest_request_time"] else None
+    }
@@ -4,12 +4,32 @@
 let websocket;
 let requests = [];
 let currentPage = 0;
-const pageSize = 10; // Number of requests per page
+const pageSize = 100; // Number of requests per page
 let username = '';
 let requestModal;
 let toast;
 let isLoading = false;
 let hasMoreRequests = true;
+let lastSeq = null; // Sequence number of the newest live event received
+let wsFailures = 0; // Consecutive WebSocket attempts that never opened
+let eventSource;
+let syncing = false; // A delta sync is in flight
+let syncPending = false; // Another delta sync was asked for meanwhile
+
+// The request list is virtualized: only the rows in view are in the DOM
+const ROW_HEIGHT = 340; // Height of a request card including its margin, in pixels
+const OVERSCAN = 4; // Rows rendered above and below the visible ones
+const CARD_CACHE_SIZE = 200; // Card elements kept for reuse while scrolling
+const MAX_SYNC_PAGES = 20; // Delta pages fetched before falling back to a full reload
+let renderedRange = null;
+let renderScheduled = false;
+const cardCache = new Map();
+const freshIds = new Set(); // Requests highlighted as new
+
+// Slow requests (webhooks and viewer API calls over the server's threshold)
+const SLOW_LOG_SIZE = 100; // Slow requests kept in the list
+let slowRequests = [];
+let slowLoaded = false;
 
 // Safe syntax highlighting function
 function safeHighlightCode(element) {
@@ -82,54 +102,23 @@ function setupCodeHighlighting() {
 // Connect to WebSocket for real-time updates
 function connectWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws/viewer/@${username}`;
+    const resume = lastSeq !== null ? `?last_event_id=${lastSeq}` : '';
+    const wsUrl = `${protocol}//${window.location.host}/ws/viewer/@${username}${resume}`;
     console.log("Connecting to WebSocket:", wsUrl);
     
+    let opened = false;
     websocket = new WebSocket(wsUrl);
     
     websocket.onopen = function(event) {
         console.log('WebSocket connection established');
+        opened = true;
+        wsFailures = 0;
         updateConnectionStatus('connected');
     };
     
     websocket.onmessage = function(event) {
         try {
-            const data = JSON.parse(event.data);
-            console.log("WebSocket message received:", data);
-            
-            // Handle different types of WebSocket events
-            switch(data.event) {
-                case 'connected':
-                    // Initial connection event
-                    console.log('WebSocket connected for username:', data.username);
-                    break;
-                
-                case 'new_request':
-                    // New request received
-                    const toastTime = document.getElementById('toastTime');
-                    const toastContent = document.getElementById('toastContent');
-                    
-                    if (toastTime) toastTime.textContent = new Date().toLocaleTimeString();
-                    if (toastContent) toastContent.textContent = `New ${data.method} request received`;
-                    
-                    try {
-                        toast.show();
-                    } catch (e) {
-                        console.error('Error showing toast:', e);
-                    }
-                    
-                    // Refresh requests to show the latest request
-                    refreshRequests();
-                    break;
-                
-                case 'ping':
-                    // Keep-alive ping from server
-                    console.log('Received ping from server');
-                    break;
-                
-                default:
-                    console.log('Unhandled WebSocket event:', data.event);
-            }
+            handleLiveEvent(JSON.parse(event.data));
         } catch (error) {
             console.error('Error processing WebSocket message:', error);
         }
@@ -139,6 +128,12 @@ function connectWebSocket() {
         console.log("WebSocket connection closed");
         updateConnectionStatus('disconnected');
         
+        // Some proxies block WebSockets; switch to Server-Sent Events instead
+        if (!opened && ++wsFailures >= 2) {
+            connectEventSource();
+            return;
+        }
+        
         // Try to reconnect after a random interval to prevent thundering herd
         const reconnectTimeout = 5000 + Math.random() * 5000;
         setTimeout(connectWebSocket, reconnectTimeout);
@@ -150,6 +145,146 @@ function connectWebSocket() {
     };
 }
 
+// Connect to the Server-Sent Events stream (fallback when WebSockets fail)
+function connectEventSource() {
+    const resume = lastSeq !== null ? `?last_event_id=${lastSeq}` : '';
+    const sseUrl = `/sse/viewer/@${username}${resume}`;
+    console.log("Connecting to event stream:", sseUrl);
+    
+    // The browser reconnects by itself and resumes with the Last-Event-ID header
+    eventSource = new EventSource(sseUrl);
+    
+    eventSource.onopen = function() {
+        updateConnectionStatus('connected');
+    };
+    
+    eventSource.onmessage = function(event) {
+        try {
+            handleLiveEvent(JSON.parse(event.data));
+        } catch (error) {
+            console.error('Error processing stream message:', error);
+        }
+    };
+    
+    eventSource.onerror = function() {
+        updateConnectionStatus('disconnected');
+    };
+}
+
+// Handle an event received over the WebSocket or the event stream
+function handleLiveEvent(data) {
+    console.log("Live event received:", data);
+    
+    if (typeof data.seq === 'number') {
+        lastSeq = Math.max(lastSeq || 0, data.seq);
+    }
+    
+    // Handle different types of live events
+    switch(data.event) {
+        case 'connected':
+            // Initial connection event
+            console.log('Live updates connected for username:', data.username);
+            if (typeof data.request_count === 'number') {
+                setRequestCount(data.request_count);
+            }
+            
+            // After a reconnect, catch up on changes made while disconnected
+            if (lastSeq !== null) {
+                syncRequests();
+            }
+            break;
+        
+        case 'new_request':
+            // New request received
+            const toastTime = document.getElementById('toastTime');
+            const toastContent = document.getElementById('toastContent');
+            
+            if (toastTime) toastTime.textContent = new Date().toLocaleTimeString();
+            if (toastContent) toastContent.textContent = `New ${data.method} request received`;
+            
+            try {
+                toast.show();
+            } catch (e) {
+                console.error('Error showing toast:', e);
+            }
+            
+            // The request is pushed inline; fetch the changes if it is missing
+            if (data.request) {
+                applyPushedRequests([data.request], 1);
+            } else {
+                syncRequests();
+            }
+            break;
+
+        case 'batch':
+            // Several requests received within one flush interval
+            if (data.count > 0) {
+                showToast(`${data.count} new requests received`);
+            }
+            
+            if (data.truncated) {
+                syncRequests();
+            } else {
+                const pushed = data.events
+                    .filter(e => e.event === 'new_request' && e.request)
+                    .map(e => e.request);
+                applyPushedRequests(pushed, data.count);
+                
+                // Deletions can be batched together with new requests
+                data.events
+                    .filter(e => e.event !== 'new_request')
+                    .forEach(handleLiveEvent);
+            }
+            break;
+
+        case 'new_requests':
+            // Several requests coalesced by the server while this client was behind
+            showToast(`${data.count} new requests received`);
+            syncRequests();
+            break;
+
+        case 'reset':
+            // Too many events were missed to replay; fetch the changes instead
+            syncRequests();
+            break;
+
+        case 'deleted':
+            // Requests deleted from another tab or by another client
+            removeRequests(data.request_ids || []);
+            break;
+
+        case 'cleared':
+            // All requests were cleared
+            requests = [];
+            cardCache.clear();
+            setRequestCount(0);
+            renderRequestWindow(true);
+            break;
+
+        case 'slow_request':
+            // A request went over the server's slow-request threshold
+            addSlowRequest(data);
+            break;
+
+        case 'replayed':
+            // A replay job recorded its results on the captures
+            refreshRequests();
+            break;
+
+        case 'config_updated':
+            // Settings changed; the settings form keeps what was submitted
+            break;
+
+        case 'ping':
+            // Keep-alive ping from server
+            console.log('Received ping from server');
+            break;
+        
+        default:
+            console.log('Unhandled live event:', data.event);
+    }
+}
+
 // Update connection status indicator
 function updateConnectionStatus(status) {
     const statusIndicator = document.getElementById('connectionStatus');
@@ -233,15 +368,25 @@ function loadRequests(loadMore = false) {
                 loadMoreContainer.style.display = hasMoreRequests ? 'block' : 'none';
             }
             
+            // Live events resume from the newest request shown
+            if (!loadMore && data.length > 0 && typeof data[0].seq === 'number') {
+                lastSeq = Math.max(lastSeq || 0, data[0].seq);
+            }
+            
+            isLoading = false;
+            
             if (loadMore) {
-                // Append new requests to existing array
-                requests = requests.concat(data);
-                renderRequests(data, true);
+                // Append new requests to existing array, skipping any already shown
+                const shown = new Set(requests.map(req => req.id));
+                requests = requests.concat(data.filter(req => !shown.has(req.id)));
             } else {
                 // Replace requests with new data
                 requests = data;
-                renderRequests(data, false);
+                cardCache.clear();
+                const container = document.getElementById('requestsContainer');
+                if (container) container.scrollTop = 0;
             }
+            renderRequestWindow(true);
             
             // Update request count
             const requestCountElem = document.getElementById('requestCount');
@@ -257,8 +402,6 @@ function loadRequests(loadMore = false) {
                         requestCountElem.textContent = requests.length;
                     });
             }
-            
-            isLoading = false;
         })
         .catch(error => {
             console.error('Error loading requests:', error);
@@ -282,86 +425,355 @@ function refreshRequests() {
     loadRequests(false);
 }
 
-// Render requests to the container
-function renderRequests(requestsToRender, append = false) {
+// Fetch the changes since the newest sequence number seen and apply them
+function syncRequests() {
+    // Nothing to sync from before the first load
+    if (lastSeq === null) {
+        refreshRequests();
+        return;
+    }
+    
+    if (syncing) {
+        syncPending = true;
+        return;
+    }
+    syncing = true;
+    
+    fetchChanges(lastSeq, 0)
+        .catch(error => {
+            console.error('Error syncing requests:', error);
+        })
+        .finally(() => {
+            syncing = false;
+            if (syncPending) {
+                syncPending = false;
+                syncRequests();
+            }
+        });
+}
+
+// Fetch one page of changes, following the cursor while there are more
+function fetchChanges(since, pages) {
+    return fetch(`/api/requests/@${username}/changes?since=${since}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(changes => {
+            applyChanges(changes);
+            
+            if (!changes.has_more) return;
+            
+            // Far behind: reloading the first page is cheaper than replaying everything
+            if (pages + 1 >= MAX_SYNC_PAGES) {
+                refreshRequests();
+                return;
+            }
+            return fetchChanges(changes.cursor, pages + 1);
+        });
+}
+
+// Apply a page from the changes API to the list
+function applyChanges(changes) {
+    lastSeq = Math.max(lastSeq || 0, changes.cursor);
+    
+    // Rows older than the oldest stored request were cleared or trimmed by retention
+    const oldestSeq = changes.oldest_seq;
+    requests = requests.filter(req => oldestSeq !== null && (typeof req.seq !== 'number' || req.seq >= oldestSeq));
+    
+    removeRequests(changes.deleted || []);
+    applyPushedRequests(changes.requests || [], 0);
+    renderRequestWindow(true);
+    
+    if (typeof changes.count === 'number') {
+        setRequestCount(changes.count);
+    }
+}
+
+// Remove requests from the list by id
+function removeRequests(requestIds) {
+    if (requestIds.length === 0) return;
+    
+    const ids = new Set(requestIds);
+    const remaining = requests.filter(req => !ids.has(req.id));
+    const removed = requests.length - remaining.length;
+    
+    requestIds.forEach(id => cardCache.delete(id));
+    
+    if (removed > 0) {
+        requests = remaining;
+        adjustRequestCount(-removed);
+        renderRequestWindow(true);
+    }
+}
+
+// Add requests pushed over the WebSocket to the top of the list
+function applyPushedRequests(pushedRequests, count) {
+    const container = document.getElementById('requestsContainer');
+    
+    // Skip requests already shown (e.g. replayed after a reload)
+    const shownIds = new Set(requests.map(req => req.id));
+    const fresh = pushedRequests.filter(req => !shownIds.has(req.id));
+    count -= pushedRequests.length - fresh.length;
+    pushedRequests = fresh;
+    
+    if (pushedRequests.length > 0) {
+        // Pushed requests arrive oldest first; the list shows newest first.
+        // A request that committed after a newer one goes below it.
+        pushedRequests.forEach(req => {
+            let index = 0;
+            if (typeof req.seq === 'number') {
+                while (index < requests.length && typeof requests[index].seq === 'number' && requests[index].seq > req.seq) {
+                    index++;
+                }
+            }
+            requests.splice(index, 0, req);
+        });
+        
+        pushedRequests.forEach(req => {
+            freshIds.add(req.id);
+            setTimeout(() => freshIds.delete(req.id), 3000);
+        });
+        
+        // Keep the rows being read in place when scrolled down the list
+        const scrolled = container && container.scrollTop > 0;
+        renderRequestWindow(true);
+        if (scrolled) {
+            container.scrollTop += pushedRequests.length * ROW_HEIGHT;
+        }
+    }
+    
+    adjustRequestCount(count);
+}
+
+// Render the rows in view; the spacer keeps the scrollbar sized for the whole list
+function renderRequestWindow(force = false) {
     const container = document.getElementById('requestsContainer');
     
     if (!container) return;
     
-    if (!append && (!requestsToRender || requestsToRender.length === 0)) {
+    if (requests.length === 0) {
+        renderedRange = null;
         showEmptyState(container);
         return;
     }
     
-    // If this is the first render and not appending, clear the container
-    if (!append) {
-        container.innerHTML = '';
+    let spacer = container.querySelector('.virtual-spacer');
+    if (!spacer) {
+        container.innerHTML = '<div class="virtual-spacer"><div class="virtual-window"></div></div>';
+        spacer = container.querySelector('.virtual-spacer');
+        force = true;
     }
+    spacer.style.height = `${requests.length * ROW_HEIGHT}px`;
+    
+    const start = Math.max(0, Math.floor(container.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const end = Math.min(requests.length, Math.ceil((container.scrollTop + container.clientHeight) / ROW_HEIGHT) + OVERSCAN);
     
-    requestsToRender.forEach(req => {
-        // Ensure all required fields exist
-        const method = req.method || 'UNKNOWN';
-        const path = req.path || '/';
-        const requestTime = req.request_time ? new Date(req.request_time).toLocaleString() : 'Unknown';
-        const responseTime = req.response_time || 0;
+    if (force || !renderedRange || renderedRange[0] !== start || renderedRange[1] !== end) {
+        renderedRange = [start, end];
         
-        // Create request card element
-        const cardElement = document.createElement('div');
-        cardElement.className = 'card shadow-sm mb-3 request-card';
-        cardElement.setAttribute('data-id', req.id || '');
+        const windowElement = spacer.querySelector('.virtual-window');
+        windowElement.style.transform = `translateY(${start * ROW_HEIGHT}px)`;
         
-        cardElement.innerHTML = `
-            <div class="card-header d-flex justify-content-between align-items-center">
-                <div>
-                    <span class="badge badge-${method}">${method}</span>
-                    <span class="ms-2 path-display">${formatPath(path)}</span>
-                </div>
-                <div>
-                    <span class="text-muted me-2">${requestTime}</span>
-                    <span class="badge bg-secondary">${responseTime} ms</span>
-                </div>
+        const fragment = document.createDocumentFragment();
+        requests.slice(start, end).forEach(req => {
+            fragment.appendChild(getRequestCard(req));
+        });
+        windowElement.replaceChildren(fragment);
+    }
+    
+    // Load the next page when scrolling reaches the end of the loaded rows
+    if (end >= requests.length - OVERSCAN && hasMoreRequests && !isLoading) {
+        loadRequests(true);
+    }
+}
+
+// Re-render at most once per animation frame while scrolling
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        renderRequestWindow();
+    });
+}
+
+// Get the card element for a request, reusing cards built for recent windows
+function getRequestCard(req) {
+    let cardElement = cardCache.get(req.id);
+    
+    if (cardElement) {
+        // Move to the end so the least recently shown cards are evicted first
+        cardCache.delete(req.id);
+    } else {
+        cardElement = createRequestCard(req);
+    }
+    cardCache.set(req.id, cardElement);
+    
+    if (cardCache.size > CARD_CACHE_SIZE) {
+        cardCache.delete(cardCache.keys().next().value);
+    }
+    
+    cardElement.classList.toggle('new-request', freshIds.has(req.id));
+    return cardElement;
+}
+
+// Build the card element for a single request
+function createRequestCard(req) {
+    // Ensure all required fields exist
+    const method = req.method || 'UNKNOWN';
+    const path = req.path || '/';
+    const requestTime = req.request_time ? new Date(req.request_time).toLocaleString() : 'Unknown';
+    const responseTime = req.response_time || 0;
+    
+    // Create request card element
+    const cardElement = document.createElement('div');
+    cardElement.className = 'card shadow-sm mb-3 request-card';
+    cardElement.setAttribute('data-id', req.id || '');
+    
+    cardElement.innerHTML = `
+        <div class="card-header d-flex justify-content-between align-items-center">
+            <div>
+                <span class="badge badge-${method}">${method}</span>
+                <span class="ms-2 path-display">${formatPath(path)}</span>
             </div>
-            <div class="card-body">
-                <div class="row">
-                    <div class="col-md-6 mb-3 mb-md-0">
-                        <h6 class="mb-2">Request</h6>
-                        <pre class="code-block"><code class="language-json">${formatCodeBlock(req.body)}</code></pre>
-                    </div>
-                    <div class="col-md-6">
-                        <h6 class="mb-2">Response</h6>
-                        <pre class="code-block"><code class="language-json">${formatCodeBlock(req.response)}</code></pre>
-                    </div>
+            <div>
+                <span class="text-muted me-2">${requestTime}</span>
+                <span class="badge bg-secondary">${responseTime} ms</span>
+            </div>
+        </div>
+        <div class="card-body">
+            <div class="row">
+                <div class="col-md-6 mb-3 mb-md-0">
+                    <h6 class="mb-2">Request</h6>
+                    <pre class="code-block"><code class="language-json">${formatCodeBlock(req.body)}</code></pre>
                 </div>
-                <div class="mt-3 d-flex justify-content-between">
-                    <button class="btn btn-sm btn-outline-primary view-details-btn">
-                        <i class="fas fa-search me-1"></i>View Details
-                    </button>
-                    <button class="btn btn-sm btn-outline-danger delete-request-btn" data-id="${req.id || ''}">
-                        <i class="fas fa-trash me-1"></i>Delete
-                    </button>
+                <div class="col-md-6">
+                    <h6 class="mb-2">Response</h6>
+                    <pre class="code-block"><code class="language-json">${formatCodeBlock(req.response)}</code></pre>
                 </div>
             </div>
-        `;
-        
-        container.appendChild(cardElement);
-        
-        // Apply syntax highlighting
-        const requestCode = cardElement.querySelector('.card-body code:nth-of-type(1)');
-        const responseCode = cardElement.querySelector('.card-body code:nth-of-type(2)');
-        
-        if (requestCode) safeHighlightCode(requestCode);
-        if (responseCode) safeHighlightCode(responseCode);
-        
-        // Add delete button event listener
-        const deleteBtn = cardElement.querySelector('.delete-request-btn');
-        if (deleteBtn) {
-            deleteBtn.addEventListener('click', function(event) {
-                event.stopPropagation();
-                const requestId = this.getAttribute('data-id');
-                deleteRequest(requestId);
-            });
-        }
-    });
+            <div class="mt-3 d-flex justify-content-between">
+                <button class="btn btn-sm btn-outline-primary view-details-btn">
+                    <i class="fas fa-search me-1"></i>View Details
+                </button>
+                <button class="btn btn-sm btn-outline-danger delete-request-btn" data-id="${req.id || ''}">
+                    <i class="fas fa-trash me-1"></i>Delete
+                </button>
+            </div>
+        </div>
+    `;
+    
+    // Apply syntax highlighting
+    const requestCode = cardElement.querySelector('.card-body code:nth-of-type(1)');
+    const responseCode = cardElement.querySelector('.card-body code:nth-of-type(2)');
+    
+    if (requestCode) safeHighlightCode(requestCode);
+    if (responseCode) safeHighlightCode(responseCode);
+    
+    // Add delete button event listener
+    const deleteBtn = cardElement.querySelector('.delete-request-btn');
+    if (deleteBtn) {
+        deleteBtn.addEventListener('click', function(event) {
+            event.stopPropagation();
+            const requestId = this.getAttribute('data-id');
+            deleteRequest(requestId);
+        });
+    }
+    
+    return cardElement;
+}
+
+// Set the total request count display
+function setRequestCount(count) {
+    const requestCountElem = document.getElementById('requestCount');
+    if (requestCountElem) {
+        requestCountElem.textContent = count.toLocaleString();
+    }
+}
+
+// Change the total request count display by a delta
+function adjustRequestCount(delta) {
+    const requestCountElem = document.getElementById('requestCount');
+    if (requestCountElem) {
+        const currentCount = parseInt(requestCountElem.textContent.replace(/,/g, '')) || 0;
+        setRequestCount(Math.max(0, currentCount + delta));
+    }
+}
+
+// Load the slow-request log
+function loadSlowRequests() {
+    fetch(`/api/requests/@${username}/slow?limit=${SLOW_LOG_SIZE}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            slowRequests = data.requests || [];
+            slowLoaded = true;
+            
+            const threshold = document.getElementById('slowThreshold');
+            if (threshold) threshold.textContent = data.threshold_ms;
+            renderSlowRequests();
+        })
+        .catch(error => {
+            console.error('Error loading slow requests:', error);
+            showError('Failed to load slow requests', error.message);
+        });
+}
+
+// Add a slow request announced live
+function addSlowRequest(entry) {
+    slowRequests.unshift(entry);
+    slowRequests.length = Math.min(slowRequests.length, SLOW_LOG_SIZE);
+    
+    const badge = document.getElementById('slowCountBadge');
+    if (badge) {
+        badge.textContent = (parseInt(badge.textContent) || 0) + 1;
+        badge.classList.remove('d-none');
+    }
+    
+    if (slowLoaded) {
+        renderSlowRequests();
+    }
+}
+
+// Render the slow-request table
+function renderSlowRequests() {
+    const body = document.getElementById('slowRequestsBody');
+    if (!body) return;
+    
+    if (slowRequests.length === 0) {
+        body.innerHTML = '<tr><td colspan="5" class="text-center text-muted">No slow requests recorded</td></tr>';
+        return;
+    }
+    
+    body.innerHTML = slowRequests.map(entry => `
+        <tr>
+            <td class="text-nowrap">${new Date(entry.time + 'Z').toLocaleTimeString()}</td>
+            <td><span class="badge bg-${entry.kind === 'webhook' ? 'primary' : 'secondary'}">${entry.kind}</span></td>
+            <td><span class="badge badge-${entry.method}">${entry.method}</span> ${formatPath(entry.path)}</td>
+            <td class="text-end fw-bold">${entry.total_ms.toFixed(1)} ms</td>
+            <td>${formatTimings(entry.timings)}</td>
+        </tr>
+    `).join('');
+}
+
+// Format stage durations as small labelled badges, slowest first
+function formatTimings(timings) {
+    if (!timings || Object.keys(timings).length === 0) {
+        return '<span class="text-muted">No timing data</span>';
+    }
+    
+    return Object.entries(timings)
+        .sort((a, b) => b[1] - a[1])
+        .map(([stage, ms]) => `<span class="badge bg-light text-dark border me-1">${stage} ${ms.toFixed(1)} ms</span>`)
+        .join('');
 }
 
 // Delete a single request
@@ -380,32 +792,11 @@ function deleteRequest(requestId) {
             })
             .then(response => response.json())
             .then(data => {
-                // Remove from UI
-                const requestCard = document.querySelector(`.request-card[data-id="${requestId}"]`);
-                if (requestCard) {
-                    requestCard.remove();
-                }
-                
-                // Remove from requests array
-                requests = requests.filter(req => req.id !== requestId);
-                
-                // Update count
-                const requestCountElem = document.getElementById('requestCount');
-                if (requestCountElem) {
-                    const currentCount = parseInt(requestCountElem.textContent.replace(/,/g, ''));
-                    requestCountElem.textContent = (currentCount - 1).toLocaleString();
-                }
+                // Remove from the list and update the count
+                removeRequests([requestId]);
                 
                 // Show toast
                 showToast('Request deleted successfully');
-                
-                // Check if we need to show empty state
-                if (requests.length === 0) {
-                    const container = document.getElementById('requestsContainer');
-                    if (container) {
-                        showEmptyState(container);
-                    }
-                }
             })
             .catch(error => {
                 console.error('Error deleting request:', error);
@@ -526,6 +917,21 @@ function setupEventHandlers() {
         });
     }
     
+    // Load the slow-request log when its tab is first opened
+    const slowTab = document.getElementById('slow-tab');
+    if (slowTab) {
+        slowTab.addEventListener('shown.bs.tab', function() {
+            const badge = document.getElementById('slowCountBadge');
+            if (badge) {
+                badge.textContent = '0';
+                badge.classList.add('d-none');
+            }
+            if (!slowLoaded) {
+                loadSlowRequests();
+            }
+        });
+    }
+    
     // View request details
     document.addEventListener('click', function(event) {
         if (event.target.classList.contains('view-details-btn') || 
@@ -538,6 +944,13 @@ function setupEventHandlers() {
         }
     });
     
+    // Render the rows that scroll into view
+    const requestsContainer = document.getElementById('requestsContainer');
+    if (requestsContainer) {
+        requestsContainer.addEventListener('scroll', scheduleRender);
+        window.addEventListener('resize', scheduleRender);
+    }
+    
     // Load more requests
     const loadMoreBtn = document.getElementById('loadMoreBtn');
     if (loadMoreBtn) {
@@ -757,6 +1170,7 @@ function showRequestDetails(requestId) {
                         <p><strong>Request ID:</strong> ${request.id || 'N/A'}</p>
                         <p><strong>Time:</strong> ${requestTime}</p>
                         <p><strong>Response Time:</strong> ${request.response_time || 0} ms</p>
+                        <p><strong>Server Timings:</strong><br>${formatTimings(request.timings)}</p>
                     </div>
                     <div class="col-md-6">
                         <p><strong>Query Parameters:</strong></p>
@@ -0,0 +1,163 @@
+"""
+Measure what logging costs the webhook ingest path
+
+    python -m benchmarks.logging_overhead [requests] [rounds]
+
+Sends webhook requests straight to the ASGI app (in-memory storage, no
+network, no simulated delay) and reports the time per request under several
+logging setups:
+
+    off          INFO records disabled (reference)
+    sync-text    logging.basicConfig-style handler writing on the event loop (before)
+    queue-text   queue handler, formatted and written by a background thread
+    queue-json   same, with JSON output
+    queue-1%     queue handler keeping 1% of the per-request INFO lines
+
+Output goes to a temporary file so the terminal does not skew the results,
+then to the same file behind 200µs writes, as when stdout is a pipe the log
+collector drains slowly.
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import logging
+import tempfile
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["SKIP_INDEX_CREATION"] = "1"
+os.environ.setdefault("SLOW_REQUEST_MS", "0")
+
+from app.main import app, lifespan
+from app.services.logs import configure_logging, shutdown_logging
+from app.services.webhook import create_user
+
+INGEST_LOGGERS = "app.routers.webhook=0.01,app.services.webhook=0.01"
+
+async def call(method: str, path: str, body: bytes = b"") -> int:
+    """
+    Send one request through the ASGI app and return the status code
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+        "app": app
+    }
+    received = False
+    status = 0
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+async def run(requests: int) -> float:
+    body = json.dumps({"event": "bench", "value": 1}).encode()
+    # Warm up
+    for _ in range(200):
+        await call("POST", "/api/@bench/hook", body)
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call("POST", "/api/@bench/hook", body)
+    return (time.perf_counter() - started) / requests
+
+class SlowStream:
+    """
+    File wrapper taking `delay` seconds per write, like stdout to a busy log collector
+    """
+
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+# Defaults of the record attributes configure_logging() switches off
+LOGGING_DEFAULTS = {
+    "_srcfile": logging._srcfile,
+    "logThreads": logging.logThreads,
+    "logProcesses": logging.logProcesses,
+    "logMultiprocessing": logging.logMultiprocessing
+}
+
+def use_sync_handler(stream) -> None:
+    # What logging.basicConfig(level=logging.INFO) did before: write on the calling thread
+    shutdown_logging()
+    for name, value in LOGGING_DEFAULTS.items():
+        setattr(logging, name, value)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+async def main(requests: int, rounds: int = 3) -> None:
+    setups = [
+        ("off", lambda stream: configure_logging(level="WARNING", stream=stream, sampling="", force=True)),
+        ("sync-text", use_sync_handler),
+        ("queue-text", lambda stream: configure_logging(level="INFO", fmt="text", stream=stream, sampling="", force=True)),
+        ("queue-json", lambda stream: configure_logging(level="INFO", fmt="json", stream=stream, sampling="", force=True)),
+        ("queue-1%", lambda stream: configure_logging(level="INFO", fmt="json", stream=stream, sampling=INGEST_LOGGERS, force=True)),
+    ]
+
+    async with lifespan(app):
+        await create_user(app.storage, "bench", {"status": "ok"}, 0, 0)
+
+        # Best of several interleaved rounds, to even out warm-up and noise
+        results = {}
+        with tempfile.TemporaryFile("w") as output:
+            for label, stream in (("file", output), ("slow", SlowStream(output, 0.0002))):
+                best = {name: float("inf") for name, _ in setups}
+                for _ in range(rounds):
+                    for name, setup in setups:
+                        setup(stream)
+                        best[name] = min(best[name], await run(requests))
+                results[label] = best
+
+        # Leave the background writer configured as the application expects
+        configure_logging(force=True)
+
+    for label, best in results.items():
+        baseline = best["off"]
+        print(f"\noutput: {label}")
+        print(f"{'setup':<12} {'us/request':>12} {'req/s':>10} {'logging us':>12}")
+        for name, per_request in best.items():
+            print(
+                f"{name:<12} {per_request * 1e6:>12.1f} {1 / per_request:>10.0f} "
+                f"{(per_request - baseline) * 1e6:>12.1f}"
+            )
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    ))
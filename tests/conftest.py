@@ -0,0 +1,52 @@
+"""
+Shared fixtures: every storage test runs against each engine
+
+The Mongo engine uses a real server when MONGO_TEST_URI is set, otherwise
+mongomock-motor (requirements-dev.txt); without either it is skipped.
+"""
+import os
+import uuid
+
+import pytest
+
+from app.services.storage import MemoryStorage, MongoStorage, SQLiteStorage
+
+ENGINES = ["memory", "sqlite", "mongo"]
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+def _mongo_client():
+    uri = os.getenv("MONGO_TEST_URI")
+    if uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        return AsyncIOMotorClient(uri, serverSelectionTimeoutMS=5000)
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        pytest.skip("Set MONGO_TEST_URI or install mongomock-motor to test the Mongo engine")
+    return AsyncMongoMockClient()
+
+@pytest.fixture(params=ENGINES)
+async def storage(request, tmp_path):
+    """
+    An empty storage of each engine, with its indexes created
+    """
+    client = None
+    if request.param == "memory":
+        db = MemoryStorage(max_requests_per_user=3)
+    elif request.param == "sqlite":
+        db = SQLiteStorage(str(tmp_path / "webhooks.db"))
+    else:
+        client = _mongo_client()
+        name = f"webhook_test_{uuid.uuid4().hex[:8]}"
+        db = MongoStorage(client[name])
+
+    await db.ensure_indexes()
+    yield db
+    await db.close()
+
+    if client is not None:
+        await client.drop_database(name)
+        client.close()
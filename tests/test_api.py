@@ -0,0 +1,228 @@
+"""
+End-to-end checks of the capture, viewer API and export paths on the in-process engines
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import upstream
+from app.services.admission import admission
+
+ADMIN = ("admin", "admin")
+
+@pytest.fixture(params=["memory", "sqlite"])
+def client(request, tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", request.param)
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "webhooks.db"))
+    monkeypatch.setenv("MEMORY_MAX_REQUESTS_PER_USER", "5")
+    monkeypatch.setenv("ADMIN_PASSWORD", ADMIN[1])
+    monkeypatch.setenv("LOOP_MONITOR_INTERVAL_MS", "0")
+    with TestClient(app) as test_client:
+        response = test_client.post("/api/users", json={"username": "alice", "response_time_max": 0})
+        assert response.status_code == 200
+        yield test_client
+
+def capture(client, count):
+    for n in range(count):
+        assert client.post(f"/api/@alice/orders/{n}", json={"n": n}).status_code == 200
+
+def wait_for_replay(client, job):
+    for _ in range(100):
+        job = client.get(f"/admin/replay/{job['id']}", auth=ADMIN).json()
+        if job["state"] != "running":
+            return job
+        time.sleep(0.05)
+    return job
+
+def test_capture_and_list(client):
+    capture(client, 3)
+
+    rows = client.get("/api/requests/@alice?limit=10").json()
+    assert [row["path"] for row in rows] == ["/api/@alice/orders/2", "/api/@alice/orders/1", "/api/@alice/orders/0"]
+    assert [row["body"] for row in rows] == [{"n": 2}, {"n": 1}, {"n": 0}]
+    assert client.get("/api/requests/@alice/count").json() == {"count": 3}
+
+    changes = client.get("/api/requests/@alice/changes?since=1").json()
+    assert [row["seq"] for row in changes["requests"]] == [2, 3]
+    assert changes["cursor"] == 3
+    assert changes["count"] == 3
+
+def test_export(client):
+    capture(client, 2)
+
+    csv_export = client.get("/api/requests/@alice/export?format=csv")
+    assert csv_export.status_code == 200
+    assert csv_export.text.count("/api/@alice/orders/") == 2
+
+    json_export = client.get("/api/requests/@alice/export?format=json")
+    assert json_export.status_code == 200
+    assert [row["body"] for row in json_export.json()] == [{"n": 1}, {"n": 0}]
+
+def test_import_applies_retention(client):
+    lines = "\n".join(
+        json.dumps({"path": f"/orders/{n}", "request_time": f"2024-05-01T12:00:{n:02d}Z"}) for n in range(8)
+    )
+    report = client.post("/api/requests/@alice/import", content=lines, auth=ADMIN).json()
+
+    # The memory engine holds 5 requests per user here; the others keep all 8
+    kept = 5 if app.storage.max_requests_per_user else 8
+    assert report["imported"] == 8
+    assert report["trimmed"] == 8 - kept
+    assert client.get("/api/requests/@alice/count").json() == {"count": kept}
+
+    newest = client.get("/api/requests/@alice?limit=1").json()[0]
+    assert newest["path"] == "/api/@alice/orders/7"
+
+def test_import_rejects_negative_max_requests(client):
+    capture(client, 2)
+    line = json.dumps({"path": "/orders/9", "request_time": "2024-05-01T12:00:00Z"})
+    response = client.post("/api/requests/@alice/import?max_requests=-1", content=line, auth=ADMIN)
+
+    assert response.status_code == 400
+    assert response.json() == {"error": "max_requests cannot be negative"}
+    # Nothing was imported or trimmed
+    assert client.get("/api/requests/@alice/count").json() == {"count": 2}
+
+def test_vary_on_compressible_responses(client):
+    capture(client, 1)
+
+    # Small (sent as is), uncompressed on request, and compressed responses all vary
+    small = client.get("/api/requests/@alice/count")
+    identity = client.get("/api/requests/@alice?limit=10", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/api/requests/@alice/export?format=json", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in identity.headers
+    assert compressed.headers["content-encoding"] == "gzip"
+    for response in (small, identity, compressed):
+        assert response.headers["vary"] == "Accept-Encoding"
+
+def test_page_fragments_are_not_keyed_by_host(client):
+    cache = app.state.templates.env.fragment_cache
+    cache.clear()
+
+    for host in ("one.example", "two.example"):
+        dashboard = client.get("/", headers={"Host": host})
+        tester = client.get("/webhook/@alice", headers={"Host": host})
+        assert f"https://{host}/api/@" in dashboard.text
+        assert f"https://{host}/api/@alice" in tester.text
+
+    # Each fragment is rendered once, whatever the Host header
+    assert len(cache) == 4
+    assert not any(host in str(key) for key in cache for host in ("one.example", "two.example"))
+
+def test_replay_records_failures_per_request(client):
+    capture(client, 3)
+    # A header value httpx cannot encode must fail that request only
+    assert client.post("/api/@alice/orders/9", headers={"X-Note": "café".encode("utf-8")}).status_code == 200
+    ids = [row["id"] for row in client.get("/api/requests/@alice?limit=10").json()]
+
+    started = client.post("/admin/replay/@alice", json={"target_url": "http://127.0.0.1:9", "request_ids": ids[:2]}, auth=ADMIN)
+    assert started.status_code == 202
+    job = started.json()
+    assert job["total"] == 2
+
+    job = wait_for_replay(client, job)
+    assert job["state"] == "completed"
+    assert job["outcomes"] == {"error": 2}
+
+    errors = [row["replays"][0]["error"] for row in client.get("/api/requests/@alice?limit=2").json()]
+    assert errors[0].startswith("UnicodeEncodeError")
+    assert errors[1].startswith("ConnectError")
+
+def test_replay_results_change_the_etag(client):
+    capture(client, 1)
+    listed = client.get("/api/requests/@alice?limit=10")
+    etag = listed.headers["etag"]
+    assert client.get("/api/requests/@alice?limit=10", headers={"If-None-Match": etag}).status_code == 304
+
+    started = client.post("/admin/replay/@alice", json={"target_url": "http://127.0.0.1:9"}, auth=ADMIN)
+    assert wait_for_replay(client, started.json())["state"] == "completed"
+
+    # The "replayed" event reaches the change versions through the broker
+    for _ in range(50):
+        polled = client.get("/api/requests/@alice?limit=10", headers={"If-None-Match": etag})
+        if polled.status_code != 304:
+            break
+        time.sleep(0.02)
+    assert polled.status_code == 200
+    assert polled.headers["etag"] != etag
+    assert len(polled.json()[0]["replays"]) == 1
+
+def test_replay_time_range(client):
+    capture(client, 5)
+    rows = client.get("/api/requests/@alice?limit=10").json()
+
+    started = client.post("/admin/replay/@alice", auth=ADMIN, json={
+        "target_url": "http://127.0.0.1:9", "since": rows[3]["request_time"], "limit": 2, "record": False
+    })
+    # The newest two of the four captures from `since` on
+    assert started.json()["total"] == 2
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.dumps({"path": self.path, "host": self.headers["host"]}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def echo_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+@pytest.mark.parametrize("upstream_url", [
+    "http://127.0.0.1:27017", "http://localhost:8000", "http://169.254.169.254/latest/meta-data", "http://[::1]:80"
+])
+def test_internal_upstreams_are_refused(client, upstream_url):
+    created = client.post("/api/users", json={"username": "bob", "upstream_url": upstream_url})
+    assert created.status_code == 400
+    assert "private or internal address" in created.json()["error"]
+
+    updated = client.put("/api/users/alice", json={"upstream_url": upstream_url})
+    assert updated.status_code == 400
+
+def test_allowed_upstream_is_proxied(client, echo_server, monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_ALLOWED_HOSTS", ("127.0.0.0/8",))
+    assert client.put("/api/users/alice", json={"upstream_url": echo_server}).status_code == 200
+
+    response = client.post("/api/@alice/orders/1", json={"n": 1})
+    assert response.status_code == 201
+    assert response.json() == {"path": "/orders/1", "host": echo_server.split("//")[1]}
+
+    # Saved while allowed, refused on the next forward once it no longer is
+    monkeypatch.setattr(upstream, "UPSTREAM_ALLOWED_HOSTS", ())
+    upstream.upstream_client._addresses.clear()
+    response = client.post("/api/@alice/orders/2", json={"n": 2})
+    assert response.status_code == 200
+    assert "private or internal address" in response.headers["x-upstream-error"]
+
+@pytest.mark.parametrize("behavior", [{"statuses": [200, 204]}, {"statuses": [101]}, {"error_every": 2, "error_status": 304}])
+def test_bodyless_scripted_statuses_are_refused(client, behavior):
+    response = client.put("/api/users/alice", json={"behaviors": [behavior]})
+    assert response.status_code == 400
+    assert "except 204 and 304" in response.json()["error"]
+
+def test_stalled_response_keeps_its_admission_slot(client):
+    assert client.put("/api/users/alice", json={"behaviors": [{"stall_ms": 500}]}).status_code == 200
+
+    sender = threading.Thread(target=lambda: client.post("/api/@alice/slow", json={}))
+    sender.start()
+    time.sleep(0.25)
+    # Handler done, body still stalled
+    assert admission.in_flight == 1
+    sender.join()
+    assert admission.in_flight == 0
@@ -0,0 +1,258 @@
+"""
+Conformance suite for the storage engines (see Storage in app/services/storage/base.py)
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+
+def make_request(seq, username="alice", request_time=None, request_id=None, method="POST", path="/orders"):
+    return {
+        "id": request_id or str(uuid.uuid4()),
+        "seq": seq,
+        "username": username,
+        "method": method,
+        "headers": {"content-type": "application/json"},
+        "path": f"/api/@{username}{path}",
+        "query_params": {},
+        "body": {"n": seq},
+        "response": {"status": "success"},
+        "request_time": request_time or T0 + timedelta(seconds=seq),
+        "response_time": 10
+    }
+
+def seqs(requests):
+    return [req["seq"] for req in requests]
+
+async def add_user(storage, username="alice", **fields):
+    await storage.insert_user({"username": username, "created_at": T0, "request_seq": 0, **fields})
+
+# Users
+
+async def test_users(storage):
+    await add_user(storage, "bob", default_response={"ok": True})
+    await add_user(storage, "alice")
+
+    user = await storage.get_user("bob")
+    assert user["default_response"] == {"ok": True}
+    assert user["created_at"] == T0
+    assert await storage.get_user("nobody") is None
+
+    updated = await storage.update_user("bob", {"response_time_max": 50})
+    assert updated["response_time_max"] == 50
+    assert updated["default_response"] == {"ok": True}
+    assert await storage.update_user("nobody", {"response_time_max": 50}) is None
+
+    assert await storage.list_usernames(None, 10) == ["alice", "bob"]
+    assert await storage.list_usernames("alice", 10) == ["bob"]
+    assert await storage.list_usernames(None, 1) == ["alice"]
+
+async def test_duplicate_user(storage):
+    await add_user(storage)
+    with pytest.raises(Exception):
+        await add_user(storage)
+
+async def test_allocate_seq(storage):
+    await add_user(storage)
+    assert await storage.allocate_seq("alice") == 1
+    assert await storage.allocate_seq("alice") == 2
+    assert await storage.allocate_seq_block("alice", 10) == 12
+    assert await storage.allocate_seq("nobody") is None
+    assert await storage.allocate_seq_block("nobody", 10) is None
+
+    await add_user(storage, "bob")
+    await storage.allocate_seq("bob")
+    busiest = await storage.busiest_users(1)
+    assert [user["username"] for user in busiest] == ["alice"]
+    assert busiest[0]["request_seq"] == 12
+
+# Requests
+
+async def test_insert_and_list(storage):
+    for seq in range(1, 6):
+        await storage.insert_request(make_request(seq))
+    await storage.insert_request(make_request(1, username="bob"))
+
+    assert await storage.count_requests("alice") == 5
+    assert seqs(await storage.list_requests("alice", 10)) == [5, 4, 3, 2, 1]
+    assert seqs(await storage.list_requests("alice", 2, skip=1)) == [4, 3]
+    assert (await storage.latest_request("alice"))["seq"] == 5
+    assert await storage.latest_request("nobody") is None
+
+    # Documents come back as stored, datetimes included
+    stored = (await storage.list_requests("alice", 1))[0]
+    assert stored["request_time"] == T0 + timedelta(seconds=5)
+    assert stored["body"] == {"n": 5}
+    assert "_id" not in stored
+
+async def test_engine_keeps_every_request(storage):
+    # Retention is up to the callers: nothing is evicted on insert
+    for seq in range(1, 11):
+        await storage.insert_request(make_request(seq))
+    errors = await storage.insert_requests([make_request(seq) for seq in range(11, 21)])
+
+    assert errors == []
+    assert await storage.count_requests("alice") == 20
+
+async def test_order_is_request_time_then_seq(storage):
+    # Imported history arrives after newer captures; ties are broken by seq
+    await storage.insert_request(make_request(10, request_time=T0 + timedelta(hours=1)))
+    await storage.insert_requests([
+        make_request(11, request_time=T0),
+        make_request(13, request_time=T0 + timedelta(minutes=5)),
+        make_request(12, request_time=T0 + timedelta(minutes=5))
+    ])
+
+    assert seqs(await storage.list_requests("alice", 10)) == [10, 13, 12, 11]
+    assert (await storage.latest_request("alice"))["seq"] == 10
+
+    assert await storage.delete_oldest_request("alice")
+    assert seqs(await storage.list_requests("alice", 10)) == [10, 13, 12]
+    assert not await storage.delete_oldest_request("nobody")
+
+async def test_requests_since_is_in_sequence_order(storage):
+    # Captures can commit out of sequence order
+    for seq in (1, 2, 4, 5, 3):
+        await storage.insert_request(make_request(seq, request_time=T0))
+
+    assert seqs(await storage.requests_since("alice", 2, 10)) == [3, 4, 5]
+    assert seqs(await storage.requests_since("alice", 0, 2)) == [1, 2]
+    assert await storage.requests_since("alice", 5, 10) == []
+    assert await storage.oldest_seq("alice") == 1
+    assert await storage.oldest_seq("nobody") is None
+
+async def test_requests_before(storage):
+    # Two captures share a timestamp, one imported request has no seq
+    await storage.insert_requests([
+        make_request(1),
+        make_request(2),
+        make_request(3, request_time=T0 + timedelta(seconds=10)),
+        make_request(4, request_time=T0 + timedelta(seconds=10)),
+        dict(make_request(None, request_time=T0 + timedelta(seconds=10)), seq=None),
+        make_request(5, request_time=T0 + timedelta(seconds=20))
+    ])
+
+    # Page through everything, two at a time
+    pages, before = [], None
+    while True:
+        page = await storage.requests_before("alice", before, None, 2)
+        if not page:
+            break
+        pages.append(seqs(page))
+        before = (page[-1]["request_time"], page[-1].get("seq"))
+    assert pages == [[5, 4], [3, None], [2, 1]]
+
+    # (t, None) starts before everything received at t; since is inclusive
+    assert seqs(await storage.requests_before("alice", (T0 + timedelta(seconds=10), None), None, 10)) == [2, 1]
+    assert seqs(await storage.requests_before("alice", None, T0 + timedelta(seconds=2), 10)) == [5, 4, 3, None, 2]
+    assert await storage.requests_before("nobody", None, None, 10) == []
+
+async def test_get_requests(storage):
+    await storage.insert_request(make_request(1, request_id="a"))
+    await storage.insert_request(make_request(2, request_id="b"))
+    await storage.insert_request(make_request(1, username="bob", request_id="c"))
+
+    found = await storage.get_requests("alice", ["b", "missing", "a", "c", "b"])
+    assert sorted(req["id"] for req in found) == ["a", "b"]
+    assert await storage.get_requests("alice", []) == []
+
+async def test_trim_requests(storage):
+    for seq in range(1, 9):
+        await storage.insert_request(make_request(seq))
+
+    assert await storage.trim_requests("alice", 5) == 3
+    assert seqs(await storage.list_requests("alice", 10)) == [8, 7, 6, 5, 4]
+    assert await storage.trim_requests("alice", 5) == 0
+    assert await storage.trim_requests("nobody", 5) == 0
+
+async def test_trim_requests_with_equal_timestamps(storage):
+    await storage.insert_requests([make_request(seq, request_time=T0) for seq in range(1, 7)])
+
+    assert await storage.trim_requests("alice", 4) == 2
+    assert await storage.count_requests("alice") == 4
+    assert seqs(await storage.list_requests("alice", 10)) == [6, 5, 4, 3]
+
+async def test_duplicate_ids(storage):
+    await storage.insert_request(make_request(1, request_id="a"))
+    with pytest.raises(Exception):
+        await storage.insert_request(make_request(2, request_id="a"))
+
+    # Ids are unique across users too
+    errors = await storage.insert_requests([
+        make_request(3, request_id="b"),
+        make_request(4, request_id="a"),
+        make_request(5, request_id="b"),
+        make_request(6, username="bob", request_id="a"),
+        make_request(7, request_id="c")
+    ])
+
+    assert errors == [(1, "Duplicate id 'a'"), (2, "Duplicate id 'b'"), (3, "Duplicate id 'a'")]
+    assert seqs(await storage.list_requests("alice", 10)) == [7, 3, 1]
+    assert await storage.count_requests("bob") == 0
+
+async def test_deleted_id_can_be_reused(storage):
+    await storage.insert_request(make_request(1, request_id="a"))
+    await storage.insert_request(make_request(2, request_id="b"))
+
+    assert await storage.delete_request("alice", "a")
+    assert not await storage.delete_request("alice", "a")
+    assert not await storage.delete_request("bob", "b")
+    assert await storage.clear_requests("alice") == 1
+    assert await storage.clear_requests("alice") == 0
+
+    assert await storage.insert_requests([make_request(3, request_id="a"), make_request(4, request_id="b")]) == []
+    assert await storage.count_requests("alice") == 2
+
+async def test_search_requests(storage):
+    await storage.insert_request(make_request(1, method="GET", path="/health"))
+    await storage.insert_request(make_request(2, method="POST", path="/Orders/1"))
+    await storage.insert_request(make_request(3, method="POST", path="/orders/2", request_id="order-id"))
+
+    assert seqs(await storage.search_requests("alice", "orders", 10)) == [3, 2]
+    assert seqs(await storage.search_requests("alice", "^get$", 10)) == [1]
+    assert seqs(await storage.search_requests("alice", "^order-id$", 10)) == [3]
+    assert seqs(await storage.search_requests("alice", "post", 1)) == [3]
+
+async def test_append_replay(storage):
+    await storage.insert_request(make_request(1, request_id="a"))
+
+    for status in (200, 500, 502):
+        assert await storage.append_replay("alice", "a", {"status_code": status}, keep=2)
+    assert not await storage.append_replay("alice", "missing", {"status_code": 200}, keep=2)
+
+    stored = (await storage.list_requests("alice", 1))[0]
+    assert stored["replays"] == [{"status_code": 500}, {"status_code": 502}]
+
+async def test_request_stats(storage):
+    empty = await storage.request_stats("alice")
+    assert empty == {"count": 0, "method_counts": {}, "average_response_time": None, "latest_request_time": None}
+
+    await storage.insert_request(make_request(1, method="GET"))
+    await storage.insert_request(dict(make_request(2), response_time=30))
+    await storage.insert_request(dict(make_request(3), response_time=50))
+
+    stats = await storage.request_stats("alice")
+    assert stats["count"] == 3
+    assert stats["method_counts"] == {"POST": 2, "GET": 1}
+    assert stats["average_response_time"] == 30
+    assert stats["latest_request_time"] == T0 + timedelta(seconds=3)
+
+# Deletion tombstones
+
+async def test_deletions(storage):
+    deleted_at = T0 + timedelta(minutes=1)
+    await storage.insert_deletion("alice", "a", 4, deleted_at)
+    await storage.insert_deletion("alice", "b", 6, deleted_at)
+    await storage.insert_deletion("bob", "c", 5, deleted_at)
+
+    deletions = await storage.deletions_since("alice", 4, 10)
+    assert [(d["request_id"], d["seq"], d["deleted_at"]) for d in deletions] == [("b", 6, deleted_at)]
+    assert [d["request_id"] for d in await storage.deletions_since("alice", 0, 1)] == ["a"]
+
+    await storage.clear_deletions("alice")
+    assert await storage.deletions_since("alice", 0, 10) == []
+    assert len(await storage.deletions_since("bob", 0, 10)) == 1